@@ -0,0 +1,35 @@
+import os
+
+# Load the LLM stack (crewai, litellm, tools) in a background thread after startup
+# instead of on the first generation request.
+LISTINGCREW_WARMUP = os.environ.get("LISTINGCREW_WARMUP", "0").lower() in ("1", "true", "yes")
+
+# Seconds between SSE keep-alive comments on /generate_text/stream, so proxies don't drop idle connections
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", 15))
+
+# Largest catalog accepted by POST /generate_batch in one request
+BATCH_MAX_URLS = int(os.environ.get("BATCH_MAX_URLS", 1000))
+
+# Generations run on their own thread pool, never on the one serving /login, /history and /profile.
+# At most GENERATION_MAX_CONCURRENT run at once (GENERATION_MAX_PER_USER per user); further requests
+# are turned away immediately with 503 (server busy) or 429 (user busy) instead of queueing.
+GENERATION_MAX_CONCURRENT = int(os.environ.get("GENERATION_MAX_CONCURRENT", 4))
+GENERATION_MAX_PER_USER = int(os.environ.get("GENERATION_MAX_PER_USER", 2))
+# Seconds a generation may run before it is stopped and answered with 504
+GENERATION_TIMEOUT_SECONDS = float(os.environ.get("GENERATION_TIMEOUT_SECONDS", 600))
+# Retry-After sent with 429/503, and how often a waiting request checks that its client is still there
+GENERATION_RETRY_AFTER_SECONDS = int(os.environ.get("GENERATION_RETRY_AFTER_SECONDS", 30))
+GENERATION_DISCONNECT_POLL_SECONDS = float(os.environ.get("GENERATION_DISCONNECT_POLL_SECONDS", 1.0))
+
+# Durable job queue (POST /jobs, python -m app.worker): a worker's lease on a job lasts
+# JOB_LEASE_SECONDS and is renewed while it runs; a job whose worker died becomes claimable when
+# the lease expires. Failed jobs are retried after JOB_RETRY_BACKOFF_SECONDS (doubling each time)
+# until JOB_MAX_ATTEMPTS, then dead-lettered.
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", 120))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get("JOB_RETRY_BACKOFF_SECONDS", 30))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", 2))
+
+# GET /history page size when no limit is given, and the largest limit accepted
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 50))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", 500))
@@ -1,6 +1,6 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from app.database.models import Base
+from app.database.models import Base, GenerationHistory
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 
@@ -9,3 +9,6 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all only indexes tables it creates; add indexes introduced since to existing databases
+    for index in GenerationHistory.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
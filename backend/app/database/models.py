@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -17,6 +17,8 @@ class User(Base):
 
 class GenerationHistory(Base):
     __tablename__ = "generation_history"
+    # Serves GET /history: one user's rows, newest first, paged by (date, id)
+    __table_args__ = (Index("ix_generation_history_user_date_id", "user_id", "date", "id"),)
 
     id = Column(Integer, primary_key=True, index=True)
     url = Column(String, index=True, nullable=False)
@@ -26,3 +28,24 @@ class GenerationHistory(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     owner = relationship("User", back_populates="history_items")
+
+class GenerationJob(Base):
+    # A queued generation; workers lease it, and an expired lease makes it claimable again
+    __tablename__ = "generation_jobs"
+    __table_args__ = (Index("ix_generation_jobs_claim", "status", "available_at"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    url = Column(String, nullable=False)
+    force_refresh = Column(Boolean, default=False, nullable=False)
+    # queued, running, completed or dead (failed on every attempt)
+    status = Column(String, default="queued", nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, nullable=False)
+    available_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    lease_owner = Column(String)
+    lease_expires_at = Column(DateTime)
+    result = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
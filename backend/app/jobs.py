@@ -0,0 +1,150 @@
+import json
+import datetime
+import logging
+from typing import Any, Dict, Optional
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import Session
+from app.database.models import GenerationHistory, GenerationJob, User
+from app.config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF_SECONDS
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+DEAD = "dead"
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def enqueue(db: Session, user: User, url: str, force_refresh: bool = False,
+            max_attempts: int = JOB_MAX_ATTEMPTS) -> GenerationJob:
+    """Persist a generation job; it is claimable by a worker as soon as this returns."""
+    job = GenerationJob(user_id=user.id, url=url, force_refresh=force_refresh, status=QUEUED,
+                        attempts=0, max_attempts=max_attempts, available_at=_now())
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _claimable(now: datetime.datetime):
+    # Queued and due, or running under a lease its worker let expire (crashed or hung)
+    return or_(
+        and_(GenerationJob.status == QUEUED, GenerationJob.available_at <= now),
+        and_(GenerationJob.status == RUNNING, GenerationJob.lease_expires_at < now),
+    )
+
+
+def dead_letter_expired(db: Session) -> int:
+    """Dead-letter running jobs whose lease expired on their last allowed attempt."""
+    now = _now()
+    count = db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.status == RUNNING, GenerationJob.lease_expires_at < now,
+               GenerationJob.attempts >= GenerationJob.max_attempts)
+        .values(status=DEAD, lease_owner=None, error="Lease expired on the last attempt.", updated_at=now)
+    ).rowcount
+    db.commit()
+    return count
+
+
+def claim(db: Session, worker: str, lease_seconds: float = JOB_LEASE_SECONDS) -> Optional[GenerationJob]:
+    """
+    Lease the oldest claimable job for `worker`, or return None when there is none.
+    The lease is taken with a conditional UPDATE, so any number of worker processes can
+    claim from the same database and each job goes to exactly one of them.
+    """
+    dead_letter_expired(db)
+    while True:
+        now = _now()
+        candidate = db.query(GenerationJob.id).filter(_claimable(now)).order_by(GenerationJob.id).first()
+        if candidate is None:
+            return None
+        claimed = db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == candidate.id, _claimable(now))
+            .values(status=RUNNING, lease_owner=worker, attempts=GenerationJob.attempts + 1,
+                    lease_expires_at=now + datetime.timedelta(seconds=lease_seconds), updated_at=now)
+        ).rowcount
+        db.commit()
+        if claimed:
+            return db.get(GenerationJob, candidate.id, populate_existing=True)
+        # Another worker took it between the select and the update; try the next one
+
+
+def _owned(job_id: int, worker: str):
+    return and_(GenerationJob.id == job_id, GenerationJob.status == RUNNING, GenerationJob.lease_owner == worker)
+
+
+def renew(db: Session, job_id: int, worker: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    """Extend a lease; False means the worker lost the job and should stop working on it."""
+    now = _now()
+    renewed = db.execute(
+        update(GenerationJob).where(_owned(job_id, worker))
+        .values(lease_expires_at=now + datetime.timedelta(seconds=lease_seconds), updated_at=now)
+    ).rowcount
+    db.commit()
+    return bool(renewed)
+
+
+def complete(db: Session, job_id: int, worker: str, result: Dict[str, Any], title: str) -> bool:
+    """Store a job's result and add it to its owner's history, if the worker still holds the lease."""
+    job = db.get(GenerationJob, job_id, populate_existing=True)
+    now = _now()
+    completed = db.execute(
+        update(GenerationJob).where(_owned(job_id, worker))
+        .values(status=COMPLETED, result=json.dumps(result), error=None, lease_owner=None,
+                lease_expires_at=None, updated_at=now)
+    ).rowcount
+    if completed:
+        db.add(GenerationHistory(user_id=job.user_id, url=job.url, title=title, status="completed"))
+    db.commit()
+    return bool(completed)
+
+
+def fail(db: Session, job_id: int, worker: str, error: str,
+         backoff_seconds: float = JOB_RETRY_BACKOFF_SECONDS) -> Optional[str]:
+    """
+    Record a failed attempt: the job is queued again after an exponential backoff, or
+    dead-lettered once it has used all its attempts. Returns the job's new status.
+    """
+    job = db.get(GenerationJob, job_id, populate_existing=True)
+    if job is None or job.status != RUNNING or job.lease_owner != worker:
+        return None
+    now = _now()
+    if job.attempts >= job.max_attempts:
+        values: Dict[str, Any] = dict(status=DEAD)
+        logging.error(f"Job {job_id} dead-lettered after {job.attempts} attempts: {error}")
+    else:
+        delay = backoff_seconds * (2 ** (job.attempts - 1))
+        values = dict(status=QUEUED, available_at=now + datetime.timedelta(seconds=delay))
+        logging.warning(f"Job {job_id} failed attempt {job.attempts}/{job.max_attempts}; retrying in {delay:.0f}s: {error}")
+    db.execute(
+        update(GenerationJob).where(_owned(job_id, worker))
+        .values(error=error, lease_owner=None, lease_expires_at=None, updated_at=now, **values)
+    )
+    db.commit()
+    return values["status"]
+
+
+def release(db: Session, job_id: int, worker: str) -> bool:
+    """Hand a job back untried (e.g. the worker is shutting down); the attempt is not counted."""
+    now = _now()
+    released = db.execute(
+        update(GenerationJob).where(_owned(job_id, worker))
+        .values(status=QUEUED, attempts=GenerationJob.attempts - 1, available_at=now, lease_owner=None,
+                lease_expires_at=None, updated_at=now)
+    ).rowcount
+    db.commit()
+    return bool(released)
+
+
+def get_job(db: Session, job_id: int, user: User) -> Optional[GenerationJob]:
+    return db.query(GenerationJob).filter(GenerationJob.id == job_id, GenerationJob.user_id == user.id).first()
+
+
+def stats(db: Session) -> Dict[str, int]:
+    """Number of jobs in each status."""
+    rows = db.query(GenerationJob.status, func.count(GenerationJob.id)).group_by(GenerationJob.status).all()
+    return {status: count for status, count in rows}
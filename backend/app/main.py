@@ -21,6 +21,7 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "Retry-After"],
     )
 
     app.include_router(api.router, prefix="/api/v1")
@@ -4,6 +4,11 @@ import datetime
 
 class GenerateTextRequest(BaseModel):
     url: str
+    force_refresh: bool = False
+
+class GenerateBatchRequest(BaseModel):
+    urls: List[str]
+    force_refresh: bool = False
 
 class GenerateTextResponse(BaseModel):
     titles: List[str]
@@ -20,3 +25,13 @@ class HistoryItem(BaseModel):
 
     class Config:
         orm_mode = True
+
+class JobResponse(BaseModel):
+    id: int
+    url: str
+    status: str
+    attempts: int
+    created_at: datetime.datetime
+    updated_at: Optional[datetime.datetime] = None
+    result: Optional[GenerateTextResponse] = None
+    error: Optional[str] = None
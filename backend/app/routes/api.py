@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Request
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from app.database import SessionLocal, init_db
-from app.database.models import User, GenerationHistory
+from app.database.models import User, GenerationHistory, GenerationJob
 from app.utils.helpers import (
-    validate_url, sanitize_url, get_user_by_email, create_user, verify_password
+    validate_url, sanitize_url, get_user_by_email, create_user, verify_password, encode_cursor, decode_cursor
 )
 from app.utils.jwt_utils import create_access_token
 from app.utils.email_utils import send_reset_email
@@ -11,19 +13,44 @@ from app.models.auth import (
     LoginRequest, RegisterRequest, AuthResponse, ForgotPasswordRequest,
     ForgotPasswordResponse, ProfileUpdateRequest
 )
-from app.models.product import GenerateTextRequest, GenerateTextResponse, HistoryItem
+from app.models.product import GenerateTextRequest, GenerateTextResponse, GenerateBatchRequest, HistoryItem, JobResponse
+from app import jobs
 from fastapi.security import OAuth2PasswordBearer
-from typing import List
+from app.config import (
+    LISTINGCREW_WARMUP, SSE_HEARTBEAT_SECONDS, BATCH_MAX_URLS, GENERATION_TIMEOUT_SECONDS,
+    HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+)
+from app.utils.generation import get_generation_pool
+from fastapi.concurrency import run_in_threadpool
+from typing import Callable, Dict, List, Optional, Tuple
+import json
+import time
+import asyncio
+import logging
+import threading
 import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 
 from config.settings import get_settings, Settings
-from src.ListingCrew.main import generate_listing
 
 router = APIRouter()
 
+def generate_listing(url: str, **kwargs) -> dict:
+    # The crew stack (crewai, litellm, ML tooling) is imported on first use so the API
+    # can serve auth and history requests without paying for it at startup.
+    from src.ListingCrew.main import generate_listing as _generate_listing
+    return _generate_listing(url, **kwargs)
+
+def warm_up_listing_crew():
+    try:
+        from src.ListingCrew.factory import get_crew_factory
+        get_crew_factory().warm_up()
+        logging.info("ListingCrew warm-up finished.")
+    except Exception as e:
+        logging.error(f"ListingCrew warm-up failed: {e}")
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
@@ -32,9 +59,15 @@ def get_db():
     finally:
         db.close()
 
+def get_session_factory() -> Callable[[], Session]:
+    # For work that outlives the request's own session (pool threads, streamed responses)
+    return SessionLocal
+
 @router.on_event("startup")
 def on_startup():
     init_db()
+    if LISTINGCREW_WARMUP:
+        threading.Thread(target=warm_up_listing_crew, name="listingcrew-warmup", daemon=True).start()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login")
 
@@ -83,52 +116,234 @@ def forgot_password(
     send_reset_email(user.email, reset_link)
     return ForgotPasswordResponse(message="Password reset email sent successfully!")
 
+def build_listing_response(result: dict) -> Tuple[GenerateTextResponse, str]:
+    # Shape the crew's structured result into the API response; returns (response, title)
+    if not isinstance(result, dict) or "raw_output" in result:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Failed to get structured data from ListingCrew.")
+
+    title = result.get("title", "No Title Generated")
+    description = result.get("description", "No Description Generated")
+    bullet_points = result.get("bullet_points", result.get("bulletPoints", []))
+    if isinstance(bullet_points, str):
+        bullet_points = [bp.strip() for bp in bullet_points.split('\n') if bp.strip()] # Handle string-formatted lists
+
+    keywords_report = result.get("keywordsReport", "No Keywords Report Generated")
+    response = GenerateTextResponse(
+        titles=[title] if title else [],
+        description=description,
+        bulletPoints=bullet_points,
+        keywordsReport=keywords_report
+    )
+    return response, title
+
+def record_generation(db: Session, user_id: int, url: str, title: str) -> None:
+    # Save the generation result to the database
+    new_history_item = GenerationHistory(
+        user_id=user_id,
+        url=url,
+        title=title,
+        status="completed"
+    )
+    db.add(new_history_item)
+    db.commit()
+
+def generation_key(url: str, force_refresh: bool) -> Tuple[str, bool]:
+    # Requests for the same product (same ASIN, whatever the URL's slug or marketplace) share one generation
+    from src.ListingCrew.tools.web_scraper import product_key
+    return product_key(url), force_refresh
+
 @router.post("/generate_text", response_model=GenerateTextResponse)
-def generate_text(request: GenerateTextRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def generate_text(request: GenerateTextRequest, http_request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # The crew runs on the generation pool; this handler only awaits it, so auth and history
+    # requests keep their threads. Over capacity it answers 503/429 at once. A request for a
+    # product already being generated waits for that run, and still gets its own history row.
     url = sanitize_url(request.url)
     if not validate_url(url):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid URL format.")
-    
+
     try:
-        result = generate_listing(url)
-
-        if not isinstance(result, dict) or "raw_output" in result:
-            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="Failed to get structured data from ListingCrew.")
-
-        title = result.get("title", "No Title Generated")
-        description = result.get("description", "No Description Generated")
-        bullet_points = result.get("bullet_points", result.get("bulletPoints", []))
-        if isinstance(bullet_points, str):
-            bullet_points = [bp.strip() for bp in bullet_points.split('\n') if bp.strip()] # Handle string-formatted lists
-
-        keywords_report = result.get("keywordsReport", "No Keywords Report Generated")
-
-        # Save the generation result to the database
-        new_history_item = GenerationHistory(
-            user_id=current_user.id,
-            url=url,
-            title=title,
-            status="completed"
-        )
-        db.add(new_history_item)
-        db.commit()
-
-        return GenerateTextResponse(
-            titles=[title] if title else [],
-            description=description,
-            bulletPoints=bullet_points,
-            keywordsReport=keywords_report
-        )
+        result = await get_generation_pool().run(current_user.id, generate_listing, url, force_refresh=request.force_refresh,
+                                                 key=generation_key(url, request.force_refresh),
+                                                 is_disconnected=http_request.is_disconnected)
+        response, title = build_listing_response(result)
+        await run_in_threadpool(record_generation, db, current_user.id, url, title)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
-        # Log the full error for debugging
-        print(f"Error during listing generation for URL {url}: {e}")
+        logging.error(f"Error during listing generation for URL {url}: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An internal error occurred: {str(e)}")
 
+def sse_event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.get("/generate_text/stream")
+async def generate_text_stream(url: str, force_refresh: bool = False, current_user: User = Depends(get_current_user),
+                               session_factory: Callable[[], Session] = Depends(get_session_factory)):
+    # Server-Sent Events: stage events and writer tokens while the crew runs, then the same
+    # payload as POST /generate_text in a final "result" event (or an "error" event).
+    # Shares the generation pool's limits; closing the stream cancels the generation.
+    url = sanitize_url(url)
+    if not validate_url(url):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid URL format.")
+
+    user_id = current_user.id
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Tuple[str, dict]]" = asyncio.Queue()
+    cancel = threading.Event()
+
+    def put(name: str, data: dict) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, (name, data))
+
+    def run():
+        try:
+            result = generate_listing(url, force_refresh=force_refresh, on_event=put,
+                                      timeout=GENERATION_TIMEOUT_SECONDS, cancel=cancel)
+            response, title = build_listing_response(result)
+            # The request's session is closed by now; the crew outlives the handler
+            with session_factory() as db:
+                record_generation(db, user_id, url, title)
+            put("result", response.dict())
+        except HTTPException as e:
+            put("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logging.error(f"Error during streamed listing generation for URL {url}: {e}")
+            put("error", {"status": 500, "detail": f"An internal error occurred: {str(e)}"})
+
+    get_generation_pool().submit(user_id, run)
+
+    async def stream():
+        try:
+            yield sse_event("started", {"url": url})
+            while True:
+                try:
+                    name, data = await asyncio.wait_for(events.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_event(name, data)
+                if name in ("result", "error"):
+                    return
+        finally:
+            # Stops the crew at its next LLM call if the client went away first
+            cancel.set()
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/generate_batch")
+async def generate_batch(request: GenerateBatchRequest, current_user: User = Depends(get_current_user),
+                         session_factory: Callable[[], Session] = Depends(get_session_factory)):
+    # Streams one NDJSON line per product as it finishes; duplicates (same ASIN) are generated once.
+    # Each product runs on the generation pool under the user's limits and its own deadline, at most
+    # the user's share of the pool at a time; closing the stream cancels the products still running.
+    if len(request.urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {BATCH_MAX_URLS} URLs per batch.")
+    from src.ListingCrew.batch import dedupe
+    from src.ListingCrew.deadlines import GenerationCancelled
+
+    urls, invalid = [], []
+    for raw_url in request.urls:
+        url = sanitize_url(raw_url)
+        (urls if validate_url(url) else invalid).append(url)
+
+    user_id = current_user.id
+    pool = get_generation_pool()
+    cancel = threading.Event()
+
+    def start(url: str) -> Optional["asyncio.Future[dict]"]:
+        # None when the pool's global or per-user limit is reached
+        try:
+            return asyncio.wrap_future(pool.submit(user_id, generate_listing, url, force_refresh=request.force_refresh,
+                                                   timeout=GENERATION_TIMEOUT_SECONDS, cancel=cancel))
+        except HTTPException:
+            return None
+
+    async def stream():
+        try:
+            for url in invalid:
+                yield json.dumps({"url": url, "status": "error", "detail": "Invalid URL format."}) + "\n"
+            pending = dedupe(urls)
+            running: Dict["asyncio.Future[dict]", Tuple[str, float]] = {}
+            with session_factory() as db:
+                url = next(pending, None)
+                while url is not None or running:
+                    while url is not None and len(running) < pool.max_per_user:
+                        future = start(url)
+                        if future is None:
+                            break
+                        running[future] = (url, time.perf_counter())
+                        url = next(pending, None)
+                    if not running:
+                        # Every slot is taken by other requests; try again shortly
+                        await asyncio.sleep(pool.poll_seconds)
+                        continue
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for future in done:
+                        done_url, started = running.pop(future)
+                        line = {"url": done_url, "status": "ok", "seconds": round(time.perf_counter() - started, 3)}
+                        try:
+                            response, title = build_listing_response(future.result())
+                            await run_in_threadpool(record_generation, db, user_id, done_url, title)
+                            line["listing"] = response.dict()
+                        except HTTPException as e:
+                            line.update(status="error", detail=e.detail)
+                        except GenerationCancelled:
+                            line.update(status="error", detail="Listing generation timed out.")
+                        except Exception as e:
+                            logging.error(f"Error during batch listing generation for URL {done_url}: {e}")
+                            line.update(status="error", detail=f"An internal error occurred: {str(e)}")
+                        yield json.dumps(line) + "\n"
+        finally:
+            # Stops this batch's running generations at their next LLM call if the client went away first
+            cancel.set()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def job_response(job: GenerationJob) -> JobResponse:
+    return JobResponse(
+        id=job.id, url=job.url, status=job.status, attempts=job.attempts,
+        created_at=job.created_at, updated_at=job.updated_at,
+        result=json.loads(job.result) if job.result else None, error=job.error,
+    )
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+def create_job(request: GenerateTextRequest, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Queues the generation for a worker (python -m app.worker) and returns at once; poll GET /jobs/{id}
+    url = sanitize_url(request.url)
+    if not validate_url(url):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid URL format.")
+    return job_response(jobs.enqueue(db, current_user, url, force_refresh=request.force_refresh))
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = jobs.get_job(db, job_id, current_user)
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job_response(job)
+
 @router.get("/history", response_model=List[HistoryItem])
-def get_history(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    # Query the database for generation history belonging to the current user
-    history = db.query(GenerationHistory).filter(GenerationHistory.user_id == current_user.id).order_by(GenerationHistory.date.desc()).all()
-    return history
+def get_history(response: Response, limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+                cursor: Optional[str] = None, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # One page of the user's history, newest first. Pages are keyset-paginated on (date, id) over the
+    # (user_id, date, id) index and only select HistoryItem's columns, so a page costs the same however
+    # long the history is. When there are more rows, X-Next-Cursor holds the cursor for the next page.
+    query = db.query(
+        GenerationHistory.id, GenerationHistory.url, GenerationHistory.date,
+        GenerationHistory.title, GenerationHistory.status,
+    ).filter(GenerationHistory.user_id == current_user.id)
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+        date, item_id = position
+        # A row-value comparison, so the index seeks straight to the cursor instead of filtering up to it
+        query = query.filter(tuple_(GenerationHistory.date, GenerationHistory.id) < tuple_(date, item_id))
+    rows = query.order_by(GenerationHistory.date.desc(), GenerationHistory.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].date, rows[-1].id)
+    return [row._asdict() for row in rows]
 
 @router.delete("/history/{item_id}", status_code=status.HTTP_200_OK)
 def delete_history_item(item_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
@@ -145,6 +360,31 @@ def delete_history_item(item_id: int, current_user: User = Depends(get_current_u
     db.commit()
     return {"message": "History item deleted."}
 
+# Process-wide singletons reported by /metrics: (name in the response, module, instance or its getter)
+METRICS_SOURCES = (
+    ("scraper", "src.ListingCrew.tools.web_scraper", "get_scheduler"),
+    ("llm", "src.ListingCrew.llm_scheduler", "get_llm_scheduler"),
+    ("completion_cache", "src.ListingCrew.completion_cache", "get_completion_cache"),
+    ("checkpoints", "src.ListingCrew.checkpoints", "get_checkpoint_store"),
+    ("routing", "src.ListingCrew.llm_router", "get_llm_router"),
+    ("search", "src.ListingCrew.tools.search_store", "get_search_store"),
+    ("similar_listings", "src.ListingCrew.tools.listing_index", "get_listing_index"),
+    ("generations", "app.utils.generation", "_generation_pool"),
+)
+
+@router.get("/metrics")
+def get_metrics(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Stats of the singletons this process has created so far, plus the job queue by status
+    metrics = {}
+    for name, module, attribute in METRICS_SOURCES:
+        instance = getattr(sys.modules.get(module), attribute, None)
+        # Process-wide getters hold what they created on .instance, None until first use
+        instance = getattr(instance, "instance", instance)
+        if instance is not None:
+            metrics[name] = instance.stats()
+    metrics["jobs"] = jobs.stats(db)
+    return metrics
+
 @router.get("/profile")
 def get_profile(current_user: User = Depends(get_current_user)):
     # TODO: Fetch real subscription data from the database based on the user
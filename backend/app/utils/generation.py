@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import HTTPException, status
+from app.config import (
+    GENERATION_MAX_CONCURRENT, GENERATION_MAX_PER_USER, GENERATION_TIMEOUT_SECONDS,
+    GENERATION_RETRY_AFTER_SECONDS, GENERATION_DISCONNECT_POLL_SECONDS
+)
+
+# Extra time a generation gets to notice its deadline before the request stops waiting for it
+DEADLINE_GRACE_SECONDS = 5.0
+CLIENT_CLOSED_REQUEST = 499
+
+_generation_pool: Optional["GenerationPool"] = None
+_generation_pool_lock = threading.Lock()
+
+
+class _Flight:
+    """A running generation and how many requests are waiting for it."""
+
+    def __init__(self, key: Optional[Hashable], future: Future, cancel: threading.Event):
+        self.key = key
+        self.future = future
+        self.cancel = cancel
+        self.waiters = 1
+
+
+class GenerationPool:
+    """
+    Bounded pool for listing generations, separate from the server's request threadpool.
+    Admission never waits: a request that would exceed the global or per-user limit is
+    rejected on the spot with 503 or 429, and a generation's slot is only freed once its
+    thread has actually finished. Identical requests made while one is running are coalesced
+    into it (single flight) instead of starting another crew run.
+    """
+
+    def __init__(self, max_concurrent: int = GENERATION_MAX_CONCURRENT, max_per_user: int = GENERATION_MAX_PER_USER,
+                 retry_after: int = GENERATION_RETRY_AFTER_SECONDS,
+                 poll_seconds: float = GENERATION_DISCONNECT_POLL_SECONDS):
+        if max_concurrent < 1 or max_per_user < 1:
+            raise ValueError("Generation limits must be at least 1")
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.retry_after = retry_after
+        self.poll_seconds = poll_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="generation")
+        self._running = 0
+        self._per_user: Dict[Any, int] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._flights_lock = threading.Lock()
+        self._counters = {"started": 0, "completed": 0, "failed": 0, "rejected_busy": 0, "rejected_user": 0,
+                          "timed_out": 0, "cancelled": 0, "coalesced": 0}
+        self._lock = threading.Lock()
+
+    def _rejected(self, code: int, detail: str) -> HTTPException:
+        return HTTPException(status_code=code, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+    def _admit(self, user: Any) -> None:
+        with self._lock:
+            if self._running >= self.max_concurrent:
+                self._counters["rejected_busy"] += 1
+                raise self._rejected(status.HTTP_503_SERVICE_UNAVAILABLE,
+                                     "Too many listings are being generated right now; try again shortly.")
+            if self._per_user.get(user, 0) >= self.max_per_user:
+                self._counters["rejected_user"] += 1
+                raise self._rejected(status.HTTP_429_TOO_MANY_REQUESTS,
+                                     f"You already have {self.max_per_user} listings being generated.")
+            self._running += 1
+            self._per_user[user] = self._per_user.get(user, 0) + 1
+            self._counters["started"] += 1
+
+    def _release(self, user: Any, future: Optional[Future] = None) -> None:
+        with self._lock:
+            self._running -= 1
+            self._per_user[user] -= 1
+            if not self._per_user[user]:
+                del self._per_user[user]
+            if future is not None:
+                self._counters["failed" if future.cancelled() or future.exception() else "completed"] += 1
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def submit(self, user: Any, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Start fn on the pool if the limits allow it; raises a 503 or 429 HTTPException otherwise."""
+        self._admit(user)
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release(user)
+            raise
+        future.add_done_callback(lambda done: self._release(user, done))
+        return future
+
+    def _join(self, key: Optional[Hashable], user: Any, fn: Callable[..., Any], args: Tuple[Any, ...],
+              kwargs: Dict[str, Any], timeout: float) -> Tuple["_Flight", bool]:
+        """The in-flight generation for `key`, or a newly started one; True when it was joined."""
+        with self._flights_lock:
+            flight = self._flights.get(key) if key is not None else None
+            if flight is not None:
+                flight.waiters += 1
+                self._count("coalesced")
+                return flight, True
+            cancel = threading.Event()
+            flight = _Flight(key, self.submit(user, fn, *args, timeout=timeout, cancel=cancel, **kwargs), cancel)
+            if key is not None:
+                self._flights[key] = flight
+        if key is not None:
+            flight.future.add_done_callback(lambda _: self._land(key, flight))
+        return flight, False
+
+    def _land(self, key: Hashable, flight: "_Flight") -> None:
+        with self._flights_lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _leave(self, flight: "_Flight") -> None:
+        # The last caller to give up on a generation cancels it; the others keep it running.
+        # It stops being joinable at once, so a request arriving while it winds down starts afresh.
+        with self._flights_lock:
+            flight.waiters -= 1
+            abandoned = flight.waiters == 0
+            if abandoned and flight.key is not None and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+        if abandoned:
+            flight.cancel.set()
+
+    async def run(self, user: Any, fn: Callable[..., Any], *args: Any, key: Optional[Hashable] = None,
+                  is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+                  timeout: float = GENERATION_TIMEOUT_SECONDS, **kwargs: Any) -> Any:
+        """
+        Run fn(*args, timeout=timeout, cancel=event, **kwargs) on the pool and await its result
+        without holding a server thread. Callers passing the same `key` while it runs share one
+        generation (and one slot). The event is set once every caller waiting on the generation
+        has disconnected (answered with 499) or the deadline passes (504), so it stops at its
+        next LLM call.
+        """
+        from src.ListingCrew.deadlines import GenerationCancelled
+        flight, joined = self._join(key, user, fn, args, kwargs, timeout)
+        if joined:
+            logging.info(f"Joining the generation already in flight for {key}")
+        future = asyncio.wrap_future(flight.future)
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + timeout + DEADLINE_GRACE_SECONDS
+        try:
+            while not future.done():
+                await asyncio.wait({future}, timeout=self.poll_seconds)
+                if future.done():
+                    break
+                if is_disconnected is not None and await is_disconnected():
+                    self._count("cancelled")
+                    logging.info("Client disconnected; leaving its generation")
+                    raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request.")
+                if loop.time() >= give_up_at:
+                    break
+            if not future.done():
+                self._count("timed_out")
+                raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Listing generation timed out.")
+            return future.result()
+        except GenerationCancelled:
+            self._count("timed_out")
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Listing generation timed out.")
+        finally:
+            # Also runs when the server drops the request (shutdown or disconnect)
+            self._leave(flight)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters, running=self._running, max_concurrent=self.max_concurrent)
+        with self._flights_lock:
+            stats["in_flight"] = len(self._flights)
+        return stats
+
+
+def get_generation_pool() -> GenerationPool:
+    """Return the process-wide generation pool."""
+    global _generation_pool
+    if _generation_pool is None:
+        with _generation_pool_lock:
+            if _generation_pool is None:
+                _generation_pool = GenerationPool()
+    return _generation_pool
@@ -1,6 +1,8 @@
+import base64
+import datetime
 import validators
 from urllib.parse import urlparse
-from typing import Optional
+from typing import Optional, Tuple
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from app.database.models import User
@@ -37,4 +39,18 @@ def create_user(db: Session, email: str, password: str):
     db.add(user)
     db.commit()
     db.refresh(user)
-    return user
\ No newline at end of file
+    return user
+
+
+def encode_cursor(date: datetime.datetime, item_id: int) -> str:
+    """Opaque keyset cursor for the history row (date, id) a page ended on."""
+    return base64.urlsafe_b64encode(f"{date.isoformat()}|{item_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime.datetime, int]]:
+    """The (date, id) in a cursor from encode_cursor, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        date, item_id = raw.split("|")
+        return datetime.datetime.fromisoformat(date), int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
@@ -0,0 +1,166 @@
+"""
+Generation worker for the durable job queue (POST /api/v1/jobs).
+
+    cd backend && python -m app.worker --concurrency 2 --processes 4
+
+Each worker thread leases one job at a time from the database, renews the lease while the
+crew runs and records the result, a retry or a dead letter. Any number of workers on any
+number of nodes can share one database. A worker that is killed loses its leases, and the
+jobs are picked up again once the leases expire. SIGTERM/SIGINT hand running jobs back to
+the queue before exiting.
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+import multiprocessing
+from typing import Any, Callable, List, Optional
+from app.database import SessionLocal, init_db
+from app.database.models import GenerationJob
+from app.config import JOB_LEASE_SECONDS, JOB_POLL_SECONDS, GENERATION_TIMEOUT_SECONDS
+from app import jobs
+
+
+class Worker:
+    """Claims and runs generation jobs on `concurrency` threads until stopped."""
+
+    def __init__(self, name: Optional[str] = None, concurrency: int = 1, lease_seconds: float = JOB_LEASE_SECONDS,
+                 poll_seconds: float = JOB_POLL_SECONDS, timeout: float = GENERATION_TIMEOUT_SECONDS,
+                 session_factory: Callable[[], Any] = SessionLocal, generate: Optional[Callable[..., dict]] = None):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.timeout = timeout
+        self.session_factory = session_factory
+        self._generate = generate
+        self._stopping = threading.Event()
+
+    def generate(self, url: str, **kwargs: Any) -> dict:
+        if self._generate is None:
+            # Loads the crew stack on first use, like the API does
+            from app.routes.api import generate_listing
+            self._generate = generate_listing
+        return self._generate(url, **kwargs)
+
+    def stop(self) -> None:
+        """Stop claiming jobs and hand the running ones back to the queue."""
+        self._stopping.set()
+
+    def _keep_lease(self, job_id: int, owner: str, finished: threading.Event, cancel: threading.Event) -> None:
+        # Renews the lease every third of its length; cancels the job when the lease is lost or the worker stops
+        renew_at = time.monotonic() + self.lease_seconds / 3
+        while not finished.wait(min(self.poll_seconds, self.lease_seconds / 3)):
+            if self._stopping.is_set():
+                cancel.set()
+            if time.monotonic() < renew_at:
+                continue
+            renew_at = time.monotonic() + self.lease_seconds / 3
+            with self.session_factory() as db:
+                if not jobs.renew(db, job_id, owner, self.lease_seconds):
+                    logging.warning(f"{owner} lost the lease on job {job_id}; cancelling it")
+                    cancel.set()
+                    return
+
+    def process(self, job: GenerationJob, owner: str) -> None:
+        """Run one leased job and record its outcome."""
+        from app.routes.api import build_listing_response
+        finished, cancel = threading.Event(), threading.Event()
+        lease = threading.Thread(target=self._keep_lease, args=(job.id, owner, finished, cancel),
+                                 name=f"lease-{job.id}", daemon=True)
+        lease.start()
+        try:
+            result = self.generate(job.url, force_refresh=job.force_refresh, timeout=self.timeout, cancel=cancel)
+            response, title = build_listing_response(result)
+        except Exception as e:
+            finished.set()
+            with self.session_factory() as db:
+                if self._stopping.is_set():
+                    jobs.release(db, job.id, owner)
+                    logging.info(f"Job {job.id} handed back to the queue on shutdown")
+                else:
+                    jobs.fail(db, job.id, owner, getattr(e, "detail", None) or str(e) or type(e).__name__)
+            return
+        finished.set()
+        with self.session_factory() as db:
+            if jobs.complete(db, job.id, owner, response.dict(), title):
+                logging.info(f"Job {job.id} completed by {owner}")
+            else:
+                logging.warning(f"Job {job.id} finished by {owner} after its lease was lost; result discarded")
+
+    def run_once(self, owner: Optional[str] = None) -> bool:
+        """Claim and run one job; False when there was nothing to do."""
+        owner = owner or self.name
+        with self.session_factory() as db:
+            job = jobs.claim(db, owner, self.lease_seconds)
+            if job is not None:
+                db.expunge(job)
+        if job is None:
+            return False
+        logging.info(f"{owner} claimed job {job.id} (attempt {job.attempts}/{job.max_attempts})")
+        self.process(job, owner)
+        return True
+
+    def _loop(self, slot: int) -> None:
+        owner = f"{self.name}:{slot}"
+        while not self._stopping.is_set():
+            try:
+                if not self.run_once(owner):
+                    self._stopping.wait(self.poll_seconds)
+            except Exception as e:
+                logging.error(f"{owner} could not reach the job queue: {e}")
+                self._stopping.wait(self.poll_seconds)
+
+    def run(self) -> None:
+        """Work until stop() is called."""
+        threads = [threading.Thread(target=self._loop, args=(slot,), name=f"job-worker-{slot}")
+                   for slot in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def run_worker(concurrency: int) -> None:
+    """One worker process: runs until SIGTERM or SIGINT."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(levelname)s %(message)s")
+    worker = Worker(concurrency=concurrency)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: worker.stop())
+    logging.info(f"Worker {worker.name} started with {concurrency} slot(s)")
+    worker.run()
+    logging.info(f"Worker {worker.name} stopped")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs each process runs at once")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes to start on this node")
+    args = parser.parse_args(argv)
+    # Created once here, not by every worker process at the same time
+    init_db()
+    if args.processes <= 1:
+        run_worker(args.concurrency)
+        return
+
+    processes = [multiprocessing.Process(target=run_worker, args=(args.concurrency,), name=f"worker-{index}")
+                 for index in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, _frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the children get Ctrl-C from the terminal themselves
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import logging
 from mysql.connector import connect, Error as MySQLError
-from typing import Optional, Dict, Tuple, Any
+from typing import Optional, Dict, Iterator, Tuple, Any
 from contextlib import contextmanager
 
 
@@ -101,6 +101,23 @@ class DBConnection:
             self.logger.error(f"Error retrieving data for ASIN {asin}: {e}")
             return None
 
+    def iter_data(self, batch_size: int = 500) -> Iterator[Dict[str, str]]:
+        """Yield every product row, fetched batch_size rows at a time."""
+        last_asin = ""
+        while True:
+            with self.get_connection() as (_, cursor):
+                cursor.execute(
+                    """SELECT ASIN, Title, Description, Category
+                    FROM TitleDescription WHERE ASIN > %s ORDER BY ASIN LIMIT %s""",
+                    (last_asin, batch_size)
+                )
+                rows = cursor.fetchall()
+            for row in rows:
+                yield {"ASIN": row[0], "Title": row[1], "Description": row[2], "Category": row[3]}
+            if len(rows) < batch_size:
+                return
+            last_asin = rows[-1][0]
+
     def update_data(self, asin: str, **kwargs) -> bool:
         """Update product data by ASIN."""
         if not self.check_asin_exists(asin):
@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -10,7 +11,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from app.main import create_app
 from app.database.models import Base
-from app.routes.api import get_db
+from app.routes.api import get_db, get_session_factory
 
 # Use an in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -44,6 +45,8 @@ def db_session():
 
     # Override the app's get_db dependency to use this transactional session
     app.dependency_overrides[get_db] = lambda: session
+    # Sessions opened outside the request (streams, pool threads) are the same test session
+    app.dependency_overrides[get_session_factory] = lambda: lambda: session
 
     yield session
 
@@ -60,7 +63,8 @@ def client(db_session):
     A TestClient for the app that uses the transactional db_session.
     We depend on db_session to ensure the dependency override is active.
     """
-    with TestClient(app) as c:
+    # setup_and_teardown_db already made the tables; the startup hook would touch the app's own test.db
+    with patch("app.routes.api.init_db"), TestClient(app) as c:
         yield c
 
 @pytest.fixture(scope="module")
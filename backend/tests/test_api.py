@@ -1,4 +1,13 @@
-from unittest.mock import patch
+import json
+import time
+import datetime
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from unittest.mock import ANY, patch
+from app.utils import generation
+from app.utils.generation import GenerationPool
 
 def test_read_root(client):
     response = client.get("/")
@@ -98,7 +107,7 @@ def test_generate_text_and_history(mock_generate_listing, client, auth_token):
     assert gen_data["description"] == mock_data["description"]
     assert gen_data["bulletPoints"] == mock_data["bullet_points"]
     assert gen_data["keywordsReport"] == mock_data["keywordsReport"]
-    mock_generate_listing.assert_called_once_with("https://www.example.com")
+    mock_generate_listing.assert_called_once_with("https://www.example.com", force_refresh=False, timeout=ANY, cancel=ANY)
 
     # 3. Check history again to see the new item
     response = client.get("/api/v1/history", headers=headers)
@@ -121,6 +130,404 @@ def test_generate_text_and_history(mock_generate_listing, client, auth_token):
     assert response.status_code == 200
     assert response.json() == []
 
+@patch("app.routes.api.generate_listing")
+def test_generate_text_force_refresh(mock_generate_listing, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    mock_generate_listing.return_value = {"title": "T", "description": "D", "bullet_points": [], "keywordsReport": "K"}
+    response = client.post(
+        "/api/v1/generate_text",
+        headers=headers,
+        json={"url": "https://www.example.com", "force_refresh": True}
+    )
+    assert response.status_code == 200
+    mock_generate_listing.assert_called_once_with("https://www.example.com", force_refresh=True, timeout=ANY, cancel=ANY)
+
+@patch("app.routes.api.generate_listing")
+def test_generate_text_rejects_requests_over_capacity(mock_generate_listing, client, auth_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    pool = GenerationPool(max_concurrent=1, max_per_user=1, retry_after=7)
+    monkeypatch.setattr(generation, "_generation_pool", pool)
+    release = threading.Event()
+    pool.submit("someone else", release.wait)
+    try:
+        response = client.post("/api/v1/generate_text", headers=headers, json={"url": "https://www.example.com"})
+    finally:
+        release.set()
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    mock_generate_listing.assert_not_called()
+
+def _wait_for_idle(pool):
+    for _ in range(100):
+        if pool.stats()["running"] == 0:
+            return
+        time.sleep(0.01)
+
+def test_generation_pool_limits_each_user():
+    pool = GenerationPool(max_concurrent=3, max_per_user=1)
+    release = threading.Event()
+    pool.submit("user-1", release.wait)
+    with pytest.raises(HTTPException) as rejected:
+        pool.submit("user-1", release.wait)
+    assert rejected.value.status_code == 429
+    pool.submit("user-2", release.wait)
+    release.set()
+    _wait_for_idle(pool)
+    stats = pool.stats()
+    assert stats["completed"] == 2 and stats["rejected_user"] == 1 and stats["running"] == 0
+
+def test_generation_pool_cancels_work_for_disconnected_clients():
+    pool = GenerationPool(max_concurrent=1, max_per_user=1, poll_seconds=0.01)
+    seen = {}
+
+    def generate(url, timeout=None, cancel=None):
+        seen["cancel"] = cancel
+        cancel.wait(5)
+        return {"title": url}
+
+    async def disconnected():
+        return True
+
+    with pytest.raises(HTTPException) as closed:
+        asyncio.run(pool.run("user-1", generate, "https://www.example.com", is_disconnected=disconnected))
+    assert closed.value.status_code == 499
+    assert seen["cancel"].is_set()
+    _wait_for_idle(pool)
+    assert pool.stats()["cancelled"] == 1 and pool.stats()["running"] == 0
+
+def test_generation_pool_stops_generations_past_their_deadline():
+    from src.ListingCrew.deadlines import generation_deadline, check_deadline
+    pool = GenerationPool(max_concurrent=1, max_per_user=1, poll_seconds=0.01)
+
+    def generate(url, timeout=None, cancel=None):
+        with generation_deadline(timeout, cancel):
+            while True:
+                time.sleep(0.01)
+                check_deadline()
+
+    with pytest.raises(HTTPException) as timed_out:
+        asyncio.run(pool.run("user-1", generate, "https://www.example.com", timeout=0.05))
+    assert timed_out.value.status_code == 504
+    assert pool.stats()["timed_out"] == 1
+
+def test_generation_pool_coalesces_identical_requests():
+    pool = GenerationPool(max_concurrent=1, max_per_user=1, poll_seconds=0.01)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def generate(url, timeout=None, cancel=None):
+        calls.append(url)
+        started.set()
+        release.wait(5)
+        return {"title": url}
+
+    async def disconnects():
+        return True
+
+    async def scenario():
+        first = asyncio.ensure_future(pool.run("user-1", generate, "https://www.amazon.com/dp/B000000001", key="B000000001"))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait)
+        # Same product from another user: no new run and no slot needed, even though the pool is full
+        second = asyncio.ensure_future(pool.run("user-2", generate, "https://www.amazon.ca/x/dp/B000000001", key="B000000001"))
+        # A third caller gives up; the generation keeps running for the other two
+        with pytest.raises(HTTPException):
+            await pool.run("user-3", generate, "https://www.amazon.com/dp/B000000001", key="B000000001",
+                           is_disconnected=disconnects)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    results = asyncio.run(scenario())
+    assert results == [{"title": "https://www.amazon.com/dp/B000000001"}] * 2
+    assert calls == ["https://www.amazon.com/dp/B000000001"]
+    stats = pool.stats()
+    assert stats["coalesced"] == 2 and stats["started"] == 1 and stats["in_flight"] == 0
+
+def test_generation_pool_starts_afresh_once_every_caller_has_given_up():
+    pool = GenerationPool(max_concurrent=2, max_per_user=1, poll_seconds=0.01)
+    calls = []
+
+    def generate(url, timeout=None, cancel=None):
+        calls.append(url)
+        if len(calls) == 1:
+            # The abandoned run takes a while to notice its cancel
+            cancel.wait(5)
+            time.sleep(0.3)
+            raise RuntimeError("cancelled")
+        return {"title": url}
+
+    async def disconnects():
+        return True
+
+    async def scenario():
+        with pytest.raises(HTTPException) as closed:
+            await pool.run("user-1", generate, "https://www.amazon.com/dp/B000000001", key="B000000001",
+                           is_disconnected=disconnects)
+        assert closed.value.status_code == 499
+        return await pool.run("user-2", generate, "https://www.amazon.ca/dp/B000000001", key="B000000001")
+
+    assert asyncio.run(scenario()) == {"title": "https://www.amazon.ca/dp/B000000001"}
+    assert len(calls) == 2
+    assert pool.stats()["coalesced"] == 0
+
+@patch("app.routes.api.generate_listing")
+def test_concurrent_requests_for_one_product_share_a_generation(mock_generate_listing, client, auth_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    pool = GenerationPool(max_concurrent=2, max_per_user=2, poll_seconds=0.01)
+    monkeypatch.setattr(generation, "_generation_pool", pool)
+
+    def fake_generate(url, force_refresh=False, timeout=None, cancel=None):
+        for _ in range(500):
+            if pool.stats()["coalesced"]:
+                break
+            time.sleep(0.01)
+        return {"title": "Shared Title", "description": "D", "bullet_points": [], "keywordsReport": "K"}
+
+    mock_generate_listing.side_effect = fake_generate
+    # Both requests share the test's single session; real requests each get their own
+    from app.routes import api
+    lock, record = threading.Lock(), api.record_generation
+
+    def record_one_at_a_time(*args):
+        with lock:
+            record(*args)
+
+    monkeypatch.setattr(api, "record_generation", record_one_at_a_time)
+    urls = ["https://www.amazon.com/dp/B000000001", "https://www.amazon.ca/Knee-Brace/dp/B000000001/"]
+    responses = [None, None]
+
+    def post(index):
+        responses[index] = client.post("/api/v1/generate_text", headers=headers, json={"url": urls[index]})
+
+    threads = [threading.Thread(target=post, args=(index,)) for index in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert mock_generate_listing.call_count == 1
+    # Each caller still gets its own history entry
+    history = client.get("/api/v1/history", headers=headers).json()
+    assert sorted(item["url"] for item in history) == sorted(urls)
+
+def _sse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+@patch("app.routes.api.generate_listing")
+def test_generate_text_stream(mock_generate_listing, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    def fake_generate(url, force_refresh=False, on_event=None, timeout=None, cancel=None):
+        on_event("scrape_done", {"task": "prescrape", "output": {"title": "Knee Brace"}})
+        on_event("research_done", {"task": "research_task", "output": "report"})
+        on_event("token", {"text": "Gener"})
+        on_event("token", {"text": "ated"})
+        return {"title": "Generated Title", "description": "D", "bullet_points": ["P"], "keywordsReport": "K"}
+
+    mock_generate_listing.side_effect = fake_generate
+    response = client.get("/api/v1/generate_text/stream", params={"url": "https://www.example.com"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+    assert [name for name, _ in events] == ["started", "scrape_done", "research_done", "token", "token", "result"]
+    assert events[-1][1] == {"titles": ["Generated Title"], "description": "D", "bulletPoints": ["P"], "keywordsReport": "K"}
+
+    history = client.get("/api/v1/history", headers=headers).json()
+    assert [item["title"] for item in history] == ["Generated Title"]
+
+@patch("app.routes.api.generate_listing")
+def test_generate_text_stream_records_through_its_own_session(mock_generate_listing, client, auth_token, db_session):
+    # The request's session is closed once the handler returns, before the crew finishes
+    from app.routes.api import get_session_factory
+    opened = []
+
+    def session_factory():
+        opened.append(db_session)
+        return db_session
+
+    client.app.dependency_overrides[get_session_factory] = lambda: session_factory
+    mock_generate_listing.return_value = {"title": "Generated Title", "description": "D", "bullet_points": [], "keywordsReport": "K"}
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = client.get("/api/v1/generate_text/stream", params={"url": "https://www.example.com"}, headers=headers)
+    assert _sse_events(response.text)[-1][0] == "result"
+    assert len(opened) == 1
+
+@patch("app.routes.api.generate_listing")
+def test_generate_text_stream_reports_errors(mock_generate_listing, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    mock_generate_listing.return_value = {"raw_output": "not json"}
+    response = client.get("/api/v1/generate_text/stream", params={"url": "https://www.example.com"}, headers=headers)
+    name, data = _sse_events(response.text)[-1]
+    assert name == "error" and data["status"] == 502
+
+def test_generate_text_stream_requires_auth(client):
+    response = client.get("/api/v1/generate_text/stream", params={"url": "https://www.example.com"})
+    assert response.status_code == 401
+
+@patch("app.routes.api.generate_listing")
+def test_generate_batch_streams_ndjson(mock_generate_listing, client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+
+    def fake_generate(url, force_refresh=False, timeout=None, cancel=None):
+        if "B000000002" in url:
+            return {"raw_output": "not json"}
+        return {"title": f"Title for {url}", "description": "D", "bullet_points": ["P"], "keywordsReport": "K"}
+
+    mock_generate_listing.side_effect = fake_generate
+    response = client.post("/api/v1/generate_batch", headers=headers, json={"urls": [
+        "https://www.amazon.com/dp/B000000001",
+        "https://www.amazon.ca/Knee-Brace/dp/B000000001/",
+        "https://www.amazon.com/dp/B000000002",
+        "not a url",
+    ]})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_status = sorted((line["status"], line["url"]) for line in lines)
+    assert by_status == [
+        ("error", "https://not a url"), ("error", "https://www.amazon.com/dp/B000000002"),
+        ("ok", "https://www.amazon.com/dp/B000000001"),
+    ]
+    assert mock_generate_listing.call_count == 2
+    ok = next(line for line in lines if line["status"] == "ok")
+    assert ok["listing"]["titles"] == ["Title for https://www.amazon.com/dp/B000000001"]
+
+    history = client.get("/api/v1/history", headers=headers).json()
+    assert [item["url"] for item in history] == ["https://www.amazon.com/dp/B000000001"]
+
+@patch("app.routes.api.generate_listing")
+def test_generate_batch_runs_on_the_generation_pool(mock_generate_listing, client, auth_token, monkeypatch):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    pool = GenerationPool(max_concurrent=4, max_per_user=2, poll_seconds=0.01)
+    monkeypatch.setattr(generation, "_generation_pool", pool)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def fake_generate(url, force_refresh=False, timeout=None, cancel=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        if url.endswith("3"):
+            from src.ListingCrew.deadlines import GenerationCancelled
+            raise GenerationCancelled("Generation deadline exceeded")
+        assert timeout == generation.GENERATION_TIMEOUT_SECONDS and not cancel.is_set()
+        return {"title": url, "description": "D", "bullet_points": [], "keywordsReport": "K"}
+
+    mock_generate_listing.side_effect = fake_generate
+    urls = [f"https://www.amazon.com/dp/B00000000{index}" for index in range(1, 6)]
+    response = client.post("/api/v1/generate_batch", headers=headers, json={"urls": urls})
+    lines = {line["url"]: line for line in map(json.loads, response.text.splitlines())}
+    assert sorted(lines) == urls
+    assert lines[urls[2]] == {"url": urls[2], "status": "error", "seconds": ANY, "detail": "Listing generation timed out."}
+    # Never more than the user's share of the pool, and every slot is given back
+    assert peak[0] == 2
+    assert pool.stats()["started"] == 5 and pool.stats()["running"] == 0
+
+def test_generate_batch_rejects_oversized_catalogs(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    with patch("app.routes.api.BATCH_MAX_URLS", 2):
+        response = client.post("/api/v1/generate_batch", headers=headers, json={"urls": ["https://a.com"] * 3})
+    assert response.status_code == 413
+
+def test_metrics(client, auth_token, tmp_path, monkeypatch):
+    from src.ListingCrew import completion_cache
+    from src.ListingCrew.tools import search_store
+    monkeypatch.setattr(completion_cache.get_completion_cache, "instance", completion_cache.CompletionCache(str(tmp_path / "completions.sqlite3")))
+    monkeypatch.setattr(search_store.get_search_store, "instance", search_store.SearchStore(str(tmp_path / "search.sqlite3")))
+    monkeypatch.setattr(generation, "_generation_pool", None)
+    monkeypatch.chdir(tmp_path)
+
+    assert client.get("/api/v1/metrics").status_code == 401
+    response = client.get("/api/v1/metrics", headers={"Authorization": f"Bearer {auth_token}"})
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["completion_cache"]["hits"] == 0
+    assert metrics["search"]["pages_embedded"] == 0
+    assert "jobs" in metrics
+    # Stores that were never used are left alone rather than created (with their cache files) to report on
+    assert "generations" not in metrics
+    assert generation._generation_pool is None
+    assert not (tmp_path / "output").exists()
+
+def test_history_is_keyset_paginated(client, auth_token, db_session, test_user):
+    from app.database.models import GenerationHistory
+    from app.utils.helpers import get_user_by_email
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    user = get_user_by_email(db_session, test_user["email"])
+    base = datetime.datetime(2024, 1, 1)
+    # Two rows share a timestamp, so the page boundary has to fall back on the id
+    dates = [base, base + datetime.timedelta(days=1), base + datetime.timedelta(days=1),
+             base + datetime.timedelta(days=2), base + datetime.timedelta(days=3)]
+    for index, date in enumerate(dates):
+        db_session.add(GenerationHistory(user_id=user.id, url=f"https://www.example.com/{index}", title=f"T{index}",
+                                         status="completed", date=date))
+    db_session.commit()
+
+    titles, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/v1/history", headers=headers, params=params)
+        assert response.status_code == 200
+        titles.extend(item["title"] for item in response.json())
+        pages += 1
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert titles == ["T4", "T3", "T2", "T1", "T0"]
+    assert pages == 3
+
+    assert client.get("/api/v1/history", headers=headers, params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/v1/history", headers=headers, params={"limit": 0}).status_code == 422
+
+def test_history_pages_are_read_from_the_composite_index(client, auth_token, db_session):
+    from sqlalchemy import event
+    from app.utils.helpers import encode_cursor
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "FROM generation_history" in statement and "ORDER BY" in statement:
+            statements.append((statement, parameters))
+
+    engine = db_session.get_bind().engine
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        client.get("/api/v1/history", headers=headers, params={"limit": 2})
+        cursor = encode_cursor(datetime.datetime(2024, 1, 1), 10)
+        client.get("/api/v1/history", headers=headers, params={"limit": 2, "cursor": cursor})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    plans = [" ".join(row[-1] for row in db_session.connection().exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {statement}", parameters)) for statement, parameters in statements]
+    # Rows come off the index already in page order: no table scan and no sort, and a cursor page
+    # seeks to its position rather than walking the newer rows
+    first_page, cursor_page = plans
+    assert "USING INDEX ix_generation_history_user_date_id (user_id=?)" in first_page
+    assert "USING INDEX ix_generation_history_user_date_id (user_id=? AND date<?)" in cursor_page
+    for plan in plans:
+        assert "SCAN" not in plan and "TEMP B-TREE" not in plan
+
+def test_history_without_a_limit_returns_one_page(client, auth_token, db_session, test_user):
+    from app.config import HISTORY_PAGE_SIZE
+    from app.database.models import GenerationHistory
+    from app.utils.helpers import get_user_by_email
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    user = get_user_by_email(db_session, test_user["email"])
+    for index in range(HISTORY_PAGE_SIZE + 1):
+        db_session.add(GenerationHistory(user_id=user.id, url=f"https://www.example.com/{index}", title=f"T{index}",
+                                         status="completed"))
+    db_session.commit()
+    response = client.get("/api/v1/history", headers=headers)
+    assert len(response.json()) == HISTORY_PAGE_SIZE
+    assert "X-Next-Cursor" in response.headers
+
 def test_delete_nonexistent_history_item(client, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
     delete_response = client.delete("/api/v1/history/9999", headers=headers)
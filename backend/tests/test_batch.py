@@ -0,0 +1,74 @@
+import io
+import json
+import pytest
+from unittest.mock import patch
+
+from src.ListingCrew import batch, llm_scheduler
+from src.ListingCrew.tools import web_scraper
+
+LISTING = {"title": "Generated Title", "description": "D", "bullet_points": ["P"], "keywordsReport": "K"}
+
+
+def test_read_urls_skips_blanks_and_comments_and_dedupes_by_asin():
+    source = io.StringIO("# catalog\nhttps://www.amazon.com/dp/B000000001\n\n"
+                         "https://www.amazon.ca/Knee-Brace/dp/B000000001/?th=1\n"
+                         "https://www.example.com/p/1\n")
+    assert list(batch.dedupe(batch.read_urls(source))) == [
+        "https://www.amazon.com/dp/B000000001", "https://www.example.com/p/1",
+    ]
+
+def test_completed_keys_ignores_failures_and_truncated_lines(tmp_path):
+    path = tmp_path / "listings.jsonl"
+    path.write_text(
+        json.dumps({"url": "u1", "key": "B000000001", "status": "ok"}) + "\n"
+        + json.dumps({"url": "u2", "key": "B000000002", "status": "error"}) + "\n"
+        + '{"url": "u3", "key": "B0000'
+    )
+    assert batch.completed_keys(str(path)) == {"B000000001"}
+
+@patch("src.ListingCrew.main.generate_listing")
+def test_run_batch_writes_jsonl_and_resumes(mock_generate_listing, tmp_path):
+    def fake_generate(url, force_refresh=False):
+        if "B000000002" in url:
+            raise RuntimeError("provider down")
+        return LISTING
+
+    mock_generate_listing.side_effect = fake_generate
+    output = str(tmp_path / "out" / "listings.jsonl")
+    catalog = "https://www.amazon.com/dp/B000000001\nhttps://www.amazon.com/dp/B000000002\n" \
+              "https://www.amazon.com/dp/B000000001\n"
+
+    counts = batch.run_batch(io.StringIO(catalog), output, workers=2, executor="thread")
+    assert counts == {"ok": 1, "error": 1, "skipped": 0}
+    records = [json.loads(line) for line in open(output)]
+    assert sorted((record["key"], record["status"]) for record in records) == [
+        ("B000000001", "ok"), ("B000000002", "error"),
+    ]
+    assert next(record for record in records if record["status"] == "ok")["result"] == LISTING
+
+    # Re-running only retries the product that failed
+    mock_generate_listing.reset_mock()
+    mock_generate_listing.side_effect = lambda url, force_refresh=False: LISTING
+    counts = batch.run_batch(io.StringIO(catalog), output, workers=2, executor="thread")
+    assert counts == {"ok": 1, "error": 0, "skipped": 1}
+    mock_generate_listing.assert_called_once_with("https://www.amazon.com/dp/B000000002", force_refresh=False)
+
+@patch("src.ListingCrew.main.generate_listing", return_value={"raw_output": "not json"})
+def test_unstructured_output_is_recorded_as_an_error(mock_generate_listing):
+    record = batch.generate_one("https://www.amazon.com/dp/B000000001")
+    assert record["status"] == "error" and record["result"] == {"raw_output": "not json"}
+
+def test_worker_processes_split_the_rate_budgets(monkeypatch):
+    monkeypatch.setattr(llm_scheduler, "HEADROOM", 0.9)
+    monkeypatch.setattr(web_scraper, "RATE_PER_HOST", 2.0)
+    monkeypatch.setattr(web_scraper, "BURST_PER_HOST", 10)
+    batch._init_worker(4)
+    assert llm_scheduler.HEADROOM == pytest.approx(0.225)
+    assert web_scraper.RATE_PER_HOST == pytest.approx(0.5)
+    assert web_scraper.BURST_PER_HOST == 2
+
+def test_generate_batch_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        list(batch.generate_batch(["https://www.amazon.com/dp/B000000001"], executor="cluster"))
+    with pytest.raises(ValueError):
+        list(batch.generate_batch(["https://www.amazon.com/dp/B000000001"], workers=0))
@@ -0,0 +1,138 @@
+import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import jobs
+from app.database.models import Base, GenerationHistory, GenerationJob, User
+from app.worker import Worker
+
+LISTING = {"title": "Generated Title", "description": "D", "bullet_points": ["P"], "keywordsReport": "K"}
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    """Sessions on a file database, so separate connections see each other's commits like separate workers."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def user(sessions):
+    with sessions() as db:
+        user = User(email="seller@example.com", hashed_password="x")
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        db.expunge(user)
+        return user
+
+
+def _expire_lease(sessions, job_id):
+    with sessions() as db:
+        job = db.get(GenerationJob, job_id)
+        job.lease_expires_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        db.commit()
+
+
+def test_each_job_is_claimed_by_one_worker(sessions, user):
+    with sessions() as db:
+        job_id = jobs.enqueue(db, user, "https://www.amazon.com/dp/B000000001").id
+    with sessions() as first, sessions() as second:
+        claimed = jobs.claim(first, "worker-a")
+        assert claimed.id == job_id and claimed.status == jobs.RUNNING and claimed.attempts == 1
+        assert jobs.claim(second, "worker-b") is None
+
+
+def test_expired_leases_are_reclaimed_then_dead_lettered(sessions, user):
+    with sessions() as db:
+        job_id = jobs.enqueue(db, user, "https://www.amazon.com/dp/B000000001", max_attempts=2).id
+        jobs.claim(db, "crashed-worker")
+    _expire_lease(sessions, job_id)
+    with sessions() as db:
+        job = jobs.claim(db, "worker-b")
+        assert job.lease_owner == "worker-b" and job.attempts == 2
+        # The first worker can no longer renew, complete or fail the job
+        assert not jobs.renew(db, job_id, "crashed-worker")
+        assert jobs.fail(db, job_id, "crashed-worker", "late") is None
+    _expire_lease(sessions, job_id)
+    with sessions() as db:
+        assert jobs.claim(db, "worker-c") is None
+        assert db.get(GenerationJob, job_id).status == jobs.DEAD
+
+
+def test_failed_jobs_back_off_and_are_dead_lettered(sessions, user):
+    with sessions() as db:
+        job_id = jobs.enqueue(db, user, "https://www.amazon.com/dp/B000000001", max_attempts=2).id
+        jobs.claim(db, "worker-a")
+        assert jobs.fail(db, job_id, "worker-a", "provider down", backoff_seconds=60) == jobs.QUEUED
+        # Not due again until the backoff has passed
+        assert jobs.claim(db, "worker-a") is None
+        db.get(GenerationJob, job_id).available_at = datetime.datetime.utcnow()
+        db.commit()
+        jobs.claim(db, "worker-a")
+        assert jobs.fail(db, job_id, "worker-a", "provider down") == jobs.DEAD
+        assert db.get(GenerationJob, job_id, populate_existing=True).error == "provider down"
+
+
+def test_worker_runs_a_job_and_records_history(sessions, user):
+    calls = []
+
+    def generate(url, force_refresh=False, timeout=None, cancel=None):
+        calls.append((url, force_refresh))
+        return LISTING
+
+    with sessions() as db:
+        job_id = jobs.enqueue(db, user, "https://www.amazon.com/dp/B000000001", force_refresh=True).id
+    worker = Worker(name="worker-a", session_factory=sessions, generate=generate)
+    assert worker.run_once()
+    assert not worker.run_once()
+
+    assert calls == [("https://www.amazon.com/dp/B000000001", True)]
+    with sessions() as db:
+        job = db.get(GenerationJob, job_id)
+        assert job.force_refresh is True
+        assert job.status == jobs.COMPLETED and job.lease_owner is None
+        assert '"titles": ["Generated Title"]' in job.result
+        assert [item.title for item in db.query(GenerationHistory).all()] == ["Generated Title"]
+
+
+def test_worker_retries_unstructured_results(sessions, user):
+    with sessions() as db:
+        job_id = jobs.enqueue(db, user, "https://www.amazon.com/dp/B000000001").id
+    worker = Worker(name="worker-a", session_factory=sessions, generate=lambda url, **kwargs: {"raw_output": "?"})
+    worker.run_once()
+    with sessions() as db:
+        job = db.get(GenerationJob, job_id)
+        assert job.status == jobs.QUEUED and job.attempts == 1
+        assert job.error == "Failed to get structured data from ListingCrew."
+
+
+def test_stopping_worker_hands_its_job_back(sessions, user):
+    def generate(url, force_refresh=False, timeout=None, cancel=None):
+        worker.stop()
+        assert cancel.wait(5)
+        raise RuntimeError("Generation cancelled")
+
+    with sessions() as db:
+        job_id = jobs.enqueue(db, user, "https://www.amazon.com/dp/B000000001").id
+    worker = Worker(name="worker-a", session_factory=sessions, generate=generate, poll_seconds=0.01)
+    worker.run_once()
+    with sessions() as db:
+        job = db.get(GenerationJob, job_id)
+        assert job.status == jobs.QUEUED and job.attempts == 0 and job.lease_owner is None
+
+
+def test_jobs_endpoints(client, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = client.post("/api/v1/jobs", headers=headers, json={"url": "https://www.example.com"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued" and job["url"] == "https://www.example.com" and job["result"] is None
+
+    response = client.get(f"/api/v1/jobs/{job['id']}", headers=headers)
+    assert response.status_code == 200 and response.json()["id"] == job["id"]
+    assert client.get("/api/v1/jobs/9999", headers=headers).status_code == 404
+    assert client.post("/api/v1/jobs", headers=headers, json={"url": "not a url"}).status_code == 400
@@ -0,0 +1,61 @@
+import time
+
+from src.ListingCrew.tools.keywords import KeywordIndex, keyword_table, format_keyword_table, phrases, segments
+
+PRODUCT = {"title": "Patella Knee Strap for Running and Basketball",
+           "description": ["Adjustable knee strap relieves tendonitis pain", "Breathable neoprene, fits either knee"],
+           "category": "Sports & Outdoors"}
+COMPETITORS = [
+    {"title": "Knee Strap 2 Pack for Tendonitis Pain Relief", "category": "Sports & Outdoors",
+     "highlights": ["Patella tendon support for running", "Best gift for athletes"]},
+    {"title": "Knee Brace Compression Sleeve", "category": "Health & Household",
+     "highlights": ["Knee pain relief for running and hiking"]},
+]
+
+
+def test_phrases_skip_stopword_edges_and_filler():
+    assert list(phrases(["strap", "for", "running"])) == ["strap", "strap for running", "running"]
+    assert "best gift" not in list(phrases(["best", "gift"]))
+
+def test_phrases_do_not_cross_bullets_or_sentences():
+    assert segments("Knee strap. Fits either knee\nBreathable neoprene, washable") == [
+        ["knee", "strap"], ["fits", "either", "knee"], ["breathable", "neoprene"], ["washable"]]
+
+def test_index_counts_phrases_per_listing():
+    index = KeywordIndex(["knee strap knee", "knee sleeve"], max_ngram=2)
+    column = list(index.phrases).index("knee")
+    assert index.counts[:, column].tolist() == [2, 1]
+    assert index.document_frequency()[column] == 2
+    assert (index.bm25_tf() <= 2.2).all()   # saturates at k1 + 1
+
+def test_keyword_table_ranks_shared_phrases_first():
+    table = keyword_table(PRODUCT, COMPETITORS)
+    short = [row["phrase"] for row in table["short_tail"]]
+    assert short[0] == "knee"
+    assert short.index("knee strap") < short.index("knee brace")
+    relief = next(row for row in table["short_tail"] if row["phrase"] == "pain relief")
+    assert relief == {"phrase": "pain relief", "score": relief["score"], "listings": 2, "in_product": False}
+    assert all(row["phrase"].count(" ") >= 2 for row in table["long_tail"])
+    assert "best gift" not in short and "gift" not in short
+
+def test_keyword_table_is_deterministic():
+    assert keyword_table(PRODUCT, COMPETITORS) == keyword_table(PRODUCT, COMPETITORS)
+
+def test_contained_phrase_with_the_same_reach_is_dropped():
+    table = keyword_table({"title": "Neoprene sleeve"}, [])
+    assert [row["phrase"] for row in table["short_tail"]] == ["neoprene sleeve"]
+
+def test_keyword_table_handles_empty_listings():
+    assert keyword_table({}, []) == {"listings": 1, "short_tail": [], "long_tail": []}
+
+def test_keyword_table_is_fast_for_a_competitor_set():
+    competitors = [dict(COMPETITORS[index % 2], title=f"{COMPETITORS[index % 2]['title']} model {index}")
+                   for index in range(20)]
+    started = time.perf_counter()
+    keyword_table(PRODUCT, competitors)
+    assert time.perf_counter() - started < 0.5
+
+def test_format_keyword_table():
+    text = format_keyword_table(keyword_table(PRODUCT, COMPETITORS, limit=3))
+    assert text.splitlines()[0].startswith("Computed from 3 listing(s)")
+    assert "- knee | " in text and "| 3 | yes" in text
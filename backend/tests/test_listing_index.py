@@ -0,0 +1,144 @@
+import os
+import numpy as np
+
+from src.ListingCrew.tools.embeddings import normalize
+from src.ListingCrew.tools.listing_index import HNSWIndex, ListingIndex, listing_summary
+
+KNEE = {"url": "https://www.amazon.com/dp/B000000001", "title": "Knee Brace", "category": "Sports",
+        "description": ["Compression sleeve for knee pain", "Fits running and basketball"]}
+BLENDER = {"url": "https://www.amazon.com/dp/B000000002", "title": "Countertop Blender", "category": "Kitchen",
+           "highlights": ["Crushes ice for smoothies"]}
+
+
+class TopicEmbedder:
+    """Three-dimensional 'embeddings': how much a text is about knees, blenders and ice."""
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [[text.lower().count(word) + 0.01 for word in ("knee", "blender", "ice")] for text in texts]
+
+
+def test_hnsw_search_agrees_with_exact_search():
+    rng = np.random.default_rng(7)
+    vectors = normalize(rng.normal(size=(600, 24)).astype(np.float32))
+    index = HNSWIndex(24, m=8, ef_construction=64)
+    for vector in vectors:
+        index.add(vector)
+
+    queries = normalize(rng.normal(size=(20, 24)).astype(np.float32))
+    recall = []
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:10].tolist())
+        found = {node for _, node in index.search(query, 10, ef=64)}
+        recall.append(len(exact & found) / 10)
+    assert np.mean(recall) >= 0.9
+
+
+def test_hnsw_graph_roundtrips_through_arrays():
+    rng = np.random.default_rng(3)
+    index = HNSWIndex(8, m=4)
+    for vector in normalize(rng.normal(size=(50, 8)).astype(np.float32)):
+        index.add(vector)
+    index.deleted.add(5)
+
+    copy = HNSWIndex.from_arrays(index.to_arrays())
+    query = normalize(rng.normal(size=(1, 8)).astype(np.float32))[0]
+    assert copy.search(query, 5) == index.search(query, 5)
+    assert all(node != 5 for _, node in copy.search(query, 50, ef=100))
+
+
+def test_similar_listings_exclude_the_product_itself():
+    index = ListingIndex(path=None, embedder=TopicEmbedder(), model="topics")
+    index.add([KNEE, BLENDER])
+
+    similar = index.similar(dict(KNEE, title="Knee Sleeve"), k=5, threshold=0.5)
+    assert [listing["title"] for listing in similar] == []
+    similar = index.similar({"url": "https://www.amazon.com/dp/B000000009", "title": "Knee Support"}, k=5,
+                            threshold=0.5)
+    assert [listing["title"] for listing in similar] == ["Knee Brace"]
+    assert similar[0]["highlights"] == KNEE["description"]
+
+
+def test_listings_are_embedded_once_and_replaced_when_changed(tmp_path):
+    path = str(tmp_path / "listings.npz")
+    embedder = TopicEmbedder()
+    index = ListingIndex(path=path, embedder=embedder, model="topics", compact_ratio=0.5)
+    assert index.add([KNEE, BLENDER]) == 2
+    assert index.add([KNEE]) == 0
+    assert index.add([dict(BLENDER, title="Countertop Blender for Ice")]) == 1
+    assert len(embedder.texts) == 3
+    assert index.stats()["listings"] == 2 and index.stats()["nodes"] == 3
+
+    # A new process loads the index from disk and sees only the latest version of each product
+    reloaded = ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")
+    assert len(reloaded) == 2
+    similar = reloaded.similar({"url": "https://www.amazon.com/dp/B000000009", "title": "Ice"}, k=5, threshold=0.5)
+    assert [listing["title"] for listing in similar] == ["Countertop Blender for Ice"]
+    # An index embedded with another model is not reused
+    assert len(ListingIndex(path=path, embedder=TopicEmbedder(), model="other")) == 0
+
+
+def test_processes_sharing_an_index_file_keep_each_others_listings(tmp_path):
+    path = str(tmp_path / "listings.npz")
+    first = ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")
+    second = ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")
+    first.add([KNEE])
+    second.add([BLENDER])
+    # The second save merged onto the first instead of overwriting it, and the first picks it up
+    assert len(ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")) == 2
+    similar = first.similar({"url": "https://www.amazon.com/dp/B000000009", "title": "Blender"}, k=5, threshold=0.5)
+    assert [listing["title"] for listing in similar] == ["Countertop Blender"]
+    assert first.stats()["reloads"] == 1
+
+
+def test_replaced_listings_are_compacted_away(tmp_path):
+    index = ListingIndex(path=str(tmp_path / "listings.npz"), embedder=TopicEmbedder(), model="topics",
+                         compact_ratio=0.4)
+    index.add([KNEE, BLENDER])
+    index.add([dict(KNEE, title="Knee Brace v2")])
+    assert index.stats()["nodes"] == 3
+    index.add([dict(KNEE, title="Knee Brace v3")])
+    # Two tombstones out of four nodes: the graph is rebuilt from the live listings
+    assert index.stats()["compactions"] == 1
+    assert index.stats()["nodes"] == 2 and not index.graph.deleted
+    similar = index.similar({"url": "https://www.amazon.com/dp/B000000009", "title": "Knee"}, k=5, threshold=0.5)
+    assert [listing["title"] for listing in similar] == ["Knee Brace v3"]
+    assert len(ListingIndex(path=index.path, embedder=TopicEmbedder(), model="topics").graph) == 2
+
+
+def test_inserts_are_journaled_and_checkpointed_into_the_snapshot(tmp_path):
+    path = str(tmp_path / "listings.npz")
+    index = ListingIndex(path=path, embedder=TopicEmbedder(), model="topics", checkpoint_every=3)
+    index.add([KNEE])
+    index.add([BLENDER])
+    # Each insert appended one journal line; the snapshot was never written
+    assert not os.path.exists(path)
+    assert len(open(f"{path}.journal", "rb").read().splitlines()) == 2
+    assert len(ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")) == 2
+
+    index.add([dict(KNEE, url="https://www.amazon.com/dp/B000000003", title="Knee Sleeve")])
+    assert index.stats()["checkpoints"] == 1
+    assert os.path.exists(path) and os.path.getsize(f"{path}.journal") == 0
+    assert len(ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")) == 3
+
+
+def test_a_torn_journal_line_is_dropped(tmp_path):
+    path = str(tmp_path / "listings.npz")
+    ListingIndex(path=path, embedder=TopicEmbedder(), model="topics").add([KNEE])
+    with open(f"{path}.journal", "ab") as file:
+        file.write(b'{"model": "topics", "key": "B0000')
+    index = ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")
+    assert len(index) == 1
+    index.add([BLENDER])
+    assert len(ListingIndex(path=path, embedder=TopicEmbedder(), model="topics")) == 2
+
+
+def test_database_rows_are_summarised_like_competitors():
+    row = {"ASIN": "B000000003", "Title": "Ankle Brace", "Description": "Stabilises sprains\nBreathable",
+           "Category": "Sports"}
+    summary = listing_summary(row)
+    assert summary["url"].endswith("/dp/B000000003")
+    assert summary["highlights"] == ["Stabilises sprains", "Breathable"]
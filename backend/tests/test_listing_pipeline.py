@@ -0,0 +1,365 @@
+import os
+import json
+import time
+import threading
+import pytest
+import yaml
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from src.ListingCrew import main as listing_main
+from src.ListingCrew import result_cache
+from src.ListingCrew import research
+from src.ListingCrew import checkpoints
+from src.ListingCrew import llm_router
+from src.ListingCrew.factory import CrewFactory
+from src.ListingCrew.tools import listing_index
+
+PRODUCT = {"title": "Knee Brace", "description": ["Relieves knee pain"], "category": "Sports",
+           "color": None, "size": None, "count": None}
+LISTING = {"title": "Generated Title", "description": "Generated Description",
+           "bullet_points": ["Point 1"], "keywordsReport": "Keywords"}
+
+@pytest.fixture(autouse=True)
+def memory_result_cache(monkeypatch):
+    """A fresh, memory-only listing cache per test."""
+    cache = result_cache.ResultCache(path=None)
+    monkeypatch.setattr(result_cache.get_result_cache, "instance", cache)
+    return cache
+
+@pytest.fixture(autouse=True)
+def memory_checkpoints(monkeypatch):
+    """A fresh, memory-only checkpoint store per test."""
+    store = checkpoints.CheckpointStore(path=None)
+    monkeypatch.setattr(checkpoints.get_checkpoint_store, "instance", store)
+    return store
+
+def word_vectors(texts):
+    """Deterministic bag-of-words 'embeddings' for the listing index."""
+    vectors = []
+    for text in texts:
+        vector = [0.0] * 32
+        for word in text.lower().split():
+            vector[sum(map(ord, word)) % 32] += 1.0
+        vectors.append(vector)
+    return vectors
+
+@pytest.fixture(autouse=True)
+def memory_listing_index(monkeypatch):
+    """A fresh, memory-only listing index per test."""
+    index = listing_index.ListingIndex(path=None, embedder=word_vectors, model="words")
+    monkeypatch.setattr(listing_index.get_listing_index, "instance", index)
+    return index
+
+def _crew_result(*raws):
+    result = MagicMock()
+    result.tasks_output = [MagicMock(raw=raw) for raw in raws]
+    result.raw = raws[-1] if raws else ""
+    return result
+
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_generate_listing_skips_scraper_agent_for_supported_sites(mock_scrape, mock_factory):
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = PRODUCT
+    crew = mock_factory.return_value.crew
+    crew.return_value.kickoff.return_value = _crew_result("research report", json.dumps(LISTING))
+
+    url = "https://www.amazon.com/dp/B07DLFP8Q5"
+    assert listing_main.generate_listing(url) == LISTING
+    crew.assert_called_once_with(prescraped=True, competitors=False, keywords=True)
+    inputs = crew.return_value.kickoff.call_args.kwargs["inputs"]
+    assert inputs["url"] == url and inputs["product"] == json.dumps(PRODUCT)
+    assert "- knee brace |" in inputs["keywords"]
+
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_generate_listing_falls_back_to_scraper_agent(mock_scrape, mock_factory):
+    mock_scrape.return_value.get_asin.return_value = None
+    crew = mock_factory.return_value.crew
+    crew.return_value.kickoff.return_value = _crew_result("scraped", "research report", "not json")
+
+    url = "https://www.example.com/product/1"
+    assert listing_main.generate_listing(url) == {"raw_output": "not json"}
+    crew.assert_called_once_with()
+    crew.return_value.kickoff.assert_called_once_with(inputs={"url": url})
+    mock_scrape.return_value.run.assert_not_called()
+
+@patch("src.ListingCrew.main.Scrape")
+def test_prescrape_product_rejects_pages_without_a_title(mock_scrape):
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = dict(PRODUCT, title=None)
+    assert listing_main.prescrape_product("https://www.amazon.com/dp/B07DLFP8Q5") is None
+
+@patch("src.ListingCrew.main._run_crew")
+def test_generate_listing_caches_by_product(mock_run_crew):
+    mock_run_crew.return_value = LISTING
+    assert listing_main.generate_listing("https://www.amazon.com/dp/B07DLFP8Q5") == LISTING
+    assert listing_main.generate_listing("https://www.amazon.ca/Knee-Brace/dp/B07DLFP8Q5?th=1") == LISTING
+    assert mock_run_crew.call_count == 1
+
+    listing_main.generate_listing("https://www.amazon.com/dp/B07DLFP8Q5", force_refresh=True)
+    assert mock_run_crew.call_count == 2
+
+    listing_main.invalidate_listing("https://www.amazon.com/dp/B07DLFP8Q5")
+    listing_main.generate_listing("https://www.amazon.com/dp/B07DLFP8Q5")
+    assert mock_run_crew.call_count == 3
+
+@patch("src.ListingCrew.main._run_crew")
+def test_generate_listing_does_not_cache_unstructured_output(mock_run_crew):
+    mock_run_crew.return_value = {"raw_output": "not json"}
+    listing_main.generate_listing("https://www.example.com/p/1")
+    listing_main.generate_listing("https://www.example.com/p/1")
+    assert mock_run_crew.call_count == 2
+
+def test_parse_competitor_urls_keeps_distinct_readable_products():
+    raw = json.dumps([
+        "https://www.amazon.com/dp/B07DLFP8Q5",        # the product itself
+        "https://www.amazon.com/dp/B000000001",
+        "https://www.amazon.ca/Other-Brace/dp/B000000001/",
+        "https://www.example.com/brace",
+        "https://www.amazon.com/dp/B000000002",
+        "https://www.amazon.com/dp/B000000003",
+    ])
+    assert research.parse_competitor_urls(raw, "https://www.amazon.com/dp/B07DLFP8Q5", limit=2) == [
+        "https://www.amazon.com/dp/B000000001", "https://www.amazon.com/dp/B000000002",
+    ]
+    text = "Try https://www.amazon.com/dp/B000000004, or https://www.amazon.com/dp/B000000005."
+    assert research.parse_competitor_urls(text, "https://www.amazon.com/dp/B07DLFP8Q5") == [
+        "https://www.amazon.com/dp/B000000004", "https://www.amazon.com/dp/B000000005",
+    ]
+
+@patch("src.ListingCrew.research.Scrape.scrape_many")
+@patch("src.ListingCrew.research.get_crew_factory")
+def test_research_competitors_scrapes_discovered_urls_concurrently(mock_factory, mock_scrape_many):
+    urls = ["https://www.amazon.com/dp/B000000001", "https://www.amazon.com/dp/B000000002"]
+    discovery = mock_factory.return_value.discovery_crew
+    discovery.return_value.kickoff.return_value = _crew_result(json.dumps(urls))
+    mock_scrape_many.return_value = [
+        {"title": "Rival Brace", "category": "Sports", "description": ["Strap", " ", "Breathable", "Sizes", "Extra"]},
+        None,
+    ]
+
+    summaries = research.research_competitors("https://www.amazon.com/dp/B07DLFP8Q5", PRODUCT, concurrency=3)
+    assert summaries == [{"url": urls[0], "title": "Rival Brace", "category": "Sports",
+                          "highlights": ["Strap", "Breathable", "Sizes"]}]
+    mock_scrape_many.assert_called_once_with(urls, concurrency=3, per_host=3)
+
+@patch("src.ListingCrew.research.get_crew_factory")
+def test_research_competitors_survives_discovery_failure(mock_factory):
+    mock_factory.return_value.discovery_crew.return_value.kickoff.side_effect = RuntimeError("rate limited")
+    assert research.research_competitors("https://www.amazon.com/dp/B07DLFP8Q5", PRODUCT) == []
+
+@patch("src.ListingCrew.main.research_competitors")
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_generate_listing_fanout_merges_competitors_into_research(mock_scrape, mock_factory, mock_research):
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = PRODUCT
+    competitors = [{"url": "https://www.amazon.com/dp/B000000001", "title": "Rival Brace",
+                    "category": "Sports", "highlights": []}]
+    mock_research.return_value = competitors
+    crew = mock_factory.return_value.crew
+    crew.return_value.kickoff.return_value = _crew_result("research report", json.dumps(LISTING))
+
+    url = "https://www.amazon.com/dp/B07DLFP8Q5"
+    assert listing_main.generate_listing(url, research_mode="fanout") == LISTING
+    crew.assert_called_once_with(prescraped=True, competitors=True, keywords=True)
+    inputs = crew.return_value.kickoff.call_args.kwargs["inputs"]
+    assert inputs["competitors"] == json.dumps(competitors)
+    # The competitor's listing is counted in the keyword table
+    assert "- brace | " in inputs["keywords"] and "Computed from 2 listing(s)" in inputs["keywords"]
+
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_generate_listing_without_keyword_table(mock_scrape, mock_factory, monkeypatch):
+    monkeypatch.setattr(listing_main, "KEYWORDS", False)
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = PRODUCT
+    crew = mock_factory.return_value.crew
+    crew.return_value.kickoff.return_value = _crew_result("research report", json.dumps(LISTING))
+
+    url = "https://www.amazon.com/dp/B07DLFP8Q5"
+    listing_main.generate_listing(url)
+    crew.assert_called_once_with(prescraped=True, competitors=False, keywords=False)
+    crew.return_value.kickoff.assert_called_once_with(inputs={"url": url, "product": json.dumps(PRODUCT)})
+
+@patch("src.ListingCrew.main.research_competitors")
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_similar_indexed_listings_replace_web_research(mock_scrape, mock_factory, mock_research,
+                                                      memory_listing_index, monkeypatch):
+    monkeypatch.setattr(listing_main, "SIMILAR_LISTINGS", True)
+    monkeypatch.setattr(listing_main, "SIMILAR_LIMIT", 1)
+    memory_listing_index.add([
+        {"url": "https://www.amazon.com/dp/B000000001", "title": "Knee Brace Support",
+         "category": "Sports", "highlights": ["Relieves knee pain"]},
+        {"url": "https://www.amazon.com/dp/B000000002", "title": "Countertop Blender",
+         "category": "Kitchen", "highlights": ["Crushes ice"]},
+    ])
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = PRODUCT
+    crew = mock_factory.return_value.crew
+    crew.return_value.kickoff.return_value = _crew_result("research report", json.dumps(LISTING))
+
+    url = "https://www.amazon.com/dp/B07DLFP8Q5"
+    assert listing_main.generate_listing(url, research_mode="fanout") == LISTING
+    mock_research.assert_not_called()
+    crew.assert_called_once_with(prescraped=True, competitors=True, keywords=True)
+    competitors = json.loads(crew.return_value.kickoff.call_args.kwargs["inputs"]["competitors"])
+    assert [competitor["title"] for competitor in competitors] == ["Knee Brace Support"]
+    # The product itself is indexed for later generations
+    assert memory_listing_index.stats()["listings"] == 3
+
+def test_generate_listing_rejects_unknown_research_mode():
+    with pytest.raises(ValueError):
+        listing_main.generate_listing("https://www.amazon.com/dp/B07DLFP8Q5", research_mode="swarm")
+
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_generate_listing_reports_progress(mock_scrape, mock_factory):
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = PRODUCT
+    crew = mock_factory.return_value.crew.return_value
+    crew.tasks = [MagicMock(id="research"), MagicMock(id="writing")]
+
+    def kickoff(inputs):
+        from crewai.events import crewai_event_bus, LLMStreamChunkEvent
+        crew.task_callback(SimpleNamespace(name="research_task", raw="report"))
+        crewai_event_bus.emit(None, LLMStreamChunkEvent(chunk="ignored", call_id="1", task_id="research"))
+        crewai_event_bus.emit(None, LLMStreamChunkEvent(chunk="Gen", call_id="2", task_id="writing"))
+        crew.task_callback(SimpleNamespace(name="writing_task", raw=json.dumps(LISTING)))
+        return _crew_result("report", json.dumps(LISTING))
+
+    crew.kickoff.side_effect = kickoff
+    events = []
+    listing_main.generate_listing("https://www.amazon.com/dp/B07DLFP8Q5", on_event=lambda *event: events.append(event))
+    assert [name for name, _ in events] == ["scrape_done", "keywords_done", "research_done", "token", "writing_done"]
+    assert events[3][1] == {"text": "Gen"}
+    assert crew.tasks[-1].agent.llm.stream is True
+
+    events.clear()
+    listing_main.generate_listing("https://www.amazon.com/dp/B07DLFP8Q5", on_event=lambda *event: events.append(event))
+    assert events == [("cache_hit", {})]
+
+def _task_crew(*names):
+    crew = MagicMock()
+    crew.task_callback = None
+    crew.tasks = [MagicMock(description=f"{name} description") for name in names]
+    for task, name in zip(crew.tasks, names):
+        task.name = name
+    return crew
+
+@patch("src.ListingCrew.main.get_crew_factory")
+@patch("src.ListingCrew.main.Scrape")
+def test_failed_generation_resumes_from_the_failed_task(mock_scrape, mock_factory, memory_checkpoints):
+    mock_scrape.return_value.get_asin.return_value = "B07DLFP8Q5"
+    mock_scrape.return_value.run.return_value = PRODUCT
+    first, retry = _task_crew("research_task", "writing_task"), _task_crew("research_task", "writing_task")
+    mock_factory.return_value.crew.side_effect = [first, retry]
+
+    def failing_kickoff(inputs):
+        first.task_callback(SimpleNamespace(name="research_task", raw="paid research report"))
+        first.task_callback(SimpleNamespace(name="writing_task", raw="not json"))
+        return _crew_result("paid research report", "not json")
+
+    first.kickoff.side_effect = failing_kickoff
+    retry.kickoff.return_value = _crew_result(json.dumps(LISTING))
+
+    url = "https://www.amazon.com/dp/B07DLFP8Q5"
+    assert listing_main.generate_listing(url) == {"raw_output": "not json"}
+    assert set(memory_checkpoints.load(checkpoints.generation_id(url))) == {"research_task"}
+
+    events = []
+    assert listing_main.generate_listing(url, on_event=lambda *event: events.append(event)) == LISTING
+    assert [task.name for task in retry.tasks] == ["writing_task"]
+    assert retry.tasks[0].description.startswith(checkpoints.RESUME_CONTEXT)
+    assert retry.kickoff.call_args.kwargs["inputs"]["resumed_context"] == "paid research report"
+    assert ("resumed", {"generation_id": checkpoints.generation_id(url), "skipped": ["research_task"]}) in events
+    # A successful run drops its checkpoints
+    assert memory_checkpoints.load(checkpoints.generation_id(url)) == {}
+    assert memory_checkpoints.stats() == {"runs": 2, "resumed": 1, "tasks_run": 3, "tasks_skipped": 1}
+
+def test_resume_crew_keeps_the_last_task_and_stops_at_the_first_gap():
+    crew = _task_crew("scraping_task", "research_task", "writing_task")
+    skipped, context = checkpoints.resume_crew(crew, {"scraping_task": "page", "writing_task": "bad"})
+    assert skipped == ["scraping_task"] and context == "page"
+    assert [task.name for task in crew.tasks] == ["research_task", "writing_task"]
+
+    crew = _task_crew("research_task", "writing_task")
+    assert checkpoints.resume_crew(crew, {"writing_task": "bad"}) == ([], None)
+    assert len(crew.tasks) == 2
+
+def test_checkpoint_store_persists_across_instances(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite3")
+    checkpoints.CheckpointStore(path).save("gen-1", "scraping_task", "page")
+    checkpoints.CheckpointStore(path).save("gen-1", "research_task", "report")
+    assert checkpoints.CheckpointStore(path).load("gen-1") == {"scraping_task": "page", "research_task": "report"}
+    checkpoints.CheckpointStore(path).clear("gen-1")
+    assert checkpoints.CheckpointStore(path).load("gen-1") == {}
+
+def test_result_cache_persists_and_keys_on_config(tmp_path, monkeypatch):
+    path = str(tmp_path / "listings.sqlite3")
+    result_cache.ResultCache(path).set("https://www.amazon.com/dp/B07DLFP8Q5", LISTING)
+    assert result_cache.ResultCache(path).get("https://www.amazon.com/dp/B07DLFP8Q5") == LISTING
+
+    monkeypatch.setattr(result_cache, "config_fingerprint", lambda: "changed-prompts")
+    assert result_cache.ResultCache(path).get("https://www.amazon.com/dp/B07DLFP8Q5") is None
+
+def test_crew_factory_builds_isolated_crews_from_parsed_configs():
+    factory = CrewFactory()
+    factory._tools = []
+    llm_router.load_routes()   # parsed once per process, like the crew configs
+    with patch("src.ListingCrew.factory.yaml.safe_load", wraps=yaml.safe_load) as mock_load:
+        first = factory.crew()
+        second = factory.crew()
+        prescraped = factory.crew(prescraped=True)
+        fanout = factory.crew(prescraped=True, competitors=True)
+        keywords = factory.crew(prescraped=True, keywords=True)
+        discovery = factory.discovery_crew()
+    assert mock_load.call_count == 2
+    assert [task.name for task in first.tasks] == ["scraping_task", "research_task", "writing_task"]
+    assert [task.name for task in prescraped.tasks] == ["research_task", "writing_task"]
+    assert "{competitors}" in fanout.tasks[0].description
+    assert "{competitors}" not in prescraped.tasks[0].description
+    # The keyword table goes to the writer only, and replaces the researcher's keyword work
+    assert [("{keywords}" in task.description) for task in keywords.tasks] == [False, True]
+    assert "keywords" not in keywords.tasks[0].expected_output
+    assert keywords.agents[0].max_iter == 1 and prescraped.agents[0].max_iter == 2
+    assert not any("{keywords}" in task.description for task in prescraped.tasks)
+    assert [task.name for task in discovery.tasks] == ["competitor_discovery_task"]
+    assert not set(map(id, first.agents)) & set(map(id, second.agents))
+    assert not set(map(id, first.tasks)) & set(map(id, second.tasks))
+
+class RenamedMemoCache:
+    """crewai's memo cache as another release might have it: same read/add, a different kind of lock."""
+
+    def __init__(self):
+        self.entries = {}
+        self._cache = self.entries
+        self._lock = threading.Lock()
+
+    def read(self, tool, input):
+        return self.entries.get((tool, input))
+
+    def add(self, tool, input, output):
+        self.entries[tool, input] = output
+
+def test_crew_factory_survives_a_different_crewai_memo_cache():
+    factory = CrewFactory()
+    factory._tools = []
+    # Crews are still built; their memoized members are just not released
+    with patch("crewai.project.utils.cache", RenamedMemoCache()):
+        assert [task.name for task in factory.crew().tasks] == ["scraping_task", "research_task", "writing_task"]
+
+def test_crew_factory_reloads_changed_yaml(tmp_path):
+    config = tmp_path / "agents.yaml"
+    config.write_text("writer:\n  llm: groq/llama3-8b-8192\n")
+    factory = CrewFactory()
+    loaded = factory.load_yaml(config)
+    loaded["writer"]["llm"] = "mutated by a crew"
+    assert factory.load_yaml(config)["writer"]["llm"] == "groq/llama3-8b-8192"
+
+    config.write_text("writer:\n  llm: openai/gpt-4o-mini\n")
+    os.utime(config, (time.time() + 5, time.time() + 5))
+    assert factory.load_yaml(config)["writer"]["llm"] == "openai/gpt-4o-mini"
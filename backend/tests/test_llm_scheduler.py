@@ -0,0 +1,395 @@
+import asyncio
+import time
+import threading
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from src.ListingCrew import completion_cache
+from src.ListingCrew.completion_cache import CompletionCache, CompletionCacheMiss, completion_key, refresh_completions
+from src.ListingCrew.llm_scheduler import LLMScheduler, schedule_llm, is_rate_limit_error
+from src.ListingCrew.llm_router import LLMRouter, Route, route_llm, load_routes
+from src.ListingCrew.tools.http_scheduler import TokenBucket
+from src.ListingCrew.deadlines import GenerationCancelled, generation_deadline
+from src.ListingCrew.progress import stream_crew_progress
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("rate limited")
+        self.response = MagicMock(headers={"retry-after": retry_after} if retry_after else {})
+
+
+@pytest.fixture(autouse=True)
+def no_default_completion_cache(monkeypatch):
+    """Keep tests from recording into the process-wide completion cache."""
+    monkeypatch.setattr(completion_cache.get_completion_cache, "instance", CompletionCache(None, mode="off"))
+
+
+class FakeLLM:
+    """Stands in for a crewai LLM: same call signature, counts provider requests."""
+
+    def __init__(self, model="groq/llama3-8b-8192", temperature=0.7, reply="listing"):
+        self.model = model
+        self.temperature = temperature
+        self.reply = reply
+        self.requests = 0
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None,
+             from_task=None, from_agent=None, response_model=None):
+        self.requests += 1
+        return self.reply
+
+    async def acall(self, messages, tools=None, callbacks=None, available_functions=None,
+                    from_task=None, from_agent=None, response_model=None):
+        self.requests += 1
+        return self.reply
+
+
+def _scheduler(**kwargs):
+    defaults = dict(limits={"groq": {"rpm": 6000, "tpm": 10_000_000}}, headroom=1.0,
+                    backoff_base=0.01, backoff_max=1.0, completion_estimate=0)
+    defaults.update(kwargs)
+    return LLMScheduler(**defaults)
+
+
+def test_rate_limit_errors_are_retried_after_retry_after():
+    scheduler = _scheduler()
+    send = MagicMock(side_effect=[RateLimitError(retry_after="0"), "ok"])
+    assert scheduler.call("groq/llama3-8b-8192", "hello", send) == "ok"
+    assert send.call_count == 2
+    stats = scheduler.stats()["groq/llama3-8b-8192"]
+    assert stats["rate_limited"] == 1 and stats["retries"] == 1
+
+def test_other_errors_and_exhausted_retries_are_raised():
+    scheduler = _scheduler(max_retries=1)
+    with pytest.raises(ValueError):
+        scheduler.call("groq/llama3-8b-8192", "hello", MagicMock(side_effect=ValueError("bad request")))
+    with pytest.raises(RateLimitError):
+        scheduler.call("groq/llama3-8b-8192", "hello", MagicMock(side_effect=RateLimitError()))
+    assert scheduler.stats()["groq/llama3-8b-8192"]["failures"] == 2
+
+def test_cancelled_generations_make_no_further_calls():
+    scheduler = _scheduler()
+    send = MagicMock(return_value="ok")
+    cancel = threading.Event()
+    with generation_deadline(cancel=cancel):
+        assert scheduler.call("groq/llama3-8b-8192", "hello", send) == "ok"
+        cancel.set()
+        with pytest.raises(GenerationCancelled):
+            scheduler.call("groq/llama3-8b-8192", "hello", send)
+    with generation_deadline(timeout=0):
+        with pytest.raises(GenerationCancelled):
+            asyncio.run(scheduler.acall("groq/llama3-8b-8192", "hello", send))
+    assert send.call_count == 1
+
+def test_retry_after_pauses_every_caller_of_the_model():
+    scheduler = _scheduler(backoff_max=0.3)
+    started = time.monotonic()
+    scheduler.call("groq/llama3-8b-8192", "hello", MagicMock(side_effect=[RateLimitError(retry_after="5"), "ok"]))
+    assert time.monotonic() - started >= 0.25   # Retry-After, capped at backoff_max
+
+    # A different generation arriving during a pause waits it out too
+    scheduler.budget("groq/llama3-8b-8192").pause(0.3)
+    started = time.monotonic()
+    scheduler.call("groq/llama3-8b-8192", "hello", lambda: "ok")
+    assert time.monotonic() - started >= 0.25
+
+def test_token_budget_throttles_large_prompts():
+    scheduler = _scheduler(limits={"groq": {"rpm": 6000, "tpm": 600}})
+    prompt = "x" * 4 * 600   # one minute's worth of tokens
+    scheduler.call("groq/llama3-8b-8192", prompt, lambda: "ok")
+    started = time.monotonic()
+    scheduler.call("groq/llama3-8b-8192", "x" * 4 * 5, lambda: "ok")   # 5 tokens at 10 tokens/s
+    assert 0.3 <= time.monotonic() - started < 2.0
+
+def test_unlimited_models_pass_straight_through():
+    scheduler = _scheduler()
+    assert scheduler.budget("anthropic/claude") is None
+    assert scheduler.call("anthropic/claude", "hello", lambda: "ok") == "ok"
+
+def test_token_bucket_serves_waiters_in_arrival_order():
+    bucket = TokenBucket(rate=20, capacity=1)
+    bucket.acquire()
+    order = []
+
+    def worker(index):
+        bucket.acquire()
+        order.append(index)
+
+    threads = []
+    for index in range(4):
+        thread = threading.Thread(target=worker, args=(index,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.005)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
+
+def test_async_calls_wait_without_blocking_the_loop():
+    scheduler = _scheduler(limits={"groq": {"rpm": 600, "tpm": 10_000_000}})   # 10 requests/s, burst 100
+    scheduler.budget("groq/llama3-8b-8192").requests.pause(0.2)
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    async def send():
+        return "ok"
+
+    async def main():
+        return await asyncio.gather(scheduler.acall("groq/llama3-8b-8192", "hello", send), ticker())
+
+    result, _ = asyncio.run(main())
+    assert result == "ok"
+    assert len(ticks) == 5
+
+def test_schedule_llm_wraps_instance_calls():
+    scheduler = _scheduler()
+    llm = MagicMock(model="llama3-8b-8192", provider="groq")
+    llm.call.side_effect = [RateLimitError(retry_after="0"), "listing"]
+    scheduled = schedule_llm(llm, scheduler)
+    assert scheduled.call([{"role": "user", "content": "hi"}], callbacks=[]) == "listing"
+    assert scheduler.stats()["groq/llama3-8b-8192"]["retries"] == 1
+
+def test_is_rate_limit_error_follows_the_cause_chain():
+    try:
+        try:
+            raise RateLimitError()
+        except RateLimitError as e:
+            raise RuntimeError("LLM call failed") from e
+    except RuntimeError as e:
+        assert is_rate_limit_error(e)
+    assert not is_rate_limit_error(ValueError("bad request"))
+
+def test_completion_key_normalizes_messages_and_keys_on_sampling():
+    messages = [{"role": "system", "content": "You write listings."}, {"role": "user", "content": "Knee brace\r\n"}]
+    same = [{"role": "system", "content": "  You write listings.  "}, {"role": "user", "content": "Knee brace"}]
+    key = completion_key("groq/llama3-8b-8192", messages, {"temperature": 0.7})
+    assert key == completion_key("groq/llama3-8b-8192", same, {"temperature": 0.7, "seed": None})
+    assert key != completion_key("groq/llama3-8b-8192", messages, {"temperature": 0.2})
+    assert key != completion_key("openai/gpt-4o-mini", messages, {"temperature": 0.7})
+
+def test_completion_cache_serves_repeats_without_calling_the_provider(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"))
+    scheduler = _scheduler()
+    llm = schedule_llm(FakeLLM(), scheduler, cache)
+    messages = [{"role": "user", "content": "Write a listing"}]
+    assert llm.call(messages, callbacks=[object()]) == "listing"
+    assert llm.call(messages, callbacks=[object()]) == "listing"
+    assert asyncio.run(llm.acall(messages)) == "listing"
+    assert llm.requests == 1
+    assert scheduler.stats()["groq/llama3-8b-8192"]["calls"] == 1
+    assert cache.stats() == {"mode": "read_write", "hits": 2, "misses": 1}
+
+    other = schedule_llm(FakeLLM(temperature=0.0), scheduler, cache)
+    other.call(messages)
+    assert other.requests == 1
+
+def test_completion_cache_replay_mode_fails_on_miss(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    recorder = schedule_llm(FakeLLM(), _scheduler(), CompletionCache(path))
+    recorder.call("Write a listing")
+
+    replayed = schedule_llm(FakeLLM(reply="live"), _scheduler(), CompletionCache(path, mode="replay"))
+    assert replayed.call("Write a listing") == "listing"
+    with pytest.raises(CompletionCacheMiss):
+        replayed.call("Write a different listing")
+    assert replayed.requests == 0
+
+def test_recorded_completions_expire_except_in_replay(tmp_path):
+    path = str(tmp_path / "completions.sqlite3")
+    schedule_llm(FakeLLM(), _scheduler(), CompletionCache(path)).call("Write a listing")
+    time.sleep(0.05)
+    live = schedule_llm(FakeLLM(reply="fresh listing"), _scheduler(), CompletionCache(path, ttl=0.01))
+    assert live.call("Write a listing") == "fresh listing"
+    # Replay serves recordings however old they are
+    replayed = schedule_llm(FakeLLM(), _scheduler(), CompletionCache(path, mode="replay", ttl=0.01))
+    assert replayed.call("Write a listing") == "fresh listing"
+
+def test_completion_cache_skips_structured_results(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"))
+    llm = schedule_llm(FakeLLM(reply={"tool_calls": []}), _scheduler(), cache)
+    llm.call("Use a tool")
+    llm.call("Use a tool")
+    assert llm.requests == 2
+
+def test_refresh_completions_re_requests_and_re_records(tmp_path):
+    cache = CompletionCache(str(tmp_path / "completions.sqlite3"))
+    llm = schedule_llm(FakeLLM(), _scheduler(), cache)
+    llm.call("Write a listing")
+    llm.reply = "better listing"
+    with refresh_completions():
+        assert llm.call("Write a listing") == "better listing"
+    assert llm.call("Write a listing") == "better listing"
+    assert llm.requests == 2
+
+class SlowLLM(FakeLLM):
+    def __init__(self, model, delay=0.0, reply="listing", error=None):
+        super().__init__(model=model, reply=reply)
+        self.delay = delay
+        self.error = error
+
+    def call(self, messages, **kwargs):
+        time.sleep(self.delay)
+        self.requests += 1
+        if self.error:
+            raise self.error
+        return self.reply
+
+
+def _router(**kwargs):
+    defaults = dict(min_samples=3, min_hedge_delay=0.0)
+    defaults.update(kwargs)
+    return LLMRouter(**defaults)
+
+
+def test_fast_primary_is_not_hedged():
+    router = _router()
+    primary, fallback = SlowLLM("groq/llama3-8b-8192"), SlowLLM("openai/gpt-4o-mini", reply="fallback")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=1.0), router)
+    assert llm.call("Write a listing") == "listing"
+    assert fallback.requests == 0
+    assert router.stats()["stages"]["writer"] == {"calls": 1, "hedged": 0, "fallback_used": 0, "failed": 0}
+
+def test_slow_primary_is_hedged_and_first_valid_response_wins():
+    router = _router()
+    primary = SlowLLM("groq/llama3-8b-8192", delay=0.5)
+    fallback = SlowLLM("openai/gpt-4o-mini", reply="fallback")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=0.05), router)
+    started = time.monotonic()
+    assert llm.call("Write a listing") == "fallback"
+    assert time.monotonic() - started < 0.4
+    assert router.stats()["stages"]["writer"]["hedged"] == 1
+    assert router.stats()["stages"]["writer"]["fallback_used"] == 1
+
+def test_failing_primary_falls_back_immediately():
+    router = _router()
+    primary = SlowLLM("groq/llama3-8b-8192", error=RuntimeError("503"))
+    fallback = SlowLLM("openai/gpt-4o-mini", reply="fallback")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=5.0), router)
+    started = time.monotonic()
+    assert llm.call("Write a listing") == "fallback"
+    assert time.monotonic() - started < 1.0
+
+def test_both_failing_raises_the_first_error():
+    router = _router()
+    primary = SlowLLM("groq/llama3-8b-8192", error=RuntimeError("primary down"))
+    fallback = SlowLLM("openai/gpt-4o-mini", delay=0.05, error=RuntimeError("fallback down"))
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=5.0), router)
+    with pytest.raises(RuntimeError, match="primary down"):
+        llm.call("Write a listing")
+    assert router.stats()["stages"]["writer"]["failed"] == 1
+
+def test_degraded_primary_loses_the_lead():
+    router = _router()
+    for _ in range(3):
+        router.model_stats("writer", "groq/llama3-8b-8192").record(1.0, False)
+    primary = SlowLLM("groq/llama3-8b-8192")
+    fallback = SlowLLM("openai/gpt-4o-mini", reply="fallback")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=5.0), router)
+    assert llm.call("Write a listing") == "fallback"
+    assert primary.requests == 0
+
+def test_hedge_delay_follows_observed_p95_under_the_slo():
+    router = _router(min_hedge_delay=0.5)
+    route = Route(hedge_after=10.0)
+    assert router.hedge_delay("writer", route, "groq/llama3-8b-8192") == 10.0
+    for seconds in (1.0, 1.2, 2.0, 3.0):
+        router.model_stats("writer", "groq/llama3-8b-8192").record(seconds, True)
+    assert router.hedge_delay("writer", route, "groq/llama3-8b-8192") == 3.0
+    assert router.hedge_delay("writer", Route(hedge_after=0.1), "groq/llama3-8b-8192") == 0.5
+
+def test_short_stages_do_not_shorten_the_writers_hedge_delay():
+    router = _router(min_hedge_delay=0.5)
+    route = Route(hedge_after=10.0)
+    for _ in range(5):
+        router.model_stats("scraper", "groq/llama3-8b-8192").record(0.6, True)
+    for seconds in (4.0, 5.0, 6.0):
+        router.model_stats("writer", "groq/llama3-8b-8192").record(seconds, True)
+    assert router.hedge_delay("scraper", route, "groq/llama3-8b-8192") == 0.6
+    assert router.hedge_delay("writer", route, "groq/llama3-8b-8192") == 6.0
+    assert set(router.stats()["models"]) == {"scraper", "writer"}
+
+def test_time_queued_for_a_worker_does_not_count_towards_the_hedge():
+    router = _router(pool_size=1)
+    release = threading.Event()
+    router._pool.submit(release.wait)
+    threading.Timer(0.3, release.set).start()
+    primary = SlowLLM("groq/llama3-8b-8192", delay=0.05)
+    fallback = SlowLLM("openai/gpt-4o-mini", reply="fallback")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=0.2), router)
+    # The primary waits 0.3s for the only worker, then answers well inside its head start
+    assert llm.call("Write a listing") == "listing"
+    assert router.stats()["stages"]["writer"]["hedged"] == 0
+
+def test_async_calls_are_hedged_too():
+    router = _router()
+
+    class AsyncLLM(FakeLLM):
+        def __init__(self, model, delay, reply):
+            super().__init__(model=model, reply=reply)
+            self.delay = delay
+
+        async def acall(self, messages, **kwargs):
+            await asyncio.sleep(self.delay)
+            return self.reply
+
+    llm = route_llm("writer", AsyncLLM("groq/llama3-8b-8192", 0.5, "listing"),
+                    AsyncLLM("openai/gpt-4o-mini", 0.0, "fallback"), Route(hedge_after=0.05), router)
+    assert asyncio.run(llm.acall("Write a listing")) == "fallback"
+
+class StreamingLLM(SlowLLM):
+    """Emits its reply word by word as crewai stream chunks when streaming is on."""
+
+    stream = False
+
+    def call(self, messages, **kwargs):
+        from crewai.events import crewai_event_bus, LLMStreamChunkEvent
+        call_id = f"{self.model}-{self.requests}"
+        if self.stream and not self.error:
+            for word in self.reply.split():
+                crewai_event_bus.emit(None, LLMStreamChunkEvent(chunk=word, call_id=call_id, task_id="writing"))
+                time.sleep(self.delay)
+        return super().call(messages, **kwargs)
+
+def _streamed(llm):
+    crew = SimpleNamespace(task_callback=None, tasks=[SimpleNamespace(id="writing", agent=SimpleNamespace(llm=llm))])
+    tokens = []
+    return crew, tokens, lambda name, payload: tokens.append(payload["text"])
+
+def test_writer_tokens_stream_from_the_hedge_fallback():
+    primary = StreamingLLM("groq/llama3-8b-8192", error=RuntimeError("503"))
+    fallback = StreamingLLM("openai/gpt-4o-mini", reply="fallback listing")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=5.0), _router())
+    crew, tokens, on_event = _streamed(llm)
+    with stream_crew_progress(crew, on_event):
+        assert llm.call("Write a listing") == "fallback listing"
+    assert primary.stream and fallback.stream
+    assert tokens == ["fallback", "listing"]
+
+def test_hedged_writer_tokens_are_not_interleaved():
+    primary = StreamingLLM("groq/llama3-8b-8192", delay=0.3, reply="slow primary listing")
+    fallback = StreamingLLM("openai/gpt-4o-mini", delay=0.01, reply="fast fallback listing")
+    llm = route_llm("writer", primary, fallback, Route(hedge_after=0.05), _router())
+    crew, tokens, on_event = _streamed(llm)
+    with stream_crew_progress(crew, on_event):
+        assert llm.call("Write a listing") == "fast fallback listing"
+        # Only the model that streamed first is forwarded, and the next call starts a new stream
+        time.sleep(0.7)
+        assert tokens == ["slow"]
+        tokens.clear()
+        primary.delay = 0.0
+        assert llm.call("Write it again") == "slow primary listing"
+    assert tokens == ["slow", "primary", "listing"]
+
+
+def test_routes_are_read_from_routing_yaml(tmp_path):
+    path = tmp_path / "routing.yaml"
+    path.write_text("writer:\n  fallback: openai/gpt-4o-mini\n  hedge_after: 12\nscraper: {}\n")
+    routes = load_routes(str(path))
+    assert routes["writer"] == Route(fallback="openai/gpt-4o-mini", hedge_after=12.0)
+    assert routes["scraper"] == Route()
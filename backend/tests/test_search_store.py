@@ -0,0 +1,212 @@
+import time
+import numpy as np
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+from tokenizers import Tokenizer
+from tokenizers.models import WordLevel
+from tokenizers.pre_tokenizers import Whitespace
+
+from crewai_tools.rag.base_loader import LoaderResult
+from src.ListingCrew.tools import search_store
+from src.ListingCrew.tools.disk_cache import DiskCache
+from src.ListingCrew.tools.embeddings import LocalEmbedder, encode_vectors, decode_vectors
+from src.ListingCrew.tools.search_store import SearchStore, search_tool_factory, website_search_tool
+from src.ListingCrew.factory import CrewFactory
+
+KNEE_PAGE = "Adjustable knee strap for running and basketball. " * 60
+BLENDER_PAGE = "Countertop blender for smoothies and frozen drinks. " * 60
+
+
+class FakeEmbedder:
+    """Two-dimensional 'embeddings': how much a text is about knees versus blenders."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return [[text.lower().count("knee") + 0.01, text.lower().count("blender") + 0.01] for text in texts]
+
+
+@pytest.fixture
+def pages():
+    """Serve page content by URL instead of fetching it; URLs are not resolved."""
+    content = {"https://shop.test/knee": KNEE_PAGE, "https://shop.test/blender": BLENDER_PAGE}
+
+    def load(self, source, **kwargs):
+        return LoaderResult(content=content[source.source], source=source.source, doc_id=source.source)
+
+    identity = lambda url: url
+    with patch("crewai_tools.rag.loaders.webpage_loader.WebPageLoader.load", load), \
+            patch.object(search_store, "validate_url", identity), \
+            patch("crewai_tools.security.safe_path.validate_url", identity), \
+            patch("crewai_tools.tools.website_search.website_search_tool.validate_url", identity):
+        yield content
+
+
+def test_unchanged_pages_are_not_embedded_again(tmp_path, pages):
+    embedder = FakeEmbedder()
+    store = SearchStore(str(tmp_path / "search.sqlite3"))
+    tool = website_search_tool(store=store, embedder=embedder, model="fake")
+
+    tool.run(search_query="knee support", website="https://shop.test/knee")
+    # A second tool (e.g. another agent) sees the same page and the same query
+    website_search_tool(store=store, embedder=embedder, model="fake").run(
+        search_query="knee support", website="https://shop.test/knee")
+
+    assert len(embedder.batches) == 2   # the page's chunks once, the query once
+    assert store.stats()["pages_embedded"] == 1
+    assert store.stats()["pages_reused"] == 1
+    assert store.stats()["queries_reused"] == 1
+
+def test_changed_page_is_embedded_again(tmp_path, pages):
+    embedder = FakeEmbedder()
+    store = SearchStore(str(tmp_path / "search.sqlite3"))
+    tool = website_search_tool(store=store, embedder=embedder, model="fake")
+    tool.run(search_query="knee", website="https://shop.test/knee")
+    pages["https://shop.test/knee"] = KNEE_PAGE + "Now with a carry pouch."
+    tool.run(search_query="knee", website="https://shop.test/knee")
+    assert store.stats()["pages_embedded"] == 2
+
+def test_embeddings_are_per_model(tmp_path, pages):
+    store = SearchStore(str(tmp_path / "search.sqlite3"))
+    website_search_tool(store=store, embedder=FakeEmbedder(), model="a").run(
+        search_query="knee", website="https://shop.test/knee")
+    website_search_tool(store=store, embedder=FakeEmbedder(), model="b").run(
+        search_query="knee", website="https://shop.test/knee")
+    assert store.stats()["pages_embedded"] == 2
+
+def test_search_only_looks_at_the_named_website(pages):
+    tool = website_search_tool(store=SearchStore(None), embedder=FakeEmbedder(), model="fake")
+    tool.run(search_query="blender", website="https://shop.test/blender")
+    assert "blender" not in tool.run(search_query="blender", website="https://shop.test/knee")
+    assert "knee" in tool.run(search_query="knee", website="https://shop.test/knee")
+
+def test_search_without_a_website_covers_every_indexed_page(pages):
+    tool = website_search_tool(store=SearchStore(None), embedder=FakeEmbedder(), model="fake")
+    tool.add("https://shop.test/knee")
+    tool.add("https://shop.test/blender")
+    # The agent-facing schema requires a website; the tool itself can search everything it indexed
+    result = tool._run(search_query="blender", limit=1)
+    assert "blender" in result and "knee" not in result
+
+def test_crews_do_not_search_each_others_pages(pages):
+    store = SearchStore(None)
+    factory = CrewFactory()
+    factory._tools = []
+    factory._search_tool = search_tool_factory(store=store, embedder=FakeEmbedder(), model="fake")
+    first, = factory.tools()
+    first.add("https://shop.test/blender")
+    second, = factory.tools()
+    assert second is not first
+    assert second._run(search_query="blender") == "Relevant Content:\nNo relevant content found."
+    # The page's embeddings are still shared through the store
+    second.add("https://shop.test/blender")
+    assert store.stats()["pages_reused"] == 1
+    assert "blender" in second._run(search_query="blender")
+
+def test_compaction_purges_expired_entries(tmp_path):
+    store = SearchStore(str(tmp_path / "search.sqlite3"), ttl=0.05, compact_every=0)
+    store.add_page("https://shop.test/knee", ["knee strap"], "hash", "fake", FakeEmbedder())
+    assert len(store.disk) == 2
+    time.sleep(0.1)
+    assert store.page("https://shop.test/knee", "fake") is None
+    store.compact()
+    assert len(store.disk) == 0
+    assert store.stats()["compactions"] == 1
+
+def test_store_compacts_every_n_writes(tmp_path):
+    store = SearchStore(str(tmp_path / "search.sqlite3"), compact_every=4)
+    for index in range(2):
+        store.add_page(f"https://shop.test/{index}", ["chunk"], f"hash{index}", "fake", FakeEmbedder())
+    assert store.stats()["compactions"] == 1
+
+def test_disk_cache_vacuum_shrinks_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DiskCache(path)
+    for index in range(50):
+        cache.set(f"key{index}", bytes(range(256)) * 40 + str(index).encode())
+    cache.clear()
+    cache.vacuum()
+    assert len(cache) == 0
+    assert (tmp_path / "cache.sqlite3").stat().st_size < 64 * 1024
+    cache.close()
+
+def test_chunk_text_counts_towards_the_size_cap(tmp_path):
+    store = SearchStore(str(tmp_path / "search.sqlite3"), max_bytes=4096, compact_every=0)
+    chunks = ["knee strap " * 100]
+    for index in range(5):
+        store.add_page(f"https://shop.test/{index}", chunks, f"hash{index}", "fake", FakeEmbedder())
+    # Each page's vectors compress to a few bytes; its chunk text is what fills the store
+    assert store.disk.size() <= 4096
+    assert store.page("https://shop.test/0", "fake") is None
+    assert store.page("https://shop.test/4", "fake") is not None
+
+def test_query_vectors_are_stored_in_the_store_dtype():
+    store = SearchStore(None, dtype="int8")
+    embedder = FakeEmbedder()
+    first = store.query_vector("knee", "fake", embedder)
+    again = store.query_vector("knee", "fake", embedder)
+    assert len(embedder.batches) == 1
+    assert np.array_equal(first, again) and first.dtype == np.float32
+    value, meta = store._get(f"query:fake:{search_store.content_hash('knee')}")
+    assert meta["dtype"] == "int8" and len(value) == 2 + 4
+
+@pytest.mark.parametrize("dtype, max_error, bytes_per_value", [("float32", 0, 4), ("float16", 1e-3, 2), ("int8", 1e-2, 1)])
+def test_vector_storage_dtypes_round_trip(dtype, max_error, bytes_per_value):
+    vectors = np.random.default_rng(0).normal(size=(6, 384)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    value, meta = encode_vectors(vectors, dtype)
+    assert len(value) <= vectors.size * bytes_per_value + 6 * 4
+    assert np.abs(decode_vectors(value, meta) - vectors).max() <= max_error
+
+def test_store_searches_quantized_vectors(pages):
+    store = SearchStore(None, dtype="int8")
+    tool = website_search_tool(store=store, embedder=FakeEmbedder(), model="fake")
+    assert "knee" in tool.run(search_query="knee", website="https://shop.test/knee")
+    chunks, vectors = store.page("https://shop.test/knee", "fake")
+    assert vectors.dtype == np.float32 and len(vectors) == len(chunks)
+
+
+class FakeSession:
+    """Stands in for the ONNX model: a token's hidden state is its row of a fixed table."""
+
+    def __init__(self, dims=8):
+        self.table = np.random.default_rng(1).normal(size=(16, dims)).astype(np.float32)
+        self.batches = []
+
+    def get_inputs(self):
+        return [SimpleNamespace(name="input_ids"), SimpleNamespace(name="attention_mask")]
+
+    def run(self, outputs, inputs):
+        self.batches.append(inputs["input_ids"].shape)
+        return [self.table[inputs["input_ids"]]]
+
+
+def _local_embedder(batch_size):
+    vocab = {"[PAD]": 0, "[UNK]": 1, **{word: index + 2 for index, word in enumerate(
+        "knee strap brace running blender smoothie jar lid motor fast quiet".split())}}
+    tokenizer = Tokenizer(WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+    embedder = LocalEmbedder(batch_size=batch_size)
+    embedder._session, embedder._tokenizer = FakeSession(), tokenizer
+    return embedder
+
+def test_local_embedder_batches_by_length_and_keeps_input_order():
+    texts = ["knee strap brace running", "jar", "blender smoothie jar lid motor", "knee", "fast quiet"]
+    batched = _local_embedder(batch_size=2)
+    vectors = batched(texts)
+    # Sorted by length, each batch is only padded to its own longest text
+    assert batched._session.batches == [(2, 1), (2, 4), (1, 5)]
+    single = _local_embedder(batch_size=1)
+    expected = np.vstack([single([text]) for text in texts])
+    assert np.allclose(vectors, expected, atol=1e-6)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+
+def test_local_embedder_ignores_padding_in_the_mean():
+    embedder = _local_embedder(batch_size=8)
+    padded = embedder(["knee", "knee strap brace running"])[0]
+    alone = _local_embedder(batch_size=8)(["knee"])[0]
+    assert np.allclose(padded, alone, atol=1e-6)
@@ -0,0 +1,29 @@
+import os
+import sys
+import json
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Cold-start budget for importing the API; override with STARTUP_BUDGET_SECONDS on slow machines
+STARTUP_BUDGET_SECONDS = float(os.environ.get("STARTUP_BUDGET_SECONDS", 3.0))
+HEAVY_MODULES = ("crewai", "crewai_tools", "litellm", "src.ListingCrew.main")
+
+COLD_START = f"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))
+"""
+
+def test_cold_start_stays_within_budget():
+    completed = subprocess.run(
+        [sys.executable, "-c", COLD_START],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    )
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    assert report["loaded"] == [], f"API import pulled in the LLM stack: {report['loaded']}"
+    assert report["seconds"] < STARTUP_BUDGET_SECONDS, (
+        f"Importing app.main took {report['seconds']:.2f}s (budget {STARTUP_BUDGET_SECONDS}s)"
+    )
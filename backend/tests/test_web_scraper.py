@@ -0,0 +1,309 @@
+import os
+import pytest
+import requests
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+from src.ListingCrew.tools import web_scraper
+from src.ListingCrew.tools.disk_cache import DiskCache
+from src.ListingCrew.tools.http_scheduler import HostScheduler, CircuitOpenError, parse_retry_after
+from src.ListingCrew.tools.web_scraper import Scrape
+
+PRODUCT_PAGE = b"""
+<html><body>
+<div id="wayfinding-breadcrumbs_feature_div">
+  <a class="a-link-normal a-color-tertiary" href="/sports"> Sports &amp; Outdoors </a>
+</div>
+<span id="productTitle"> Knee Brace Patella Support </span>
+<div id="feature-bullets"><ul>
+  <li><span> Relieves knee pain </span></li>
+  <li><span></span></li>
+  <li><span> Adjustable strap </span></li>
+</ul></div>
+<div id="productDescription"><p>Unused fallback</p></div>
+</body></html>
+"""
+
+@pytest.fixture(autouse=True)
+def no_default_page_cache(monkeypatch):
+    """Keep scraper tests off the on-disk page cache unless a test passes one in."""
+    monkeypatch.setattr(web_scraper, "CACHE_PATH", "")
+    monkeypatch.setattr(web_scraper.get_page_cache, "instance", None)
+
+@pytest.fixture(autouse=True)
+def fast_scheduler(monkeypatch):
+    """A scheduler that never throttles, so tests only see the behaviour they set up."""
+    scheduler = HostScheduler(web_scraper.get_session(), rate=1000, burst=1000)
+    monkeypatch.setattr(web_scraper.get_scheduler, "instance", scheduler)
+    return scheduler
+
+@pytest.fixture
+def page_cache(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path / "pages.sqlite3"), ttl=60)
+    monkeypatch.setattr(web_scraper.get_page_cache, "instance", cache)
+    yield cache
+    cache.close()
+
+def _response(content=PRODUCT_PAGE, status_code=200, headers=None, chunk_size=None):
+    response = MagicMock()
+    response.content = content
+    response.status_code = status_code
+    response.ok = status_code < 400
+    response.headers = headers or {}
+    response.encoding = "utf-8"
+    response.raise_for_status.return_value = None
+    size = chunk_size or max(len(content), 1)
+    response.iter_content.side_effect = lambda chunk_size: iter(
+        [content[i:i + size] for i in range(0, len(content), size)]
+    )
+    return response
+
+def test_get_asin_and_canonical_url():
+    scraper = Scrape("www.amazon.ca/Patella-Support/dp/B07DLFP8Q5/ref=sr_1")
+    assert scraper.get_asin() == "B07DLFP8Q5"
+    assert scraper.create_new_url() == "https://www.amazon.com/dp/B07DLFP8Q5"
+
+def test_canonical_url_follows_the_configured_base_url(monkeypatch):
+    monkeypatch.setattr(web_scraper, "BASE_URL", "http://127.0.0.1:8081/pages/")
+    scraper = Scrape("https://www.amazon.ca/dp/B07DLFP8Q5")
+    assert scraper.get_asin() == "B07DLFP8Q5"
+    assert scraper.create_new_url() == "http://127.0.0.1:8081/pages/dp/B07DLFP8Q5"
+
+def test_scrape_uses_shared_session():
+    with patch.object(web_scraper.get_session(), "get", return_value=_response()) as mock_get:
+        result = Scrape("https://www.amazon.com/dp/B07DLFP8Q5").scrape()
+    mock_get.assert_called_once()
+    assert result["title"] == "Knee Brace Patella Support"
+    assert result["description"] == ["Relieves knee pain", "Adjustable strap"]
+    assert result["category"] == "Sports & Outdoors"
+
+def test_scrape_many_keeps_input_order_and_bounds_per_host():
+    in_flight = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def slow_get(url, **kwargs):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        time.sleep(0.02)
+        with lock:
+            in_flight["now"] -= 1
+        if url.endswith("B000000002"):
+            return _response(b"<html><span id='productTitle'>Second</span></html>")
+        return _response()
+
+    urls = [f"https://www.amazon.com/dp/B00000000{i}" for i in range(1, 7)] + ["https://example.com/no-asin"]
+    with patch.object(web_scraper.get_session(), "get", side_effect=slow_get):
+        results = Scrape.scrape_many(urls, concurrency=6, per_host=2)
+
+    assert len(results) == len(urls)
+    assert results[1]["title"] == "Second"
+    assert results[0]["title"] == "Knee Brace Patella Support"
+    assert results[-1] is None
+    assert in_flight["peak"] <= 2
+
+def test_scrape_as_completed_yields_every_url():
+    urls = ["https://www.amazon.com/dp/B000000001", "not a url at all"]
+    with patch.object(web_scraper.get_session(), "get", return_value=_response()):
+        results = dict(Scrape.scrape_as_completed(urls, concurrency=2))
+    assert set(results) == set(urls)
+    assert results["https://www.amazon.com/dp/B000000001"]["title"] == "Knee Brace Patella Support"
+
+def test_scrape_many_workers_see_the_generation_deadline():
+    from src.ListingCrew.deadlines import GenerationCancelled, generation_deadline
+    urls = [f"https://www.amazon.com/dp/B00000000{i}" for i in range(1, 5)]
+    cancel = threading.Event()
+
+    def cancelling_get(url, **kwargs):
+        cancel.set()
+        return _response()
+
+    with patch.object(web_scraper.get_session(), "get", side_effect=cancelling_get) as mock_get, \
+            generation_deadline(cancel=cancel):
+        with pytest.raises(GenerationCancelled):
+            Scrape.scrape_many(urls, concurrency=1)
+    # The first fetch cancelled the generation; the worker saw it before fetching the rest
+    assert mock_get.call_count == 1
+
+FALLBACK_PAGE = b"""
+<html><head><script>var productTitle = "not me";</script></head><body>
+<span class="a-link-normal a-color-tertiary">Not a link</span>
+<a class="a-link-normal a-color-tertiary extra" href="/x">Wrong class set</a>
+<div id="nav"><a class="a-link-normal a-color-tertiary" href="/home"> Home &amp; Kitchen </a>
+  <a class="a-link-normal a-color-tertiary" href="/kitchen">Kitchen</a></div>
+<h1><span id="productTitle">  Stainless <b>Steel</b>   Kettle </span></h1>
+<div id="feature-bullets"><ul><li> </li></ul></div>
+<div id="productDescription"><p>Boils fast.</p><p></p><p>1.7 <i>litres</i></p></div>
+</body></html>
+"""
+
+def _legacy_parse(content):
+    """The original full-tree extraction, kept as the parity reference."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(content, 'html.parser')
+    return {
+        "title": (soup.find(id="productTitle").get_text(strip=True)
+                 if soup.find(id="productTitle") else None),
+        "description": Scrape("https://www.amazon.com/dp/B000000001")._extract_description(soup),
+        "category": (soup.find("a", class_="a-link-normal a-color-tertiary").get_text(strip=True)
+                    if soup.find("a", class_="a-link-normal a-color-tertiary") else None),
+        "color": None,
+        "size": None,
+        "count": None
+    }
+
+def test_parser_backends_match_full_tree_output():
+    for page in (PRODUCT_PAGE, FALLBACK_PAGE, b"<html><body>Captcha</body></html>"):
+        expected = _legacy_parse(page)
+        for parser in web_scraper.PARSERS:
+            scraper = Scrape("https://www.amazon.com/dp/B000000001", parser=parser)
+            assert scraper.parse(page) == expected, parser
+
+def test_unknown_parser_is_rejected():
+    with pytest.raises(ValueError, match="Unknown parser"):
+        Scrape("https://www.amazon.com/dp/B000000001", parser="regex")
+
+def test_page_cache_skips_network_on_rerun(page_cache):
+    url = "https://www.amazon.com/gp/product/dp/B07DLFP8Q5?th=1"
+    with patch.object(web_scraper.get_session(), "get", return_value=_response()) as mock_get:
+        first = Scrape(url).scrape()
+        second = Scrape("amazon.ca/dp/B07DLFP8Q5").scrape()
+    assert mock_get.call_count == 1
+    assert first == second
+    assert page_cache.get_entry("B07DLFP8Q5").meta["product"]["title"] == "Knee Brace Patella Support"
+
+def test_page_cache_revalidates_stale_entries(page_cache):
+    url = "https://www.amazon.com/dp/B07DLFP8Q5"
+    fresh = _response(headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    with patch.object(web_scraper.get_session(), "get", return_value=fresh):
+        expected = Scrape(url).scrape()
+
+    page_cache.ttl = 0
+    with patch.object(web_scraper.get_session(), "get", return_value=_response(b"", status_code=304)) as mock_get:
+        assert Scrape(url).scrape() == expected
+    sent_headers = mock_get.call_args.kwargs["headers"]
+    assert sent_headers["If-None-Match"] == '"v1"'
+    assert sent_headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+
+def test_page_cache_does_not_store_unparsed_pages(page_cache):
+    captcha = _response(b"<html><body>Enter the characters you see below</body></html>")
+    with patch.object(web_scraper.get_session(), "get", return_value=captcha):
+        Scrape("https://www.amazon.com/dp/B07DLFP8Q5").scrape()
+    assert len(page_cache) == 0
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path / "lru.sqlite3"), max_bytes=2500)
+    payload = {seed: os.urandom(1000) for seed in (1, 2, 3)}
+    cache.set("a", payload[1])
+    time.sleep(0.01)
+    cache.set("b", payload[2])
+    time.sleep(0.01)
+    assert cache.get("a") == payload[1]
+    time.sleep(0.01)
+    cache.set("c", payload[3])
+    assert cache.get("b") is None
+    assert cache.get("a") == payload[1]
+    assert cache.get("c") == payload[3]
+    assert cache.size() <= 2500
+    cache.close()
+
+def test_scheduler_retries_and_honours_retry_after():
+    session = MagicMock()
+    session.get.side_effect = [
+        _response(status_code=503, headers={"Retry-After": "7"}),
+        _response(status_code=200),
+    ]
+    scheduler = HostScheduler(session, rate=1000, burst=1000, backoff_base=0.01)
+    with patch("src.ListingCrew.tools.http_scheduler.time.sleep") as mock_sleep:
+        response = scheduler.get("https://www.amazon.com/dp/B000000001")
+    assert response.status_code == 200
+    mock_sleep.assert_called_once()
+    assert mock_sleep.call_args.args[0] == pytest.approx(7.0, abs=0.01)
+    # The pause is the host's, so other requests to it wait out the Retry-After too
+    bucket, _ = scheduler._host_state("www.amazon.com")
+    assert bucket._reserve() == pytest.approx(7.0, abs=0.01)
+    stats = scheduler.stats()["www.amazon.com"]
+    assert stats["requests"] == 2
+    assert stats["retries"] == 1
+    assert stats["circuit"] == "closed"
+
+def test_scheduler_circuit_opens_and_fails_fast():
+    session = MagicMock()
+    session.get.return_value = _response(status_code=503)
+    scheduler = HostScheduler(session, rate=1000, burst=1000, max_retries=1,
+                              backoff_base=0.001, failure_threshold=2, reset_timeout=60)
+    assert scheduler.get("https://www.amazon.com/dp/B000000001").status_code == 503
+    with pytest.raises(CircuitOpenError):
+        scheduler.get("https://www.amazon.com/dp/B000000002")
+    assert session.get.call_count == 2
+    stats = scheduler.stats()["www.amazon.com"]
+    assert stats["circuit"] == "open"
+    assert stats["rejected"] == 1
+
+def test_scheduler_half_open_trial_failures_reopen_the_circuit():
+    session = MagicMock()
+    session.get.side_effect = [requests.ConnectionError("reset"), requests.TooManyRedirects("loop"), _response()]
+    scheduler = HostScheduler(session, rate=1000, burst=1000, max_retries=0, failure_threshold=1, reset_timeout=0)
+    with pytest.raises(requests.ConnectionError):
+        scheduler.get("https://www.amazon.com/dp/B000000001")
+    # The trial fails with an error that is not retried; it is re-raised and the circuit opens again
+    with pytest.raises(requests.TooManyRedirects):
+        scheduler.get("https://www.amazon.com/dp/B000000001")
+    assert scheduler.stats()["www.amazon.com"]["circuit"] == "open"
+    assert scheduler.get("https://www.amazon.com/dp/B000000001").status_code == 200
+    assert scheduler.stats()["www.amazon.com"]["circuit"] == "closed"
+
+def test_scheduler_token_bucket_throttles_bursts():
+    session = MagicMock()
+    session.get.return_value = _response()
+    scheduler = HostScheduler(session, rate=50, burst=2)
+    started = time.monotonic()
+    for _ in range(5):
+        scheduler.get("https://www.amazon.com/dp/B000000001")
+    assert time.monotonic() - started >= 0.05
+    assert scheduler.stats()["www.amazon.com"]["throttled_seconds"] > 0
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+def test_streaming_stops_once_all_sections_are_read():
+    trailer = b"<div>" + b"x" * 100000 + b"</div></body></html>"
+    page = PRODUCT_PAGE.replace(b"</body></html>", b"") + trailer
+    response = _response(page, chunk_size=256)
+    consumed = []
+    chunks = response.iter_content.side_effect
+
+    def tracking_chunks(chunk_size):
+        for chunk in chunks(chunk_size):
+            consumed.append(len(chunk))
+            yield chunk
+
+    response.iter_content.side_effect = tracking_chunks
+    with patch.object(web_scraper.get_session(), "get", return_value=response) as mock_get:
+        result = Scrape("https://www.amazon.com/dp/B07DLFP8Q5").scrape()
+
+    assert mock_get.call_args.kwargs["stream"] is True
+    assert result == Scrape("https://www.amazon.com/dp/B07DLFP8Q5").parse(page)
+    assert sum(consumed) < len(PRODUCT_PAGE) + 512
+    response.close.assert_called()
+
+def test_streaming_respects_byte_budget():
+    page = b"<html><body>" + b"<p>filler</p>" * 10000 + b"<span id='productTitle'>Late</span></body></html>"
+    response = _response(page, chunk_size=1024)
+    with patch.object(web_scraper.get_session(), "get", return_value=response):
+        result = Scrape("https://www.amazon.com/dp/B07DLFP8Q5", max_bytes=4096).scrape()
+    assert result["title"] is None
+    response.close.assert_called()
+
+def test_section_tracker_handles_nested_tags_and_empty_bullets():
+    tracker = web_scraper._SectionTracker()
+    tracker.feed('<a class="a-link-normal a-color-tertiary">Cat</a><span id="productTitle">T</span>'
+                 '<div id="feature-bullets"><div><ul><li> </li></ul></div>')
+    assert not tracker.complete
+    tracker.feed('</div><div id="productDescription"><p>Text</p>')
+    assert "feature-bullets" in tracker.closed and not tracker.complete
+    tracker.feed('</div>')
+    assert tracker.complete
@@ -0,0 +1,56 @@
+"""
+Per-request crew setup time: ListingCrew().crew() versus the pre-warmed CrewFactory.
+
+    python benchmarks/bench_crew_setup.py --iterations 20
+
+No LLM or network calls are made; placeholder API keys are set if none are configured
+because the search tools validate that a key exists when they are constructed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-placeholder")
+os.environ.setdefault("GROQ_API_KEY", "gsk-benchmark-placeholder")
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+from src.ListingCrew.crew import ListingCrew
+from src.ListingCrew.factory import CrewFactory
+
+
+def measure(build, iterations: int) -> dict:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        build()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "mean_ms": round(statistics.mean(timings), 2),
+        "median_ms": round(statistics.median(timings), 2),
+        "max_ms": round(max(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    factory = CrewFactory()
+    factory.warm_up()
+
+    results = {
+        "iterations": args.iterations,
+        "before": measure(lambda: ListingCrew().crew(), args.iterations),
+        "after": measure(factory.crew, args.iterations),
+    }
+    results["speedup"] = round(results["before"]["mean_ms"] / max(results["after"]["mean_ms"], 1e-6), 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
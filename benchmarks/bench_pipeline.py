@@ -0,0 +1,283 @@
+"""
+End-to-end generate_listing benchmark against local stand-ins for the LLM providers and Amazon.
+
+    python benchmarks/bench_pipeline.py --concurrency 1,4,8 --generations 16 --llm-latency 0.2
+    python benchmarks/bench_pipeline.py --output bench.json --compare bench-main.json
+
+Every model is sent to a stub OpenAI-compatible server (canned completions per agent after
+--llm-latency seconds) and product pages come from benchmarks/fixtures/pages, so no network,
+API keys or provider quota are needed. Listing, page and completion caches are disabled and
+every generation is forced, so each one runs the full crew.
+
+Reported per concurrency level: wall time percentiles, per-stage wall time, throughput and
+framework overhead (wall time not spent waiting on the stub servers). One extra traced
+generation reports Python allocations. The JSON report can be diffed between commits.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import platform
+import statistics
+import subprocess
+import threading
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_servers import StubLLMServer, FixturePageServer
+
+# Metrics compared by --compare, and whether a higher value is better
+COMPARED = {"wall_ms.p50": False, "wall_ms.p95": False, "overhead_ms": False, "throughput_per_s": True}
+
+
+def configure_environment(llm_url: str, pages_url: str) -> None:
+    """Point the pipeline at the stub servers and turn off every cache and provider limit."""
+    unlimited = {"rpm": 1e9, "tpm": 1e12}
+    os.environ.update({
+        "LLM_BASE_URL": llm_url,
+        "SCRAPER_BASE_URL": pages_url,
+        "LLM_CACHE_MODE": "off",
+        "LLM_RATE_LIMITS": json.dumps({"groq": unlimited, "openai": unlimited}),
+        "SCRAPER_CACHE_PATH": "",
+        "SCRAPER_RATE_PER_HOST": "1000000",
+        "SCRAPER_BURST_PER_HOST": "1000000",
+        "LISTING_CACHE_PATH": "",
+        "LISTING_CHECKPOINT_PATH": "",
+        "SEARCH_STORE_PATH": "",
+        "LISTING_INDEX_PATH": "",
+        "LISTINGCREW_SIMILAR_LISTINGS": "0",
+        "CREWAI_DISABLE_TELEMETRY": "true",
+        "OTEL_SDK_DISABLED": "true",
+        "LITELLM_LOCAL_MODEL_COST_MAP": "True",
+    })
+    # The search tools validate that a key exists when they are constructed
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-placeholder")
+    os.environ.setdefault("GROQ_API_KEY", "gsk-benchmark-placeholder")
+
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """Send everything written to stdout, including by already-created consoles, to stderr."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda fraction: ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return {"mean": round(statistics.mean(ordered), 1), "p50": round(pick(0.5), 1),
+            "p95": round(pick(0.95), 1), "max": round(ordered[-1], 1)}
+
+
+class StageTimer:
+    """Wall time per pipeline stage: pre-scrape and competitor fan-out, then each crew task."""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._started: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds * 1000)
+
+    def timed(self, stage: str, function):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return wrapper
+
+    def attach(self) -> None:
+        from crewai.events import crewai_event_bus, TaskStartedEvent, TaskCompletedEvent
+
+        @crewai_event_bus.on(TaskStartedEvent)
+        def on_started(source, event):
+            with self._lock:
+                self._started[str(event.task_id)] = event.timestamp
+
+        @crewai_event_bus.on(TaskCompletedEvent)
+        def on_completed(source, event):
+            with self._lock:
+                started = self._started.pop(str(event.task_id), None)
+            if started is not None:
+                self.add(event.task_name or "task", (event.timestamp - started).total_seconds())
+
+    def reset(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            samples, self.samples = self.samples, defaultdict(list)
+        return {stage: percentiles(values) for stage, values in sorted(samples.items())}
+
+
+def run_level(generate, urls: List[str], concurrency: int, generations: int, timer: StageTimer,
+              llm: StubLLMServer, pages: FixturePageServer) -> Dict[str, Any]:
+    """Run `generations` listings, `concurrency` at a time, and summarise them."""
+    timer.reset()
+    llm_before, pages_before = llm.stats.snapshot(), pages.stats.snapshot()
+    walls: List[float] = []
+    errors = 0
+
+    def one(index: int) -> None:
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            result = generate(urls[index % len(urls)], index)
+            failed = "raw_output" in result
+        except Exception as e:
+            print(f"generation {index} failed: {e}", file=sys.stderr)
+            failed = True
+        walls.append((time.perf_counter() - started) * 1000)
+        if failed:
+            errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(generations)))
+    elapsed = time.perf_counter() - started
+
+    llm_after, pages_after = llm.stats.snapshot(), pages.stats.snapshot()
+    waited_ms = 1000 * ((llm_after["busy_seconds"] - llm_before["busy_seconds"])
+                        + (pages_after["busy_seconds"] - pages_before["busy_seconds"]))
+    return {
+        "concurrency": concurrency,
+        "generations": generations,
+        "errors": errors,
+        "wall_ms": percentiles(walls),
+        "stages_ms": timer.reset(),
+        "overhead_ms": round((sum(walls) - waited_ms) / generations, 1),
+        "llm_requests": llm_after["requests"] - llm_before["requests"],
+        "page_requests": pages_after["requests"] - pages_before["requests"],
+        "throughput_per_s": round(generations / elapsed, 3),
+    }
+
+
+def trace_allocations(generate, url: str, top: int = 10) -> Dict[str, Any]:
+    """Python allocations of one generation, grouped by source file."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    generate(url, -1)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = [stat for stat in after.compare_to(before, "filename") if stat.size_diff > 0]
+    site_packages = os.path.dirname(os.path.dirname(threading.__file__))
+    shorten = lambda path: os.path.relpath(path, REPO_ROOT) if path.startswith(REPO_ROOT) else path.replace(site_packages, "...")
+    return {
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+        "retained_blocks": sum(stat.count_diff for stat in stats if stat.count_diff > 0),
+        "top_files_kib": {shorten(stat.traceback[0].filename): round(stat.size_diff / 1024, 1)
+                          for stat in stats[:top]},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """One line per compared metric and concurrency level: baseline -> current (change)."""
+    lines = []
+    levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in report["levels"]:
+        old_level = levels.get(level["concurrency"])
+        if old_level is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = old_level, level
+            for part in metric.split("."):
+                old, new = (old or {}).get(part), (new or {}).get(part)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            better = change > 0 if higher_is_better else change < 0
+            lines.append(f"c={level['concurrency']:<3} {metric:<18} {old:>10} -> {new:<10} "
+                         f"{change:+6.1f}% {'better' if better else 'worse' if change else ''}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4", help="comma-separated concurrency levels")
+    parser.add_argument("--generations", type=int, default=8, help="generations per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="seconds the stub LLM takes per completion")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument("--research-mode", choices=("agent", "fanout"), default="agent")
+    parser.add_argument("--no-prescrape", action="store_true", help="let the scraper agent handle the page")
+    parser.add_argument("--no-allocations", action="store_true", help="skip the traced allocation run")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="print changes against a previous JSON report")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    # The crew's verbose console output goes to stderr; stdout only carries the report
+    with StubLLMServer(latency=args.llm_latency, jitter=args.llm_jitter) as llm, FixturePageServer() as pages, \
+            stdout_to_stderr():
+        configure_environment(llm.url, pages.url)
+
+        import logging
+        logging.disable(logging.WARNING)
+        from src.ListingCrew import main as listing_main
+        from src.ListingCrew.factory import get_crew_factory
+
+        timer = StageTimer()
+        timer.attach()
+        listing_main.prescrape_product = timer.timed("prescrape", listing_main.prescrape_product)
+        listing_main.research_competitors = timer.timed("competitors", listing_main.research_competitors)
+        urls = [f"https://www.amazon.com/dp/{asin}" for asin in pages.asins()]
+
+        def generate(url: str, index: int) -> dict:
+            # A generation id of its own, so concurrent runs of one product never share checkpoints
+            return listing_main.generate_listing(url, prescrape=not args.no_prescrape, force_refresh=True,
+                                                 research_mode=args.research_mode, generation=f"bench-{index}")
+
+        get_crew_factory().warm_up()
+        generate(urls[0], -1)
+
+        report: Dict[str, Any] = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "settings": {"llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter,
+                         "research_mode": args.research_mode, "prescrape": not args.no_prescrape,
+                         "generations": args.generations},
+            "levels": [run_level(generate, urls, level, args.generations, timer, llm, pages) for level in levels],
+        }
+        if not args.no_allocations:
+            report["allocations"] = trace_allocations(generate, urls[0])
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            print("\n".join(compare(report, json.load(file))))
+
+
+if __name__ == "__main__":
+    main()
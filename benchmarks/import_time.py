@@ -0,0 +1,64 @@
+"""
+Import-time report for the FastAPI backend, grouped by top-level package.
+
+    python benchmarks/import_time.py                  # import app.main
+    python benchmarks/import_time.py --module src.ListingCrew.main --top 15
+
+Runs the import in a fresh interpreter with `-X importtime` so nothing is already cached.
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.join(REPO_ROOT, 'backend')
+
+
+def import_times(module: str) -> list:
+    """Return (self_us, cumulative_us, module) for every module imported by `module`."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BACKEND_DIR, REPO_ROOT]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    rows = import_times(args.module)
+    by_package = defaultdict(int)
+    for self_us, _, name in rows:
+        by_package[name.split(".")[0]] += self_us
+    total_us = next((cumulative for _, cumulative, name in rows if name == args.module), sum(by_package.values()))
+    ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:args.top]
+
+    report = {
+        "module": args.module,
+        "total_ms": round(total_us / 1000, 1),
+        "packages_ms": {package: round(us / 1000, 1) for package, us in ranked},
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"import {args.module}: {report['total_ms']} ms")
+    for package, ms in report["packages_ms"].items():
+        print(f"  {package:<30} {ms:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Local stand-ins for the services a generation talks to, for offline benchmarks:
+
+- StubLLMServer: an OpenAI-compatible /chat/completions endpoint answering with canned
+  completions per crew agent after a configurable latency (streaming supported).
+- FixturePageServer: serves saved product pages from benchmarks/fixtures/pages as /dp/<ASIN>.
+
+Point the pipeline at them with LLM_BASE_URL and SCRAPER_BASE_URL.
+"""
+import os
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pages")
+
+RESEARCH_REPORT = """Product analysis: a compression knee support strap for sports and everyday joint pain relief.
+Main keywords: knee brace, patella strap, knee support, tendonitis relief, jumper's knee.
+Competitors: neoprene patella bands, sleeve-style knee braces and dual-strap supports.
+Competitor keywords: adjustable knee strap, patellar tendon support, running knee brace.
+Trending keywords: knee pain relief for runners, basketball knee strap, osgood schlatter support."""
+
+LISTING = {
+    "title": "Adjustable Patella Knee Strap for Running, Basketball, Tendonitis Pain Relief Support",
+    "description": (
+        "Relieve knee pain with an adjustable patella strap built for runners and court athletes. "
+        "Targeted compression supports the patellar tendon during every jump and stride.\n\n"
+        "The breathable neoprene band stays in place without bunching. It fits either knee.\n\n"
+        "Ideal for tendonitis, jumper's knee and Osgood-Schlatter recovery. Wear it on court or on the trail.\n\n"
+        "Lightweight, comfortable and easy to adjust, it keeps you moving with confidence."
+    ),
+    "bullet_points": [
+        "Targeted patellar tendon compression relieves knee pain during sports.",
+        "Adjustable strap gives a secure fit for either knee.",
+        "Breathable neoprene stays comfortable through long workouts.",
+        "Supports recovery from tendonitis and jumper's knee.",
+    ],
+    "keywordsReport": "knee strap, patella strap, knee brace for running, tendonitis knee support, jumper's knee",
+}
+
+COMPETITOR_URLS = json.dumps([f"https://www.amazon.com/dp/{asin}" for asin in ("B0BENCH002", "B0BENCH003")])
+
+# Canned final answers by the agent role named in the system prompt
+COMPLETIONS = {
+    "Web Scraper": json.dumps({"title": "Patella Knee Strap", "description": ["Adjustable knee support"],
+                               "category": "Sports & Outdoors"}),
+    "E-Commerce Competition Researcher": RESEARCH_REPORT,
+    "SEO Expert Content Writer": json.dumps(LISTING),
+}
+
+
+def _final_answer(text: str) -> str:
+    return f"Thought: I now know the final answer\nFinal Answer: {text}"
+
+
+def canned_completion(messages: List[Dict[str, Any]]) -> str:
+    """The completion for a request, chosen by the agent role in its system prompt."""
+    prompt = "\n".join(str(message.get("content") or "") for message in messages)
+    if "competitor product detail page URLs" in prompt:
+        return _final_answer(COMPETITOR_URLS)
+    for role, completion in COMPLETIONS.items():
+        if role in prompt:
+            return _final_answer(completion)
+    return _final_answer("Done.")
+
+
+class _ServerStats:
+    def __init__(self):
+        self.requests = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self.busy_seconds += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": self.requests, "busy_seconds": round(self.busy_seconds, 4)}
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _LLMHandler(_QuietHandler):
+    server: "StubLLMServer"
+
+    def do_POST(self):
+        started = time.perf_counter()
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("chat/completions"):
+            self._send(404, b'{"error": {"message": "not found"}}')
+            return
+        text = canned_completion(request.get("messages") or [])
+        self.server.wait()
+        usage = {"prompt_tokens": sum(len(str(m.get("content") or "")) for m in request.get("messages") or []) // 4,
+                 "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-bench-{self.server.stats.requests}"
+        model = request.get("model", "stub")
+        if request.get("stream"):
+            self._stream(completion_id, model, text, usage)
+        else:
+            self._send(200, json.dumps({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "service_tier": "on_demand", "system_fingerprint": "fp_stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage,
+            }).encode())
+        self.server.stats.record(time.perf_counter() - started)
+
+    def _stream(self, completion_id: str, model: str, text: str, usage: Dict[str, int]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> None:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                       "model": model, "service_tier": "on_demand", "system_fingerprint": "fp_stub", "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                       **extra}
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+
+        words = text.split(" ")
+        for index, word in enumerate(words):
+            chunk({"content": word if index == 0 else " " + word})
+        chunk({}, "stop", usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+class _PageHandler(_QuietHandler):
+    server: "FixturePageServer"
+
+    def do_GET(self):
+        started = time.perf_counter()
+        asin = self.path.rstrip("/").rsplit("/", 1)[-1]
+        path = os.path.join(self.server.pages_dir, f"{asin}.html")
+        if "/dp/" not in self.path or not os.path.exists(path):
+            self._send(404, b"not found", "text/plain")
+        else:
+            with open(path, "rb") as file:
+                self._send(200, file.read(), "text/html; charset=utf-8")
+        self.server.stats.record(time.perf_counter() - started)
+
+
+class _BackgroundServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), handler)
+        self.stats = _ServerStats()
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+class StubLLMServer(_BackgroundServer):
+    """OpenAI-compatible completions after `latency` seconds (plus up to `jitter` seconds)."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, **kwargs):
+        super().__init__(_LLMHandler, **kwargs)
+        self.latency = latency
+        self.jitter = jitter
+
+    @property
+    def url(self) -> str:
+        return super().url + "/v1"
+
+    def wait(self) -> None:
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FixturePageServer(_BackgroundServer):
+    """Saved product pages served as /dp/<ASIN>."""
+
+    def __init__(self, pages_dir: str = FIXTURES_DIR, **kwargs):
+        super().__init__(_PageHandler, **kwargs)
+        self.pages_dir = pages_dir
+
+    def asins(self) -> List[str]:
+        return sorted(name[:-len(".html")] for name in os.listdir(self.pages_dir) if name.endswith(".html"))
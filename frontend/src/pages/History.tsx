@@ -1,31 +1,50 @@
-import React from 'react';
-import { History as HistoryIcon, Calendar, ExternalLink, Trash2 } from 'lucide-react';
+import React, { useEffect, useState } from 'react';
+import { History as HistoryIcon, Calendar, ExternalLink, Trash2, Loader2 } from 'lucide-react';
+import { useAuth } from '../contexts/AuthContext';
+
+interface HistoryItem {
+  id: number;
+  url: string;
+  date: string;
+  title: string;
+  status: string;
+}
 
 function History() {
-  // Mock data for demonstration
-  const historyItems = [
-    {
-      id: 1,
-      url: 'https://www.amazon.com/dp/B0BP7M5F3M',
-      date: '2024-01-15',
-      title: 'Premium Wireless Bluetooth Headphones',
-      status: 'completed'
-    },
-    {
-      id: 2,
-      url: 'https://www.amazon.com/dp/B08N5WRWNW',
-      date: '2024-01-14',
-      title: 'Smart Home Security Camera',
-      status: 'completed'
-    },
-    {
-      id: 3,
-      url: 'https://www.amazon.com/dp/B07XJ8C8F5',
-      date: '2024-01-13',
-      title: 'Portable Phone Charger',
-      status: 'completed'
+  const [historyItems, setHistoryItems] = useState<HistoryItem[]>([]);
+  // Cursor for the next page, from the X-Next-Cursor header; null once the last page is loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [isLoading, setIsLoading] = useState(false);
+  const { showToast } = useAuth();
+
+  const loadPage = async (cursor: string | null) => {
+    setIsLoading(true);
+    try {
+      // Backend integration point: GET /history, one page at a time
+      const response = await fetch(`/api/v1/history${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''}`, {
+        headers: {
+          'Authorization': `Bearer ${localStorage.getItem('authToken')}`,
+        },
+      });
+      const data = await response.json();
+      if (!response.ok) {
+        showToast(data.detail || 'Failed to load history', 'error');
+        return;
+      }
+      setHistoryItems((items) => (cursor ? [...items, ...data] : data));
+      setNextCursor(response.headers.get('X-Next-Cursor'));
+    } catch (error) {
+      showToast('Failed to load history. Please try again later.', 'error');
+    } finally {
+      setIsLoading(false);
     }
-  ];
+  };
+
+  useEffect(() => {
+    loadPage(null);
+    // showToast is recreated on every render; the first page only needs loading once
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
 
   return (
     <div className="max-w-6xl mx-auto px-4 sm:px-6 lg:px-8 py-8">
@@ -35,7 +54,11 @@ function History() {
       </div>
 
       <div className="bg-white rounded-2xl shadow-lg border border-gray-100">
-        {historyItems.length === 0 ? (
+        {historyItems.length === 0 && isLoading ? (
+          <div className="p-12 flex justify-center">
+            <Loader2 className="h-8 w-8 text-blue-600 animate-spin" />
+          </div>
+        ) : historyItems.length === 0 ? (
           <div className="p-12 text-center">
             <HistoryIcon className="h-16 w-16 text-gray-300 mx-auto mb-4" />
             <h3 className="text-xl font-semibold text-gray-900 mb-2">No history yet</h3>
@@ -95,6 +118,18 @@ function History() {
                 </tbody>
               </table>
             </div>
+            {nextCursor && (
+              <div className="mt-6 text-center">
+                <button
+                  onClick={() => loadPage(nextCursor)}
+                  disabled={isLoading}
+                  className="inline-flex items-center px-4 py-2 text-sm font-medium text-blue-600 hover:text-blue-900 disabled:opacity-50"
+                >
+                  {isLoading && <Loader2 className="h-4 w-4 mr-2 animate-spin" />}
+                  Load more
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
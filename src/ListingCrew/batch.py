@@ -0,0 +1,173 @@
+"""
+Bulk listing generation for a catalog of product URLs.
+
+    python -m src.ListingCrew.batch catalog.txt -o output/listings.jsonl --workers 4
+    cat catalog.txt | python -m src.ListingCrew.batch - -o output/listings.jsonl
+
+URLs are read one per line (blank lines and # comments are skipped) and deduplicated by ASIN.
+Results are appended to the JSONL file as they finish; re-running with the same output file
+skips every product that already has a successful line, so an interrupted batch resumes.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Set, TextIO
+from .singletons import process_wide
+from .tools.web_scraper import product_key
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 4))
+# "process" isolates generations in worker processes; "thread" shares this process's caches and budgets
+BATCH_EXECUTOR = os.environ.get("BATCH_EXECUTOR", "process")
+EXECUTORS = ("process", "thread")
+
+
+def read_urls(lines: Iterable[str]) -> Iterator[str]:
+    """URLs from a file or stream, one per line, skipping blank lines and # comments."""
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith("#"):
+            yield url
+
+
+def dedupe(urls: Iterable[str], seen: Optional[Set[str]] = None) -> Iterator[str]:
+    """Drop URLs whose product (ASIN, or the URL itself) was already seen, keeping the first."""
+    seen = set() if seen is None else seen
+    for url in urls:
+        key = product_key(url)
+        if key not in seen:
+            seen.add(key)
+            yield url
+
+
+def completed_keys(path: str) -> Set[str]:
+    """Products that already have a successful line in a (possibly partial) JSONL output file."""
+    keys: Set[str] = set()
+    if not os.path.exists(path):
+        return keys
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by an interrupted run; that product is generated again
+                continue
+            if record.get("status") == "ok":
+                keys.add(record["key"])
+    return keys
+
+
+def _init_worker(share: int) -> None:
+    """Give each worker process an equal share of the provider and per-host rate budgets."""
+    from . import llm_scheduler
+    from .tools import web_scraper
+    llm_scheduler.HEADROOM = llm_scheduler.HEADROOM / share
+    web_scraper.RATE_PER_HOST = web_scraper.RATE_PER_HOST / share
+    web_scraper.BURST_PER_HOST = max(1, web_scraper.BURST_PER_HOST // share)
+
+
+def generate_one(url: str, force_refresh: bool = False) -> Dict[str, Any]:
+    """Generate one listing and describe the outcome as a JSONL record."""
+    from .main import generate_listing
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"url": url, "key": product_key(url)}
+    try:
+        result = generate_listing(url, force_refresh=force_refresh)
+    except Exception as e:
+        logging.error(f"Batch generation failed for {url}: {e}")
+        record.update(status="error", error=str(e))
+    else:
+        if "raw_output" in result:
+            record.update(status="error", error="Failed to get structured data from ListingCrew.", result=result)
+        else:
+            record.update(status="ok", result=result)
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+@process_wide
+def get_thread_pool() -> ThreadPoolExecutor:
+    """The process-wide pool in-process batches share, so concurrent batches respect one limit."""
+    return ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="listing-batch")
+
+
+def generate_batch(urls: Iterable[str], workers: int = BATCH_WORKERS, executor: str = BATCH_EXECUTOR,
+                   force_refresh: bool = False, skip: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Generate listings for many URLs concurrently, yielding one record per product as it finishes.
+    Duplicate products and products in `skip` (keys from completed_keys) are not generated.
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown batch executor: {executor}")
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    pending = dedupe(urls, seen=set(skip or ()))
+    if executor == "process":
+        pool: Executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,))
+    else:
+        pool = get_thread_pool()
+
+    # At most `workers` generations of this batch are in flight; the rest of the input is read lazily
+    futures: Dict[Future, str] = {}
+
+    def fill() -> None:
+        while len(futures) < workers:
+            url = next(pending, None)
+            if url is None:
+                return
+            futures[pool.submit(generate_one, url, force_refresh)] = url
+
+    try:
+        fill()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                del futures[future]
+                yield future.result()
+            fill()
+    finally:
+        for future in futures:
+            future.cancel()
+        if executor == "process":
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run_batch(source: TextIO, output_path: str, workers: int = BATCH_WORKERS,
+              executor: str = BATCH_EXECUTOR, force_refresh: bool = False) -> Dict[str, int]:
+    """Generate a catalog into a JSONL file, resuming from whatever it already contains."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    skip = set() if force_refresh else completed_keys(output_path)
+    counts = {"ok": 0, "error": 0, "skipped": len(skip)}
+    with open(output_path, "a", encoding="utf-8") as output:
+        for record in generate_batch(read_urls(source), workers, executor, force_refresh, skip):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            counts[record["status"]] += 1
+            logging.info(f"[{record['status']}] {record['url']} in {record['seconds']}s")
+    return counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="file with one URL per line, or - for stdin")
+    parser.add_argument("-o", "--output", default=os.path.join("output", "listings.jsonl"))
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--executor", choices=EXECUTORS, default=BATCH_EXECUTOR)
+    parser.add_argument("--force-refresh", action="store_true",
+                        help="regenerate every product, ignoring cached listings and the existing output")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if args.source == "-":
+        counts = run_batch(sys.stdin, args.output, args.workers, args.executor, args.force_refresh)
+    else:
+        with open(args.source, encoding="utf-8") as source:
+            counts = run_batch(source, args.output, args.workers, args.executor, args.force_refresh)
+    print(json.dumps(counts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Optional, Dict, Any, List, Tuple
+from .result_cache import config_fingerprint
+from .singletons import process_wide
+from .tools.disk_cache import DiskCache
+from .tools.web_scraper import product_key
+
+# Task outputs of unfinished generations; set LISTING_CHECKPOINT_PATH to an empty string to keep them in memory
+CHECKPOINT_PATH = os.environ.get("LISTING_CHECKPOINT_PATH", os.path.join("output", "cache", "checkpoints.sqlite3"))
+CHECKPOINT_TTL = float(os.environ.get("LISTING_CHECKPOINT_TTL", 24 * 60 * 60))
+
+# Prepended to the first task that still has to run when a generation resumes
+RESUME_CONTEXT = """Output of the earlier stages of this generation, recovered from a previous attempt:
+{resumed_context}
+
+"""
+# Same separator crewai uses when it aggregates previous task outputs into a task's context
+CONTEXT_SEPARATOR = "\n\n----------\n\n"
+
+
+def generation_id(url: str) -> str:
+    """Stable id for generating a product's listing with the current prompts and models."""
+    return hashlib.sha256(f"{product_key(url)}|{config_fingerprint()}".encode()).hexdigest()[:16]
+
+
+class CheckpointStore:
+    """Per-generation task outputs, so a failed generation can resume from its first failed task."""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = CHECKPOINT_TTL):
+        self.disk = DiskCache(path, ttl=ttl) if path else None
+        self._memory: Dict[str, Dict[str, str]] = {}
+        self._counters = {"runs": 0, "resumed": 0, "tasks_run": 0, "tasks_skipped": 0}
+        self._lock = threading.Lock()
+
+    def load(self, generation: str) -> Dict[str, str]:
+        """Stored outputs by task name, in the order the tasks finished."""
+        if self.disk is None:
+            with self._lock:
+                return dict(self._memory.get(generation, {}))
+        value = self.disk.get(generation)
+        return json.loads(value) if value is not None else {}
+
+    def save(self, generation: str, task_name: str, output: str) -> None:
+        with self._lock:
+            if self.disk is None:
+                self._memory.setdefault(generation, {})[task_name] = output
+                return
+            value = self.disk.get(generation)
+            outputs = json.loads(value) if value is not None else {}
+            outputs[task_name] = output
+            self.disk.set(generation, json.dumps(outputs).encode(), meta={"tasks": list(outputs)})
+
+    def clear(self, generation: str) -> None:
+        with self._lock:
+            self._memory.pop(generation, None)
+        if self.disk is not None:
+            self.disk.delete(generation)
+
+    def record_run(self, skipped: int, ran: int) -> None:
+        """Count a crew run and how many of its tasks were served from checkpoints."""
+        with self._lock:
+            self._counters["runs"] += 1
+            self._counters["resumed"] += 1 if skipped else 0
+            self._counters["tasks_skipped"] += skipped
+            self._counters["tasks_run"] += ran
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+def resume_crew(crew: Any, completed: Dict[str, str]) -> Tuple[List[str], Optional[str]]:
+    """
+    Drop the leading tasks that already have stored outputs and hand those outputs to the
+    first remaining task, which must then be kicked off with the returned context as
+    `resumed_context`. The last task always runs. Returns (skipped task names, context).
+    """
+    skipped = []
+    for task in crew.tasks[:-1]:
+        if task.name not in completed:
+            break
+        skipped.append(task.name)
+    if not skipped:
+        return [], None
+    crew.tasks = crew.tasks[len(skipped):]
+    crew.tasks[0].description = RESUME_CONTEXT + crew.tasks[0].description
+    return skipped, CONTEXT_SEPARATOR.join(completed[name] for name in skipped)
+
+
+def checkpoint_tasks(crew: Any, store: CheckpointStore, generation: str) -> None:
+    """Persist each task's output as it finishes, except the last task whose output is the result."""
+    final_task = crew.tasks[-1].name
+    previous = crew.task_callback
+
+    def save(task_output: Any) -> None:
+        if task_output.name and task_output.name != final_task:
+            store.save(generation, task_output.name, task_output.raw)
+        if previous is not None:
+            previous(task_output)
+
+    crew.task_callback = save
+
+
+@process_wide
+def get_checkpoint_store() -> CheckpointStore:
+    """Return the process-wide checkpoint store."""
+    return CheckpointStore(CHECKPOINT_PATH or None)
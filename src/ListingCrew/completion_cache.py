@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, List, Iterator
+try:
+    from .singletons import process_wide
+    from .tools.disk_cache import DiskCache
+except ImportError:
+    from singletons import process_wide
+    from tools.disk_cache import DiskCache
+
+OFF = "off"
+READ_WRITE = "read_write"
+REPLAY = "replay"
+MODES = (OFF, READ_WRITE, REPLAY)
+
+# Off unless enabled: "read_write" records completions and serves them for LLM_CACHE_TTL seconds
+# (set it empty to never expire them); "replay" serves only recorded completions, whatever their
+# age, and fails on a miss (offline tests and benchmarks)
+CACHE_MODE = os.environ.get("LLM_CACHE_MODE", OFF)
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", os.path.join("output", "cache", "completions.sqlite3"))
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 24 * 60 * 60) or 0) or None
+CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# LLM settings that change what the model returns
+SAMPLING_PARAMS = ("temperature", "top_p", "max_tokens", "max_completion_tokens", "stop",
+                   "seed", "n", "presence_penalty", "frequency_penalty", "response_format")
+# Call arguments that are not part of the request sent to the provider
+IGNORED_CALL_ARGS = ("callbacks", "available_functions", "from_task", "from_agent")
+
+_refreshing: ContextVar[bool] = ContextVar("llm_cache_refreshing", default=False)
+
+
+class CompletionCacheMiss(LookupError):
+    """Raised in replay mode when a completion was never recorded."""
+
+
+def normalize_messages(messages: Any) -> List[Dict[str, str]]:
+    """Messages as role/content pairs with line endings and surrounding whitespace normalized."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for message in messages or []:
+        if not isinstance(message, dict):
+            message = {"role": "user", "content": str(message)}
+        content = message.get("content")
+        if isinstance(content, str):
+            content = "\n".join(line.rstrip() for line in content.replace("\r\n", "\n").strip().split("\n"))
+        normalized.append({"role": str(message.get("role", "user")), "content": content})
+    return normalized
+
+
+def completion_key(model: str, messages: Any, params: Optional[Dict[str, Any]] = None) -> str:
+    """Content address of a completion request: model, normalized messages and sampling params."""
+    payload = {
+        "model": model,
+        "messages": normalize_messages(messages),
+        "params": {name: value for name, value in sorted((params or {}).items()) if value is not None},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def request_params(llm: Any, call_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """The sampling settings of an LLM instance plus the request-shaping arguments of one call."""
+    params = {name: getattr(llm, name, None) for name in SAMPLING_PARAMS}
+    for name, value in call_kwargs.items():
+        if name in IGNORED_CALL_ARGS:
+            continue
+        if name == "response_model" and value is not None:
+            value = getattr(value, "__name__", str(value))
+        params[name] = value
+    return params
+
+
+@contextmanager
+def refresh_completions() -> Iterator[None]:
+    """Within the block, completions are requested again and re-recorded instead of read (except in replay)."""
+    token = _refreshing.set(True)
+    try:
+        yield
+    finally:
+        _refreshing.reset(token)
+
+
+class CompletionCache:
+    """Disk-backed store of LLM completions addressed by their request."""
+
+    def __init__(self, path: Optional[str], mode: str = READ_WRITE, ttl: Optional[float] = CACHE_TTL,
+                 max_bytes: Optional[int] = CACHE_MAX_BYTES):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.mode = mode
+        if mode == REPLAY:
+            ttl = None
+        self.disk = DiskCache(path, ttl=ttl, max_bytes=max_bytes) if path and mode != OFF else None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a recorded completion; in replay mode a miss raises CompletionCacheMiss."""
+        if self.disk is None:
+            if self.mode == REPLAY:
+                raise CompletionCacheMiss(f"No completion cache configured for replay (key {key})")
+            return None
+        if self.mode == READ_WRITE and _refreshing.get():
+            return None
+        value = self.disk.get(key)
+        self._count(value is not None)
+        if value is None:
+            if self.mode == REPLAY:
+                raise CompletionCacheMiss(f"No recorded completion for request {key}")
+            return None
+        return value.decode("utf-8")
+
+    def set(self, key: str, completion: Any, model: str = "") -> None:
+        """Record a text completion; tool calls and structured results are not cached."""
+        if self.disk is None or self.mode != READ_WRITE or not isinstance(completion, str):
+            return
+        self.disk.set(key, completion.encode("utf-8"), meta={"model": model})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+
+@process_wide
+def get_completion_cache() -> CompletionCache:
+    """Return the process-wide completion cache."""
+    logging.info(f"LLM completion cache mode: {CACHE_MODE}")
+    return CompletionCache(CACHE_PATH or None, mode=CACHE_MODE)
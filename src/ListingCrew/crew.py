@@ -1,49 +1,92 @@
-from typing import List
-from crewai_tools import WebsiteSearchTool, ScrapeWebsiteTool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from crewai_tools import ScrapeWebsiteTool
 from crewai import Agent, Crew, Process, Task
+from crewai.tools import BaseTool
 from crewai.project import CrewBase, agent, crew, task # type: ignore
 from crewai.agents.agent_builder.base_agent import BaseAgent
 try:
     from .tools.custom_tools import validate_product_info, validate_writing_output
+    from .llm_router import routed_llm
+    from .tools.search_store import website_search_tool
 except ImportError:
     from tools.custom_tools import validate_product_info, validate_writing_output
+    from llm_router import routed_llm
+    from tools.search_store import website_search_tool
 from dotenv import load_dotenv
-import time
-import litellm
 load_dotenv()
 
+# Prepended to the research task when tools/web_scraper already extracted the product
+PRESCRAPED_CONTEXT = """The product information below was already scraped from {url}.
+Use it as the product dictionary from the previous agent:
+{product}
+
+"""
+# Added after the product when competitor listings were scraped concurrently beforehand
+COMPETITOR_CONTEXT = """Competitor listings already scraped from the marketplace (title, category, highlights):
+{competitors}
+
+Use these competitors for the competitor analysis and competitor keywords instead of searching for new ones.
+
+"""
+
+# Added to the writing task when tools/keywords ranked the listings' phrases; the research task
+# then skips its keyword work (keyword_research_task)
+KEYWORD_CONTEXT = """Keywords ranked from the scraped product and competitor listings
+(phrase | score | listings using it | in this product):
+{keywords}
+
+Prefer these phrases over keywords you would otherwise have to work out or search for.
+
+"""
+
 @CrewBase
 class ListingCrew():
     """Research crew for comprehensive topic analysis and reporting"""
 
     agents: List[BaseAgent]
-    max_retries: int = 3
+
+    def __init__(self, tools: Optional[List[BaseTool]] = None,
+                 load_yaml: Optional[Callable[[Path], Dict[str, Any]]] = None):
+        # Search/scrape tools shared by the scraper and researcher agents
+        self.search_tools = tools if tools is not None else [website_search_tool(), ScrapeWebsiteTool()]
+        if load_yaml is not None:
+            # Shadows CrewBase's loader so a factory can hand out pre-parsed configs
+            self.load_yaml = load_yaml
+
+    def _llm(self, agent_name: str) -> Any:
+        """The agent's configured model, scheduled and hedged per config/routing.yaml"""
+        model = self.agents_config[agent_name].get('llm') # type: ignore[index]
+        return routed_llm(agent_name, model) if isinstance(model, str) else model
 
     @agent
     def scraper(self) -> Agent:
         return Agent(
             config=self.agents_config['scraper'], # type: ignore[index]
+            llm=self._llm('scraper'),
             verbose=True,
             max_retry_limit=1,
-            tools=[WebsiteSearchTool(), ScrapeWebsiteTool()],
+            tools=list(self.search_tools),
         )
     
     @agent
     def researcher(self) -> Agent:
         return Agent(
             config=self.agents_config['researcher'], # type: ignore[index]
+            llm=self._llm('researcher'),
             verbose=True,
             max_iter=2,
             reasoning=False,
             #max_reasoning_attempts=2,
             respect_context_window=True,
-            tools=[WebsiteSearchTool(), ScrapeWebsiteTool()],
+            tools=list(self.search_tools),
         )
 
     @agent
     def writer(self) -> Agent:
         return Agent(
             config=self.agents_config['writer'], # type: ignore[index]
+            llm=self._llm('writer'),
             verbose=True,
             reasoning=False,
             #max_reasoning_attempts=2,
@@ -72,51 +115,57 @@ class ListingCrew():
             #output_file='output/report.md'
         )
 
-    def _retry_with_backoff(self, func, *args, **kwargs):
-        """
-        Retry a function with exponential backoff for rate limit errors.
-        
-        Args:
-            func (callable): The function to retry
-            *args: Positional arguments for the function
-            **kwargs: Keyword arguments for the function
-        
-        Returns:
-            The result of the function call
-        
-        Raises:
-            Exception if max retries are reached
-        """
-        for attempt in range(self.max_retries):
-            try:
-                return func(*args, **kwargs)
-            except litellm.RateLimitError as e:
-                # Calculate wait time with exponential backoff
-                wait_time = min(10 * (2 ** attempt), 10)  # Max wait time of 120 seconds
-                
-                print(f"Rate limit error detected. Attempt {attempt + 1}/{self.max_retries}")
-                print(f"Error details: {e}")
-                print(f"Waiting {wait_time:.2f} seconds before retrying...")
-                
-                time.sleep(wait_time)
-            
-            except Exception as e:
-                # For non-rate-limit errors, raise immediately
-                print(f"Unexpected error occurred: {e}")
-                raise
-        
-        raise Exception(f"Failed to execute after {self.max_retries} attempts due to rate limiting")
-
     @crew
     def crew(self) -> Crew:
         """Creates the research crew"""
-        return self._retry_with_backoff(
-            lambda: Crew(
+        return Crew(
             name='Listing Crew',
             agents=self.agents,
             tasks=self.tasks,
             process=Process.sequential, # type: ignore[assignment]
             verbose=True,
             cache=True,
+        )
+
+    def prescraped_crew(self, competitors: bool = False, keywords: bool = False) -> Crew:
+        """Creates the crew for a product that was scraped without the LLM scraper agent"""
+        research_config = self.tasks_config['keyword_research_task' if keywords else 'research_task'] # type: ignore[index]
+        context = PRESCRAPED_CONTEXT + (COMPETITOR_CONTEXT if competitors else "")
+        researcher = self.researcher()
+        if keywords:
+            # Without keyword research there is nothing left to search for between iterations
+            researcher.max_iter = 1
+        research_task = Task(
+            agent=researcher,
+            config=research_config,
+            name='research_task',
+            description=context + research_config['description'],
+        )
+        writing_task = self.writing_task()
+        if keywords:
+            writing_config = self.tasks_config['writing_task'] # type: ignore[index]
+            writing_task = Task(
+                config=writing_config,
+                name='writing_task',
+                description=KEYWORD_CONTEXT + writing_config['description'],
+                max_retries=1,
             )
-        )
\ No newline at end of file
+        return Crew(
+            name='Listing Crew',
+            agents=[researcher, self.writer()],
+            tasks=[research_task, writing_task],
+            process=Process.sequential, # type: ignore[assignment]
+            verbose=True,
+            cache=True,
+        )
+
+    def discovery_crew(self) -> Crew:
+        """Creates a one-task crew that only lists competitor product URLs"""
+        return Crew(
+            name='Competitor Discovery Crew',
+            agents=[self.researcher()],
+            tasks=[Task(config=self.tasks_config['competitor_discovery_task'], name='competitor_discovery_task')], # type: ignore[index]
+            process=Process.sequential, # type: ignore[assignment]
+            verbose=True,
+            cache=True,
+        )
@@ -0,0 +1,54 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional, Iterator
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar("generation_deadline", default=None)
+
+
+class GenerationCancelled(RuntimeError):
+    """Raised inside a generation that was cancelled or ran past its deadline."""
+
+
+@dataclass
+class Deadline:
+    """When a generation must stop (monotonic time), and an event that cancels it earlier."""
+    at: Optional[float] = None
+    cancel: threading.Event = field(default_factory=threading.Event)
+
+    def remaining(self) -> Optional[float]:
+        return None if self.at is None else self.at - time.monotonic()
+
+    def check(self) -> None:
+        if self.cancel.is_set():
+            raise GenerationCancelled("Generation cancelled")
+        if self.at is not None and time.monotonic() >= self.at:
+            raise GenerationCancelled("Generation deadline exceeded")
+
+
+@contextmanager
+def generation_deadline(timeout: Optional[float] = None, cancel: Optional[threading.Event] = None) -> Iterator[Deadline]:
+    """
+    Within the block, check_deadline() raises once `timeout` seconds have passed or `cancel` is set.
+    The deadline travels with the context, so LLM calls the crew makes on this thread (and the
+    hedging threads that copy its context) stop at their next call.
+    """
+    deadline = Deadline(None if timeout is None else time.monotonic() + timeout, cancel or threading.Event())
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def check_deadline() -> None:
+    """Stop the current generation if it was cancelled or is out of time; a no-op outside one."""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
@@ -0,0 +1,103 @@
+import os
+import copy
+import logging
+import threading
+import yaml
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from crewai.tools import BaseTool
+from .crew import ListingCrew
+from .singletons import process_wide
+
+
+def _release_memoized(instance: ListingCrew) -> None:
+    """
+    Drop crewai's memoized agent/task results for a ListingCrew instance.
+    crewai.project keys them on id(instance) in a process-wide cache, so without this
+    every request leaks its agents and a later instance reusing the id would get stale ones.
+    These are crewai internals: if a crewai version lays them out differently, nothing is released.
+    """
+    marker = repr(("__instance__", id(instance)))
+    try:
+        from crewai.project.utils import cache
+        store = cache._cache
+        with cache._lock.w_locked():
+            for key in [key for key in store if marker in key]:
+                del store[key]
+    except Exception as e:
+        logging.debug(f"Could not release memoized crew members: {e}")
+
+
+class CrewFactory:
+    """
+    Process-level builder of ListingCrew instances.
+    YAML configs are parsed once per file version; the embedder, search store and stateless
+    tools are shared. Agents, tasks, crews and the website search tool (which remembers the
+    pages its crew indexed) are fresh per request.
+    """
+
+    def __init__(self):
+        self._configs: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._tools: Optional[List[BaseTool]] = None
+        self._search_tool: Optional[Callable[[], BaseTool]] = None
+        self._lock = threading.Lock()
+
+    def load_yaml(self, config_path: Path) -> Dict[str, Any]:
+        """Return a private copy of a parsed config, re-parsing only when the file changed."""
+        path = str(config_path)
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._configs.get(path)
+            if cached is None or cached[0] != mtime:
+                if cached is not None:
+                    logging.info(f"Reloading crew config {path}")
+                with open(path, encoding="utf-8") as file:
+                    content = yaml.safe_load(file)
+                cached = (mtime, content if isinstance(content, dict) else {})
+                self._configs[path] = cached
+        # CrewBase writes agent instances into the config dicts, so every crew gets its own copy
+        return copy.deepcopy(cached[1])
+
+    def tools(self) -> List[BaseTool]:
+        """Tools for one crew: its own website search tool over the shared store, and the shared scrape tool."""
+        if self._tools is None:
+            with self._lock:
+                if self._tools is None:
+                    from crewai_tools import ScrapeWebsiteTool
+                    from .tools.search_store import search_tool_factory
+                    self._search_tool = search_tool_factory()
+                    self._tools = [ScrapeWebsiteTool()]
+        search = [self._search_tool()] if self._search_tool is not None else []
+        return search + self._tools
+
+    def listing_crew(self) -> ListingCrew:
+        """A new ListingCrew backed by the shared configs and tools."""
+        return ListingCrew(tools=self.tools(), load_yaml=self.load_yaml)
+
+    def crew(self, prescraped: bool = False, competitors: bool = False, keywords: bool = False):
+        """A fresh, isolated Crew for one request."""
+        listing_crew = self.listing_crew()
+        try:
+            if prescraped:
+                return listing_crew.prescraped_crew(competitors=competitors, keywords=keywords)
+            return listing_crew.crew()
+        finally:
+            _release_memoized(listing_crew)
+
+    def discovery_crew(self):
+        """A fresh crew that only runs competitor discovery."""
+        listing_crew = self.listing_crew()
+        try:
+            return listing_crew.discovery_crew()
+        finally:
+            _release_memoized(listing_crew)
+
+    def warm_up(self) -> None:
+        """Parse the configs and build the shared tools and embedder ahead of the first request."""
+        self.crew()
+
+
+@process_wide
+def get_crew_factory() -> CrewFactory:
+    """Return the process-wide crew factory."""
+    return CrewFactory()
@@ -0,0 +1,291 @@
+import os
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+import yaml
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, Callable, Awaitable, Deque, Tuple
+try:
+    from .llm_scheduler import model_name, scheduled_llm, wrap_llm_calls
+    from .singletons import process_wide
+except ImportError:
+    from llm_scheduler import model_name, scheduled_llm, wrap_llm_calls
+    from singletons import process_wide
+
+ROUTING_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "routing.yaml")
+# Latency/error samples kept per (stage, model), and how many are needed before they steer routing
+STATS_WINDOW = int(os.environ.get("LLM_ROUTING_STATS_WINDOW", 50))
+MIN_SAMPLES = int(os.environ.get("LLM_ROUTING_MIN_SAMPLES", 5))
+# A model failing at least this share of recent calls is treated as degraded
+ERROR_RATE_THRESHOLD = float(os.environ.get("LLM_ROUTING_ERROR_RATE", 0.5))
+# Never hedge sooner than this, however fast the primary usually is
+MIN_HEDGE_DELAY = float(os.environ.get("LLM_ROUTING_MIN_HEDGE_DELAY", 2.0))
+HEDGE_POOL_SIZE = int(os.environ.get("LLM_ROUTING_POOL_SIZE", 32))
+
+_routes: Optional[Tuple[float, Dict[str, "Route"]]] = None
+_routes_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Route:
+    """Routing for one crew stage (agent)."""
+    primary: Optional[str] = None
+    fallback: Optional[str] = None
+    hedge_after: float = 30.0
+
+
+def load_routes(path: str = ROUTING_CONFIG) -> Dict[str, Route]:
+    """Routes by agent name from routing.yaml, re-read only when the file changes."""
+    global _routes
+    if not os.path.exists(path):
+        return {}
+    mtime = os.path.getmtime(path)
+    with _routes_lock:
+        if _routes is None or _routes[0] != mtime:
+            with open(path, encoding="utf-8") as file:
+                config = yaml.safe_load(file) or {}
+            _routes = (mtime, {
+                stage: Route(primary=entry.get("primary"), fallback=entry.get("fallback"),
+                             hedge_after=float(entry.get("hedge_after", Route.hedge_after)))
+                for stage, entry in config.items() if isinstance(entry, dict)
+            })
+        return _routes[1]
+
+
+class ModelStats:
+    """Sliding window of call latencies and outcomes for one model in one stage."""
+
+    def __init__(self, window: int = STATS_WINDOW):
+        self._samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((seconds, ok))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency percentile of successful calls, or None without samples."""
+        with self._lock:
+            latencies = sorted(seconds for seconds, ok in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._samples:
+                return 0.0
+            return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"samples": len(self), "p50": self.percentile(0.5), "p95": self.percentile(0.95),
+                "error_rate": round(self.error_rate(), 3)}
+
+
+def is_valid_response(result: Any) -> bool:
+    """A response worth returning: anything but an empty or blank text."""
+    return not (result is None or (isinstance(result, str) and not result.strip()))
+
+
+def _succeeded(future: Any) -> bool:
+    """For a finished future or task: it returned a valid response."""
+    return future.exception() is None and is_valid_response(future.result())
+
+
+class LLMRouter:
+    """
+    Hedged primary/fallback LLM calls.
+    The leading model gets a head start of min(hedge_after, its recent p95 latency); if it has not
+    answered by then, or fails, the same request goes to the other model and the first valid
+    response wins. A model whose recent error rate is over the threshold loses the lead.
+    Latencies are tracked per stage, since one model serves short and long prompts alike.
+    """
+
+    def __init__(self, min_samples: int = MIN_SAMPLES, error_rate_threshold: float = ERROR_RATE_THRESHOLD,
+                 min_hedge_delay: float = MIN_HEDGE_DELAY, pool_size: int = HEDGE_POOL_SIZE):
+        self.min_samples = min_samples
+        self.error_rate_threshold = error_rate_threshold
+        self.min_hedge_delay = min_hedge_delay
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="llm-hedge")
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def model_stats(self, stage: str, model: str) -> ModelStats:
+        with self._lock:
+            if (stage, model) not in self._stats:
+                self._stats[stage, model] = ModelStats()
+            return self._stats[stage, model]
+
+    def _count(self, stage: str, name: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(stage, {"calls": 0, "hedged": 0, "fallback_used": 0, "failed": 0})
+            counters[name] += 1
+
+    def degraded(self, stage: str, model: str) -> bool:
+        stats = self.model_stats(stage, model)
+        return len(stats) >= self.min_samples and stats.error_rate() >= self.error_rate_threshold
+
+    def hedge_delay(self, stage: str, route: Route, model: str) -> float:
+        """How long the leading model may take before the request is hedged."""
+        stats = self.model_stats(stage, model)
+        p95 = stats.percentile(0.95) if len(stats) >= self.min_samples else None
+        delay = route.hedge_after if p95 is None else min(route.hedge_after, p95)
+        return max(self.min_hedge_delay, delay)
+
+    def _order(self, stage: str, primary: str, fallback: str) -> Tuple[str, str]:
+        if self.degraded(stage, primary) and not self.degraded(stage, fallback):
+            return fallback, primary
+        return primary, fallback
+
+    def _timed(self, stage: str, model: str, send: Callable[[], Any], running: threading.Event) -> Any:
+        running.set()
+        started = time.monotonic()
+        try:
+            result = send()
+        except Exception:
+            self.model_stats(stage, model).record(time.monotonic() - started, False)
+            raise
+        self.model_stats(stage, model).record(time.monotonic() - started, is_valid_response(result))
+        return result
+
+    def call(self, stage: str, route: Route, senders: Dict[str, Callable[[], Any]]) -> Any:
+        """Run a hedged call; `senders` maps the primary and fallback model names to their calls."""
+        primary, fallback = list(senders)
+        lead, backup = self._order(stage, primary, fallback)
+        self._count(stage, "calls")
+
+        def submit(model: str, running: threading.Event) -> Future:
+            # Carry context variables (e.g. refresh_completions) into the worker thread
+            return self._pool.submit(contextvars.copy_context().run, self._timed, stage, model, senders[model], running)
+
+        running = threading.Event()
+        futures = {submit(lead, running): lead}
+        # The head start counts from when the lead gets a worker, not from time spent queued for one
+        running.wait()
+        done, _ = wait(futures, timeout=self.hedge_delay(stage, route, lead))
+        hedged = False
+        first_error: Optional[BaseException] = None
+        while futures:
+            if not hedged and (not done or not all(_succeeded(future) for future in done)):
+                hedged = True
+                self._count(stage, "hedged")
+                futures[submit(backup, threading.Event())] = backup
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                model = futures.pop(future)
+                error = future.exception()
+                if error is None and is_valid_response(future.result()):
+                    if model != primary:
+                        self._count(stage, "fallback_used")
+                    return future.result()
+                first_error = first_error or error
+                logging.warning(f"{stage}: {model} failed ({error or 'empty response'})")
+        self._count(stage, "failed")
+        if first_error is not None:
+            raise first_error
+        raise ValueError(f"No valid response from {primary} or {fallback}")
+
+    async def acall(self, stage: str, route: Route, senders: Dict[str, Callable[[], Awaitable[Any]]]) -> Any:
+        """Async counterpart of call()."""
+        primary, fallback = list(senders)
+        lead, backup = self._order(stage, primary, fallback)
+        self._count(stage, "calls")
+
+        async def timed(model: str) -> Any:
+            started = time.monotonic()
+            try:
+                result = await senders[model]()
+            except Exception:
+                self.model_stats(stage, model).record(time.monotonic() - started, False)
+                raise
+            self.model_stats(stage, model).record(time.monotonic() - started, is_valid_response(result))
+            return result
+
+        tasks = {asyncio.ensure_future(timed(lead)): lead}
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(stage, route, lead))
+        hedged = False
+        first_error: Optional[BaseException] = None
+        try:
+            while tasks:
+                if not hedged and (not done or not all(_succeeded(task) for task in done)):
+                    hedged = True
+                    self._count(stage, "hedged")
+                    tasks[asyncio.ensure_future(timed(backup))] = backup
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model = tasks.pop(task)
+                    error = task.exception()
+                    if error is None and is_valid_response(task.result()):
+                        if model != primary:
+                            self._count(stage, "fallback_used")
+                        return task.result()
+                    first_error = first_error or error
+                    logging.warning(f"{stage}: {model} failed ({error or 'empty response'})")
+        finally:
+            for task in tasks:
+                task.cancel()
+        self._count(stage, "failed")
+        if first_error is not None:
+            raise first_error
+        raise ValueError(f"No valid response from {primary} or {fallback}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: dict(counters) for stage, counters in self._counters.items()}
+            models = list(self._stats.items())
+        latencies: Dict[str, Dict[str, Any]] = {}
+        for (stage, model), stats in models:
+            latencies.setdefault(stage, {})[model] = stats.summary()
+        return {"stages": stages, "models": latencies}
+
+
+def route_llm(stage: str, primary: Any, fallback: Any, route: Route, router: Optional[LLMRouter] = None) -> Any:
+    """Hedge an LLM instance's call/acall against a fallback LLM; the instance stays the agent's llm."""
+    router = router or get_llm_router()
+    primary_name, fallback_name = model_name(primary), model_name(fallback)
+    if primary_name == fallback_name:
+        return primary
+    call, acall = primary.call, primary.acall
+
+    @functools.wraps(call)
+    def routed_call(*args, **kwargs):
+        return router.call(stage, route, {
+            primary_name: lambda: call(*args, **kwargs),
+            fallback_name: lambda: fallback.call(*args, **kwargs),
+        })
+
+    @functools.wraps(acall)
+    async def routed_acall(*args, **kwargs):
+        return await router.acall(stage, route, {
+            primary_name: lambda: acall(*args, **kwargs),
+            fallback_name: lambda: fallback.acall(*args, **kwargs),
+        })
+
+    # The fallback is kept on the instance so callers configuring the agent's llm (e.g. streaming) reach both models
+    return wrap_llm_calls(primary, routed_call, routed_acall, hedge_fallback=fallback)
+
+
+def routed_llm(stage: str, model: str) -> Any:
+    """The LLM for a crew stage: scheduled and cached, and hedged when routing.yaml has a fallback."""
+    route = load_routes().get(stage)
+    if route is None:
+        return scheduled_llm(model)
+    primary = scheduled_llm(route.primary or model)
+    if not route.fallback:
+        return primary
+    return route_llm(stage, primary, scheduled_llm(route.fallback), route)
+
+
+@process_wide
+def get_llm_router() -> LLMRouter:
+    """Return the process-wide LLM router."""
+    return LLMRouter()
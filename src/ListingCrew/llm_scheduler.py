@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import inspect
+import functools
+import threading
+from typing import Optional, Dict, Any, Callable, Awaitable
+try:
+    from .tools.http_scheduler import TokenBucket, parse_retry_after
+    from .completion_cache import CompletionCache, completion_key, request_params, get_completion_cache
+    from .deadlines import check_deadline
+    from .singletons import process_wide
+except ImportError:
+    from tools.http_scheduler import TokenBucket, parse_retry_after
+    from completion_cache import CompletionCache, completion_key, request_params, get_completion_cache
+    from deadlines import check_deadline
+    from singletons import process_wide
+
+# Requests and tokens per minute by provider (or by full "provider/model" name)
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    "groq": {"rpm": 30, "tpm": 6000},
+    "openai": {"rpm": 500, "tpm": 200000},
+}
+# JSON overrides, e.g. {"groq/llama3-70b-8192": {"rpm": 30, "tpm": 6000}}
+LIMITS_OVERRIDE = os.environ.get("LLM_RATE_LIMITS", "")
+# Fraction of the provider limit we allow ourselves, to stay just under it
+HEADROOM = float(os.environ.get("LLM_RATE_HEADROOM", 0.9))
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 2.0))
+BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 60.0))
+# Completion tokens reserved up front; corrected once the response is known
+COMPLETION_ESTIMATE = int(os.environ.get("LLM_COMPLETION_ESTIMATE", 512))
+CHARS_PER_TOKEN = 4
+# Send every model to this OpenAI-compatible server instead of its provider (local stand-ins, benchmarks)
+LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "")
+
+
+def estimate_tokens(messages: Any) -> int:
+    """Rough prompt size in tokens (about four characters per token)."""
+    if isinstance(messages, str):
+        text = messages
+    else:
+        text = "".join(str(message.get("content") or "") if isinstance(message, dict) else str(message)
+                       for message in messages or [])
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for provider throttling errors (litellm/openai RateLimitError or any HTTP 429)."""
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if "ratelimit" in type(current).__name__.lower():
+            return True
+        if getattr(current, "status_code", None) == 429:
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+
+def retry_after_from(error: BaseException) -> Optional[float]:
+    """Read Retry-After from the provider response attached to an error, if any."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return parse_retry_after(headers.get("retry-after"))
+    except AttributeError:
+        return None
+
+
+class ModelBudget:
+    """Request and token budgets for one provider/model, shared by every caller in the process."""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0 * 10))
+        self.tokens = TokenBucket(tpm / 60.0, tpm)
+
+    def reserve(self, tokens: int) -> float:
+        """Block until one request and `tokens` tokens fit in the budget; return the wait."""
+        return self.requests.acquire() + self.tokens.acquire(tokens)
+
+    async def reserve_async(self, tokens: int) -> float:
+        return await self.requests.acquire_async() + await self.tokens.acquire_async(tokens)
+
+    def pause(self, seconds: float) -> None:
+        self.requests.pause(seconds)
+        self.tokens.pause(seconds)
+
+
+class LLMScheduler:
+    """
+    Process-wide gate for every LLM call the crews make.
+    Calls reserve request and token budget per provider/model before they are sent, in arrival
+    order across concurrent generations, and rate-limit errors are retried after Retry-After
+    (or a jittered backoff) with the whole model paused meanwhile.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None, headroom: float = HEADROOM,
+                 max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX, completion_estimate: int = COMPLETION_ESTIMATE):
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.headroom = headroom
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.completion_estimate = completion_estimate
+        self._budgets: Dict[str, Optional[ModelBudget]] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def budget(self, model: str) -> Optional[ModelBudget]:
+        """The shared budget for a model, or None when neither it nor its provider has limits."""
+        with self._lock:
+            if model not in self._budgets:
+                limit = self.limits.get(model) or self.limits.get(model.split("/", 1)[0])
+                self._budgets[model] = ModelBudget(
+                    limit["rpm"] * self.headroom, limit["tpm"] * self.headroom,
+                ) if limit else None
+                self._counters[model] = {
+                    "calls": 0, "retries": 0, "rate_limited": 0, "failures": 0, "throttled_seconds": 0.0,
+                }
+            return self._budgets[model]
+
+    def _count(self, model: str, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[model][name] += amount
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.backoff_max)
+
+    def _settle(self, budget: Optional[ModelBudget], result: Any) -> None:
+        """Correct the completion estimate once the actual response is known."""
+        if budget is not None and isinstance(result, str):
+            budget.tokens.adjust(len(result) // CHARS_PER_TOKEN - self.completion_estimate)
+
+    def _on_rate_limit(self, model: str, budget: Optional[ModelBudget], error: BaseException,
+                       attempt: int) -> float:
+        self._count(model, "rate_limited")
+        delay = self._backoff(attempt, retry_after_from(error))
+        logging.warning(f"Rate limited by {model}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+        if budget is not None:
+            # Everyone queued on this model waits, not only the caller that was rejected
+            budget.pause(delay)
+        return delay
+
+    def call(self, model: str, messages: Any, send: Callable[[], Any]) -> Any:
+        """Send one LLM call through the model's budget, retrying rate-limit errors."""
+        budget = self.budget(model)
+        tokens = estimate_tokens(messages) + self.completion_estimate
+        for attempt in range(self.max_retries + 1):
+            if budget is not None:
+                self._count(model, "throttled_seconds", budget.reserve(tokens))
+            # A cancelled or overdue generation stops here instead of spending another call
+            check_deadline()
+            self._count(model, "calls")
+            try:
+                result = send()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    self._count(model, "failures")
+                    raise
+                delay = self._on_rate_limit(model, budget, e, attempt)
+                self._count(model, "retries")
+                if budget is None:
+                    time.sleep(delay)
+                continue
+            self._settle(budget, result)
+            return result
+
+    async def acall(self, model: str, messages: Any, send: Callable[[], Awaitable[Any]]) -> Any:
+        """Async counterpart of call(); waits never block the event loop."""
+        budget = self.budget(model)
+        tokens = estimate_tokens(messages) + self.completion_estimate
+        for attempt in range(self.max_retries + 1):
+            if budget is not None:
+                self._count(model, "throttled_seconds", await budget.reserve_async(tokens))
+            check_deadline()
+            self._count(model, "calls")
+            try:
+                result = await send()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    self._count(model, "failures")
+                    raise
+                delay = self._on_rate_limit(model, budget, e, attempt)
+                self._count(model, "retries")
+                if budget is None:
+                    await asyncio.sleep(delay)
+                continue
+            self._settle(budget, result)
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-model call counters."""
+        with self._lock:
+            return {model: dict(counters) for model, counters in self._counters.items()}
+
+
+def model_name(llm: Any) -> str:
+    """"provider/model" for an LLM instance; native provider classes drop the provider prefix."""
+    model = str(getattr(llm, "model", "") or "")
+    provider = getattr(llm, "provider", None)
+    if provider and "/" not in model:
+        model = f"{provider}/{model}"
+    return model
+
+
+def wrap_llm_calls(llm: Any, call: Callable[..., Any], acall: Callable[..., Awaitable[Any]], **attributes: Any) -> Any:
+    """Replace an LLM instance's call/acall (and set any extra attributes) in place."""
+    # BaseLLM is a pydantic model; bypass its field validation for the method overrides
+    for name, value in dict(attributes, call=call, acall=acall).items():
+        object.__setattr__(llm, name, value)
+    return llm
+
+
+def schedule_llm(llm: Any, scheduler: Optional[LLMScheduler] = None,
+                 cache: Optional[CompletionCache] = None) -> Any:
+    """
+    Route an LLM instance's call/acall through the completion cache and the scheduler.
+    Cache hits return without spending rate-limit budget; misses are scheduled and recorded.
+    The wrappers are set on the instance, so the crewai provider class (native or LiteLLM) is kept.
+    """
+    scheduler = scheduler or get_llm_scheduler()
+    cache = cache or get_completion_cache()
+    model = model_name(llm)
+    call, acall = llm.call, llm.acall
+    try:
+        parameters = list(inspect.signature(call).parameters)
+    except (TypeError, ValueError):
+        parameters = ["messages"]
+
+    def request(args, kwargs):
+        arguments = dict(zip(parameters, args), **kwargs)
+        messages = arguments.pop("messages", args[0] if args else None)
+        return messages, completion_key(model, messages, request_params(llm, arguments))
+
+    @functools.wraps(call)
+    def scheduled_call(*args, **kwargs):
+        messages, key = request(args, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = scheduler.call(model, messages, lambda: call(*args, **kwargs))
+        cache.set(key, result, model)
+        return result
+
+    @functools.wraps(acall)
+    async def scheduled_acall(*args, **kwargs):
+        messages, key = request(args, kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = await scheduler.acall(model, messages, lambda: acall(*args, **kwargs))
+        cache.set(key, result, model)
+        return result
+
+    return wrap_llm_calls(llm, scheduled_call, scheduled_acall)
+
+
+def scheduled_llm(model: str) -> Any:
+    """A crewai LLM for `model` whose calls go through the process-wide cache and scheduler."""
+    from crewai import LLM
+    llm = LLM(model=model, base_url=LLM_BASE_URL) if LLM_BASE_URL else LLM(model=model)
+    return schedule_llm(llm)
+
+
+@process_wide
+def get_llm_scheduler() -> LLMScheduler:
+    """Return the process-wide LLM scheduler."""
+    limits = dict(DEFAULT_LIMITS)
+    if LIMITS_OVERRIDE:
+        limits.update(json.loads(LIMITS_OVERRIDE))
+    return LLMScheduler(limits, headroom=HEADROOM)
@@ -1,22 +1,160 @@
 import os
 import json
-from .crew import ListingCrew
+import logging
+import threading
+from contextlib import nullcontext
+from typing import Optional, Dict, Any, List
+from .factory import get_crew_factory
+from .result_cache import get_result_cache
+from .research import MAX_COMPETITORS, research_competitors
+from .progress import EventCallback, emit, stream_crew_progress
+from .checkpoints import generation_id, get_checkpoint_store, resume_crew, checkpoint_tasks
+from .completion_cache import refresh_completions
+from .deadlines import generation_deadline, check_deadline
+from .tools.web_scraper import Scrape, product_key
+from .tools.keywords import keyword_table, format_keyword_table
+from .tools.listing_index import SIMILAR_LIMIT, get_listing_index
 
-# Create output directory if it doesn't exist
-os.makedirs('output', exist_ok=True)
+# "agent" lets the researcher look competitors up itself; "fanout" discovers them first and scrapes them concurrently
+RESEARCH_MODE = os.environ.get("LISTINGCREW_RESEARCH_MODE", "agent")
+RESEARCH_MODES = ("agent", "fanout")
+# Rank the product's and competitors' phrases locally and hand the table to the researcher and writer
+KEYWORDS = os.environ.get("LISTINGCREW_KEYWORDS", "1").lower() in ("1", "true", "yes")
+# Give the researcher the most similar listings already indexed; fan-out only searches the web when there are too few.
+# Off by default: with a remote embedder it adds two embedding calls to every generation.
+SIMILAR_LISTINGS = os.environ.get("LISTINGCREW_SIMILAR_LISTINGS", "0").lower() in ("1", "true", "yes")
 
-def generate_listing(url: str) -> dict:
+def prescrape_product(url: str) -> Optional[Dict[str, Any]]:
+    """
+    Scrape the product deterministically when the site is supported (Amazon, by ASIN).
+    Returns None for unsupported sites or failed scrapes so the LLM scraper agent can take over.
+    """
+    try:
+        scraper = Scrape(url)
+    except ValueError:
+        return None
+    if not scraper.get_asin():
+        return None
+    product = scraper.run()
+    if not product or not product.get("title"):
+        return None
+    return product
+
+def similar_listings(url: str, product: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Indexed listings most similar to the product, or none when the index cannot be searched."""
+    try:
+        return get_listing_index().similar(dict(product, url=url), SIMILAR_LIMIT, exclude=[product_key(url)])
+    except Exception as e:
+        logging.warning(f"Similar listing search failed for {url}: {e}")
+        return []
+
+def index_listings(url: str, product: Dict[str, Any], competitors: List[Dict[str, Any]]) -> None:
+    """Add the product and the competitors scraped for it to the listing index."""
+    try:
+        get_listing_index().add([dict(product, url=url)] + competitors)
+    except Exception as e:
+        logging.warning(f"Could not index listings for {url}: {e}")
+
+def generate_listing(url: str, prescrape: bool = True, force_refresh: bool = False,
+                     research_mode: Optional[str] = None, on_event: Optional[EventCallback] = None,
+                     generation: Optional[str] = None, timeout: Optional[float] = None,
+                     cancel: Optional[threading.Event] = None) -> dict:
     """
     Run the ListingCrew and return the structured result as a dictionary.
+    Structured results are cached per product and prompt/model configuration;
+    force_refresh bypasses the cached listing and replaces it.
+    Task outputs are checkpointed under `generation` (by default one id per product and
+    configuration), so a retry after a failed run resumes from the first failed task.
+    research_mode overrides LISTINGCREW_RESEARCH_MODE ("agent" or "fanout").
+    on_event(name, payload) receives stage events and the writer's tokens as they happen.
+    The run stops with GenerationCancelled at its next stage or LLM call once `timeout`
+    seconds have passed or `cancel` is set.
     """
-    inputs = {'url': url}
-    crew_result = ListingCrew().crew().kickoff(inputs=inputs)
+    research_mode = research_mode or RESEARCH_MODE
+    if research_mode not in RESEARCH_MODES:
+        raise ValueError(f"Unknown research mode: {research_mode}")
+    cache = get_result_cache()
+    if not force_refresh:
+        cached = cache.get(url)
+        if cached is not None:
+            logging.info(f"Listing cache hit for {url}")
+            emit(on_event, "cache_hit")
+            return cached
+
+    generation = generation or generation_id(url)
+    checkpoints = get_checkpoint_store()
+    if force_refresh:
+        checkpoints.clear(generation)
+    with generation_deadline(timeout, cancel):
+        result = _run_crew(url, prescrape, research_mode, on_event, generation, force_refresh)
+    if "raw_output" not in result:
+        cache.set(url, result)
+        checkpoints.clear(generation)
+    return result
+
+def invalidate_listing(url: Optional[str] = None) -> None:
+    """
+    Drop the cached listing for a URL, or every cached listing when no URL is given.
+    """
+    get_result_cache().invalidate(url)
+
+def _run_crew(url: str, prescrape: bool, research_mode: str = "agent",
+              on_event: Optional[EventCallback] = None, generation: Optional[str] = None,
+              force_refresh: bool = False) -> dict:
+    """
+    Kick off the crew for a URL and parse the writer's output.
+    """
+    checkpoints = get_checkpoint_store()
+    generation = generation or generation_id(url)
+    completed = checkpoints.load(generation)
+    product = prescrape_product(url) if prescrape else None
+    check_deadline()
+    if product:
+        # Skip the scraper agent: the structured product goes straight into the research task
+        logging.info(f"Pre-scraped {url}; skipping the scraper agent")
+        emit(on_event, "scrape_done", {"task": "prescrape", "output": product})
+        inputs = {'url': url, 'product': json.dumps(product)}
+        research = "research_task" not in completed
+        similar = similar_listings(url, product) if SIMILAR_LISTINGS and research else []
+        if similar:
+            emit(on_event, "similar_done", {"output": similar})
+        scraped = []
+        if research_mode == "fanout" and research and len(similar) < SIMILAR_LIMIT:
+            known = {product_key(listing["url"]) for listing in similar}
+            scraped = [competitor for competitor in research_competitors(url, product, MAX_COMPETITORS)
+                       if product_key(competitor["url"]) not in known]
+        competitors = similar + scraped
+        if competitors:
+            emit(on_event, "competitors_done", {"output": competitors})
+            inputs['competitors'] = json.dumps(competitors)
+        if SIMILAR_LISTINGS:
+            index_listings(url, product, scraped)
+        check_deadline()
+        if KEYWORDS:
+            keywords = keyword_table(product, competitors)
+            emit(on_event, "keywords_done", {"output": keywords})
+            inputs['keywords'] = format_keyword_table(keywords)
+        crew = get_crew_factory().crew(prescraped=True, competitors=bool(competitors), keywords=KEYWORDS)
+    else:
+        inputs = {'url': url}
+        crew = get_crew_factory().crew()
+
+    skipped, resumed_context = resume_crew(crew, completed)
+    if skipped:
+        logging.info(f"Resuming generation {generation} for {url}; reusing {', '.join(skipped)}")
+        emit(on_event, "resumed", {"generation_id": generation, "skipped": skipped})
+        inputs['resumed_context'] = resumed_context
+    checkpoints.record_run(len(skipped), len(crew.tasks))
+    checkpoint_tasks(crew, checkpoints, generation)
+    # A resumed or forced run must not be answered with the completions of the attempt it replaces
+    refresh = refresh_completions() if skipped or force_refresh else nullcontext()
+    with refresh, stream_crew_progress(crew, on_event):
+        crew_result = crew.kickoff(inputs=inputs)
 
     # The writer task is the last one, and its output contains the structured data.
     # Accessing the specific task output is more reliable than using the crew's final raw output.
-    # Assuming the writing task is the 3rd task (index 2).
-    if crew_result.tasks_output and len(crew_result.tasks_output) > 2:
-        writer_output_raw = crew_result.tasks_output[2].raw
+    if crew_result.tasks_output:
+        writer_output_raw = crew_result.tasks_output[-1].raw
         try:
             # The output from the writer agent is expected to be a JSON string.
             return json.loads(writer_output_raw)
@@ -31,6 +169,8 @@ def run():
     """
     CLI entry point for manual testing.
     """
+    # Create output directory if it doesn't exist
+    os.makedirs('output', exist_ok=True)
     url = 'https://www.amazon.ca/Patella-Support-Basketball-Tendonitis-Volleyball/dp/B07DLFP8Q5/'
     result = generate_listing(url)
     print("\n\n=== FINAL REPORT ===\n\n")
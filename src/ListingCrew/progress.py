@@ -0,0 +1,125 @@
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Iterator, Optional
+try:
+    from .llm_scheduler import wrap_llm_calls
+except ImportError:
+    from llm_scheduler import wrap_llm_calls
+
+# Receives (event name, payload) while a listing is generated
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+# Stage event emitted when each crew task finishes
+TASK_EVENTS = {
+    "scraping_task": "scrape_done",
+    "research_task": "research_done",
+    "writing_task": "writing_done",
+}
+
+# The writer call a thread is working for; hedged attempts inherit it through the copied context
+_writer_call: ContextVar[Optional[object]] = ContextVar("writer_call", default=None)
+
+
+def emit(on_event: Optional[EventCallback], name: str, payload: Optional[Dict[str, Any]] = None) -> None:
+    """Send an event to the callback; a failing listener never breaks the generation."""
+    if on_event is None:
+        return
+    try:
+        on_event(name, payload or {})
+    except Exception as e:
+        logging.warning(f"Progress listener failed on {name}: {e}")
+
+
+@contextmanager
+def stream_crew_progress(crew: Any, on_event: Optional[EventCallback]) -> Iterator[None]:
+    """
+    Report a crew's progress while it runs: a stage event with the task output as each task
+    finishes, and the writer's tokens as they arrive (the last task's LLM is switched to streaming,
+    and so is its hedge fallback when the stage is routed).
+    A hedged call streams from two models at once; only the first of them to send a token is
+    forwarded. If the other one then wins, the writing_done event carries the text actually used.
+    """
+    if on_event is None:
+        yield
+        return
+
+    from crewai.events import crewai_event_bus, LLMStreamChunkEvent
+
+    previous = crew.task_callback
+
+    def on_task_done(task_output: Any) -> None:
+        if previous is not None:
+            previous(task_output)
+        name = getattr(task_output, "name", None) or ""
+        emit(on_event, TASK_EVENTS.get(name, "task_done"), {"task": name, "output": task_output.raw})
+
+    writer_task = crew.tasks[-1]
+    writer_task_id = str(writer_task.id)
+    writer_llm = getattr(writer_task.agent, "llm", None)
+    # The writer call being streamed and the provider call_id whose tokens are forwarded for it
+    streaming: Dict[str, Any] = {"call": None, "call_id": None}
+    lock = threading.Lock()
+    if writer_llm is not None:
+        for llm in (writer_llm, getattr(writer_llm, "hedge_fallback", None)):
+            if llm is not None:
+                llm.stream = True
+        _mark_writer_calls(writer_llm, streaming, lock)
+
+    def on_chunk(source: Any, event: Any) -> None:
+        # The bus is process-wide: only forward this crew's writer tokens
+        if event.task_id != writer_task_id or not event.chunk or event.tool_call is not None:
+            return
+        with lock:
+            # Tokens from a hedge that lost an earlier call are dropped
+            if _writer_call.get() is not streaming["call"]:
+                return
+            if streaming["call_id"] is None:
+                streaming["call_id"] = event.call_id
+            elif event.call_id != streaming["call_id"]:
+                return
+        emit(on_event, "token", {"text": event.chunk})
+
+    crew.task_callback = on_task_done
+    crewai_event_bus.on(LLMStreamChunkEvent)(on_chunk)
+    try:
+        yield
+    finally:
+        crewai_event_bus.off(LLMStreamChunkEvent, on_chunk)
+
+
+def _mark_writer_calls(llm: Any, streaming: Dict[str, Any], lock: threading.Lock) -> None:
+    """Wrap the writer LLM's call/acall so each call starts a new stream that its own attempts can claim."""
+    call, acall = llm.call, llm.acall
+
+    def start() -> Any:
+        marker = object()
+        with lock:
+            streaming["call"], streaming["call_id"] = marker, None
+        return _writer_call.set(marker)
+
+    def finish(token: Any) -> None:
+        _writer_call.reset(token)
+        # A hedge that lost keeps running; nothing it sends belongs to a stream any more
+        with lock:
+            streaming["call"] = object()
+
+    @functools.wraps(call)
+    def streamed_call(*args, **kwargs):
+        token = start()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            finish(token)
+
+    @functools.wraps(acall)
+    async def streamed_acall(*args, **kwargs):
+        token = start()
+        try:
+            return await acall(*args, **kwargs)
+        finally:
+            finish(token)
+
+    wrap_llm_calls(llm, streamed_call, streamed_acall)
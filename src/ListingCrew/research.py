@@ -0,0 +1,86 @@
+import os
+import re
+import json
+import logging
+from typing import Optional, Dict, Any, List
+from .factory import get_crew_factory
+from .tools.web_scraper import Scrape, product_key
+
+# Competitor fan-out: how many competitors to research and how many pages to fetch at once
+MAX_COMPETITORS = int(os.environ.get("RESEARCH_MAX_COMPETITORS", 5))
+CONCURRENCY = int(os.environ.get("RESEARCH_CONCURRENCY", 4))
+HIGHLIGHTS = 3
+
+URL_PATTERN = re.compile(r"https?://[^\s\"'<>\],]+")
+
+
+def parse_competitor_urls(raw: str, url: str, limit: int = MAX_COMPETITORS) -> List[str]:
+    """
+    Pull competitor product URLs out of the discovery task's output.
+    Accepts a JSON list or free text; drops the product itself, duplicates of the
+    same product and pages the deterministic scraper cannot read.
+    """
+    try:
+        candidates = json.loads(raw)
+        if not isinstance(candidates, list):
+            candidates = URL_PATTERN.findall(raw)
+    except (json.JSONDecodeError, TypeError):
+        candidates = URL_PATTERN.findall(raw or "")
+
+    seen = {product_key(url)}
+    urls = []
+    for candidate in candidates:
+        if not isinstance(candidate, str):
+            continue
+        try:
+            asin = Scrape(candidate, use_cache=False).get_asin()
+        except ValueError:
+            continue
+        if not asin or asin in seen:
+            continue
+        seen.add(asin)
+        urls.append(candidate.strip().rstrip(".;:)"))
+        if len(urls) >= limit:
+            break
+    return urls
+
+
+def summarise_competitor(url: str, product: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A compact, deterministic summary of a scraped competitor for the research prompt."""
+    if not product or not product.get("title"):
+        return None
+    highlights = [line.strip() for line in product.get("description") or [] if line and line.strip()]
+    return {
+        "url": url,
+        "title": product["title"],
+        "category": product.get("category"),
+        "highlights": highlights[:HIGHLIGHTS],
+    }
+
+
+def discover_competitors(url: str, product: Dict[str, Any], limit: int = MAX_COMPETITORS) -> List[str]:
+    """Ask the researcher for candidate competitor URLs, without scraping them."""
+    inputs = {'url': url, 'product': json.dumps(product), 'max_competitors': limit}
+    crew_result = get_crew_factory().discovery_crew().kickoff(inputs=inputs)
+    raw = crew_result.tasks_output[-1].raw if crew_result.tasks_output else str(crew_result.raw)
+    return parse_competitor_urls(raw, url, limit)
+
+
+def research_competitors(url: str, product: Dict[str, Any], limit: int = MAX_COMPETITORS,
+                         concurrency: int = CONCURRENCY) -> List[Dict[str, Any]]:
+    """
+    Fan out competitor research: discover candidates with one LLM call, then scrape and
+    summarise them concurrently. Returns the summaries of the competitors that could be read.
+    """
+    try:
+        urls = discover_competitors(url, product, limit)
+    except Exception as e:
+        logging.warning(f"Competitor discovery failed for {url}: {e}")
+        return []
+    if not urls:
+        return []
+
+    logging.info(f"Scraping {len(urls)} competitors of {url} with concurrency {concurrency}")
+    pages = Scrape.scrape_many(urls, concurrency=concurrency, per_host=concurrency)
+    summaries = [summarise_competitor(competitor, page) for competitor, page in zip(urls, pages)]
+    return [summary for summary in summaries if summary]
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import yaml
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from .singletons import process_wide
+from .tools.disk_cache import DiskCache
+from .tools.web_scraper import product_key
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
+CONFIG_FILES = ("agents.yaml", "tasks.yaml", "routing.yaml")
+
+# Listing cache; set LISTING_CACHE_PATH to an empty string to keep only the in-memory tier
+CACHE_PATH = os.environ.get("LISTING_CACHE_PATH", os.path.join("output", "cache", "listings.sqlite3"))
+CACHE_TTL = float(os.environ.get("LISTING_CACHE_TTL", 7 * 24 * 60 * 60))
+CACHE_MAX_BYTES = int(os.environ.get("LISTING_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+MEMORY_ENTRIES = int(os.environ.get("LISTING_CACHE_MEMORY_ENTRIES", 256))
+
+_fingerprint: Optional[Tuple[Tuple[float, ...], str]] = None
+_fingerprint_lock = threading.Lock()
+
+
+def llm_names(agents_config: Dict[str, Any]) -> List[str]:
+    """The model each agent is configured to use, in agent order."""
+    return [str(agent.get("llm", "")) for agent in agents_config.values() if isinstance(agent, dict)]
+
+
+def config_fingerprint() -> str:
+    """Hash of the agent/task/routing YAML and the configured LLM names; recomputed only when the files change."""
+    global _fingerprint
+    paths = [os.path.join(CONFIG_DIR, name) for name in CONFIG_FILES]
+    mtimes = tuple(os.path.getmtime(path) for path in paths)
+    with _fingerprint_lock:
+        if _fingerprint is None or _fingerprint[0] != mtimes:
+            digest = hashlib.sha256()
+            for path in paths:
+                with open(path, "rb") as file:
+                    digest.update(file.read())
+            with open(paths[0], encoding="utf-8") as file:
+                agents_config = yaml.safe_load(file) or {}
+            digest.update(json.dumps(llm_names(agents_config)).encode())
+            _fingerprint = (mtimes, digest.hexdigest()[:16])
+        return _fingerprint[1]
+
+
+class ResultCache:
+    """Two-tier cache of generated listings: an in-memory LRU in front of an on-disk TTL store."""
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = CACHE_TTL,
+                 max_bytes: Optional[int] = CACHE_MAX_BYTES, memory_entries: int = MEMORY_ENTRIES):
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = DiskCache(path, ttl=ttl, max_bytes=max_bytes) if path else None
+
+    @staticmethod
+    def key(url: str) -> str:
+        return f"{product_key(url)}|{config_fingerprint()}"
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the cached listing for a URL, checking memory first and then disk."""
+        key = self.key(url)
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                stored_at, result = hit
+                if self.ttl is None or time.time() - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    return result
+                del self._memory[key]
+        if self.disk is None:
+            return None
+        entry = self.disk.get_entry(key)
+        if entry is None or not entry.fresh:
+            return None
+        result = json.loads(entry.value)
+        self._remember(key, result, entry.stored_at)
+        return result
+
+    def set(self, url: str, result: Dict[str, Any]) -> None:
+        """Store a listing in both tiers."""
+        key = self.key(url)
+        self._remember(key, result, time.time())
+        if self.disk is not None:
+            self.disk.set(key, json.dumps(result).encode(), meta={"url": url})
+
+    def invalidate(self, url: Optional[str] = None) -> None:
+        """Drop the cached listing for one URL, or every cached listing when no URL is given."""
+        if url is None:
+            with self._lock:
+                self._memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+            return
+        key = self.key(url)
+        with self._lock:
+            self._memory.pop(key, None)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def _remember(self, key: str, result: Dict[str, Any], stored_at: float) -> None:
+        if self.memory_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (stored_at, result)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+
+@process_wide
+def get_result_cache() -> ResultCache:
+    """Return the process-wide listing cache."""
+    return ResultCache(CACHE_PATH or None)
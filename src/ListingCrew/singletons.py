@@ -0,0 +1,27 @@
+import functools
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ProcessWide(Generic[T]):
+    """A getter for one lazily created, process-wide instance; `instance` is None until first use."""
+
+    def __init__(self, create: Callable[[], T]):
+        self.create = create
+        self.instance: Optional[T] = None
+        self._lock = threading.Lock()
+        functools.update_wrapper(self, create)
+
+    def __call__(self) -> T:
+        if self.instance is None:
+            with self._lock:
+                if self.instance is None:
+                    self.instance = self.create()
+        return self.instance
+
+
+def process_wide(create: Callable[[], T]) -> ProcessWide[T]:
+    """Decorate a factory into the getter of the instance it creates, shared by the whole process."""
+    return ProcessWide(create)
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    value: bytes
+    meta: Dict[str, Any] = field(default_factory=dict)
+    stored_at: float = 0.0
+    ttl: Optional[float] = None
+
+    @property
+    def fresh(self) -> bool:
+        """Whether the entry is still inside its time-to-live."""
+        return self.ttl is None or time.time() - self.stored_at < self.ttl
+
+
+class DiskCache:
+    """SQLite-backed key/value store with zlib compression, TTL and an LRU size cap."""
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                meta TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at)")
+        self._conn.commit()
+
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry for a key, fresh or stale, and mark it as recently used."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, meta, stored_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        try:
+            value = zlib.decompress(row[0])
+        except zlib.error as e:
+            logging.warning(f"Dropping corrupt cache entry {key}: {e}")
+            self.delete(key)
+            return None
+        return CacheEntry(key=key, value=value, meta=json.loads(row[1]), stored_at=row[2], ttl=self.ttl)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the cached value for a key if it has not expired."""
+        entry = self.get_entry(key)
+        return entry.value if entry and entry.fresh else None
+
+    def set(self, key: str, value: bytes, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Store a value, then evict least recently used entries beyond the size cap."""
+        blob = zlib.compress(value)
+        meta_json = json.dumps(meta or {})
+        now = time.time()
+        with self._lock:
+            # The metadata is stored alongside the value, so it counts towards the size cap too
+            self._conn.execute(
+                """INSERT OR REPLACE INTO entries (key, value, meta, size, stored_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)""",
+                (key, blob, meta_json, len(blob) + len(meta_json.encode("utf-8")), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def touch(self, key: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Restart an entry's TTL, e.g. after a successful revalidation."""
+        now = time.time()
+        with self._lock:
+            if meta is None:
+                self._conn.execute(
+                    "UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key)
+                )
+            else:
+                meta_json = json.dumps(meta)
+                self._conn.execute(
+                    "UPDATE entries SET stored_at = ?, accessed_at = ?, meta = ?, size = LENGTH(value) + ? WHERE key = ?",
+                    (now, now, meta_json, len(meta_json.encode("utf-8")), key)
+                )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        """Remove a single entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        """Delete every entry past its TTL and return how many were removed."""
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM entries WHERE stored_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def vacuum(self) -> None:
+        """Rebuild the database file so space freed by deleted entries goes back to the filesystem."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+
+    def size(self) -> int:
+        """Total bytes currently stored: compressed values plus their metadata."""
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _evict(self) -> None:
+        if self.max_bytes is None:
+            return
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+    def close(self) -> None:
+        """Close the underlying connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,160 @@
+import os
+import logging
+import threading
+import numpy as np
+from typing import Dict, Any, List, Tuple
+try:
+    from ..singletons import process_wide
+except ImportError:
+    from singletons import process_wide
+
+# "openai" embeds through the OpenAI API like crewai_tools does; "local" runs a small model on CPU
+EMBEDDER = os.environ.get("SEARCH_EMBEDDER", "openai")
+EMBEDDERS = ("openai", "local")
+LOCAL_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+# Directory with model.onnx and tokenizer.json; by default chromadb's cached copy of all-MiniLM-L6-v2
+LOCAL_MODEL_DIR = os.environ.get("LOCAL_EMBEDDING_MODEL_DIR", "")
+BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+# CPU threads for local inference; 0 leaves it to the runtime (one per core)
+THREADS = int(os.environ.get("EMBEDDING_THREADS", 0))
+MAX_TOKENS = int(os.environ.get("EMBEDDING_MAX_TOKENS", 256))
+# How stored vectors are encoded: float32, float16 (half the size) or int8 (a quarter, one scale per vector)
+VECTOR_DTYPE = os.environ.get("SEARCH_VECTOR_DTYPE", "float32")
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale each row to unit length, leaving all-zero rows alone."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def mean_pool(hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """Average token embeddings over the real (unpadded) tokens of each sequence."""
+    mask = attention_mask[..., np.newaxis].astype(hidden.dtype)
+    return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+
+def encode_vectors(vectors: np.ndarray, dtype: str = VECTOR_DTYPE) -> Tuple[bytes, Dict[str, Any]]:
+    """Pack a (rows, dims) float matrix for storage; the returned meta is needed to decode it."""
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype: {dtype}")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    meta: Dict[str, Any] = {"shape": list(vectors.shape), "dtype": dtype}
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1, initial=0.0) / 127.0
+        scales = np.where(scales == 0, 1.0, scales).astype(np.float32)
+        quantized = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+        return quantized.tobytes() + scales.tobytes(), meta
+    return vectors.astype(dtype).tobytes(), meta
+
+
+def decode_vectors(value: bytes, meta: Dict[str, Any]) -> np.ndarray:
+    """Inverse of encode_vectors, always as float32."""
+    shape = tuple(meta["shape"])
+    dtype = meta.get("dtype", "float32")
+    if dtype == "int8":
+        count = int(np.prod(shape))
+        quantized = np.frombuffer(value, dtype=np.int8, count=count).reshape(shape)
+        scales = np.frombuffer(value, dtype=np.float32, offset=count)
+        return quantized.astype(np.float32) * scales[:, np.newaxis]
+    return np.frombuffer(value, dtype=dtype).reshape(shape).astype(np.float32)
+
+
+class LocalEmbedder:
+    """
+    Sentence embeddings on CPU, no network calls once the model is on disk.
+    Uses sentence-transformers when it is installed, otherwise the ONNX export of
+    all-MiniLM-L6-v2 through onnxruntime. Texts are encoded in batches of `batch_size`,
+    sorted by length so each batch is only padded to its own longest text.
+    """
+
+    def __init__(self, model: str = LOCAL_MODEL, batch_size: int = BATCH_SIZE, threads: int = THREADS,
+                 model_dir: str = LOCAL_MODEL_DIR, max_tokens: int = MAX_TOKENS):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.model = model
+        self.batch_size = batch_size
+        self.threads = threads
+        self.model_dir = model_dir
+        self.max_tokens = max_tokens
+        self._encoder: Any = None
+        self._session: Any = None
+        self._tokenizer: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        """Model name embeddings are cached under."""
+        return f"local/{self.model}"
+
+    def _load(self) -> None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            self._load_onnx()
+            return
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self._encoder = SentenceTransformer(self.model, device="cpu")
+        logging.info(f"Loaded local embedding model {self.model} (sentence-transformers)")
+
+    def _load_onnx(self) -> None:
+        import onnxruntime
+        from tokenizers import Tokenizer
+        model_dir = self.model_dir
+        if not model_dir:
+            if self.model != "all-MiniLM-L6-v2":
+                raise ValueError(f"Without sentence-transformers, set LOCAL_EMBEDDING_MODEL_DIR for {self.model}")
+            from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+            downloader = ONNXMiniLM_L6_V2()
+            downloader._download_model_if_not_exists()
+            model_dir = os.path.join(downloader.DOWNLOAD_PATH, downloader.EXTRACTED_FOLDER_NAME)
+
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        session = onnxruntime.InferenceSession(os.path.join(model_dir, "model.onnx"), sess_options=options,
+                                               providers=["CPUExecutionProvider"])
+        tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=self.max_tokens)
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self._session, self._tokenizer = session, tokenizer
+        logging.info(f"Loaded local embedding model {self.model} (onnxruntime, {self.threads or 'default'} threads)")
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask,
+                  "token_type_ids": np.zeros_like(input_ids)}
+        names = {node.name for node in self._session.get_inputs()}
+        hidden = self._session.run(None, {name: value for name, value in inputs.items() if name in names})[0]
+        return mean_pool(hidden, attention_mask)
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        """One unit-length float32 vector per text."""
+        if self._encoder is None and self._session is None:
+            with self._lock:
+                if self._encoder is None and self._session is None:
+                    self._load()
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        if self._encoder is not None:
+            return np.asarray(self._encoder.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                                   normalize_embeddings=True), dtype=np.float32)
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        batches = [self._encode_batch([texts[index] for index in order[start:start + self.batch_size]])
+                   for start in range(0, len(texts), self.batch_size)]
+        vectors = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        vectors[order] = np.concatenate(batches)
+        return normalize(vectors)
+
+
+@process_wide
+def get_local_embedder() -> LocalEmbedder:
+    """Return the process-wide local embedder; the model is loaded on first use."""
+    return LocalEmbedder()
@@ -0,0 +1,220 @@
+import time
+import asyncio
+import random
+import logging
+import threading
+import requests
+from email.utils import parsedate_to_datetime
+from typing import Optional, Dict, Any
+from urllib.parse import urlparse
+
+# Responses that mean "slow down" or "try again later"
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while a host's circuit is open."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    Tokens are reserved up front, so concurrent callers are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _reserve(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens, returning how long the caller must wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """Block until the tokens are available and return the time spent waiting."""
+        wait = self._reserve(amount)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, amount: float = 1.0) -> float:
+        """Like acquire(), but waits without blocking the event loop."""
+        wait = self._reserve(amount)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def adjust(self, amount: float) -> None:
+        """Charge (or refund, when negative) tokens after the fact without waiting."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every new reservation for at least `seconds` (e.g. a Retry-After)."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+class CircuitBreaker:
+    """Open after consecutive failures, then let one trial request through after a cool-down."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HostScheduler:
+    """Rate-limited, retrying HTTP client shared by every scraper in the process."""
+
+    def __init__(self, session: requests.Session, rate: float = 2.0, burst: int = 10,
+                 max_retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.session = session
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _host_state(self, host: str):
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+                self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._counters[host] = {
+                    "requests": 0, "retries": 0, "failures": 0, "rejected": 0, "throttled_seconds": 0.0,
+                }
+            return self._buckets[host], self._breakers[host]
+
+    def _count(self, host: str, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[host][name] += amount
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.backoff_max)
+
+    def get(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request through the host's token bucket, retrying transient failures.
+
+        Retryable responses are returned as-is once retries run out so the caller
+        can still inspect them; network errors are re-raised.
+        """
+        host = urlparse(url).netloc
+        bucket, breaker = self._host_state(host)
+        send = getattr(self.session, method.lower())
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self._count(host, "rejected")
+                raise CircuitOpenError(f"Circuit open for {host}; not sending request")
+
+            self._count(host, "throttled_seconds", bucket.acquire())
+            self._count(host, "requests")
+            retry_after = None
+            try:
+                response = send(url, **kwargs)
+            except requests.RequestException as e:
+                # Every failure reaches the breaker, or a failed half-open trial would keep the host shut
+                breaker.record_failure()
+                self._count(host, "failures")
+                if attempt == self.max_retries or not isinstance(e, (requests.ConnectionError, requests.Timeout)):
+                    raise
+                logging.warning(f"Request to {host} failed ({e}); retrying")
+            else:
+                if response.status_code not in RETRYABLE_STATUSES:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                self._count(host, "failures")
+                if attempt == self.max_retries:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                logging.warning(f"{host} answered {response.status_code}; retrying")
+                response.close()
+
+            self._count(host, "retries")
+            delay = self._backoff(attempt, retry_after)
+            if retry_after is not None:
+                # Every request to this host waits out the server's Retry-After, this one in acquire()
+                bucket.pause(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host counters and circuit state."""
+        with self._lock:
+            return {
+                host: dict(counters, circuit=self._breakers[host].state)
+                for host, counters in self._counters.items()
+            }
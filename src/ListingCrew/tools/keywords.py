@@ -0,0 +1,155 @@
+import os
+import re
+import numpy as np
+from typing import Optional, Dict, Any, Iterable, List
+
+# Phrases of up to MAX_NGRAM words; phrases of LONG_TAIL words or more are reported as long-tail
+MAX_NGRAM = int(os.environ.get("KEYWORDS_MAX_NGRAM", 4))
+LONG_TAIL = 3
+KEYWORD_LIMIT = int(os.environ.get("KEYWORDS_LIMIT", 15))
+# BM25 term-frequency saturation and length normalisation
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Extra weight per additional word, so specific phrases are not always outranked by their words
+LENGTH_BONUS = 0.5
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['\-.][a-z0-9]+)*")
+# Phrases never span a line (title, bullet) or a sentence/clause break
+SEGMENT_PATTERN = re.compile(r"[\n.;:!?,()|/]+(?:\s|$)|\n|[()|/]")
+# Words a phrase may contain but never start or end with
+STOPWORDS = frozenset("""
+a about above after all also an and any are as at be been before being below between both but by can
+did do does each even every for from further had has have how if in into is it its just more most
+much no nor not of off on once only or other our out over own same so some such than that the their
+them then there these they this those through to too under until up upon very was we were what when
+where which while who why will with within without you your yours
+""".split())
+# Listing filler that says nothing about the product
+FILLER = frozenset("""
+best brand buy free gift great high ideal item new perfect premium product products quality
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall((text or "").lower())
+
+
+def segments(text: str) -> List[List[str]]:
+    """The tokens of each line, sentence or clause of a text."""
+    return [tokens for tokens in (tokenize(part) for part in SEGMENT_PATTERN.split(text or "")) if tokens]
+
+
+def phrases(tokens: List[str], max_ngram: int = MAX_NGRAM) -> Iterable[str]:
+    """Every n-gram up to max_ngram words that neither starts nor ends with a stopword or filler."""
+    for start, first in enumerate(tokens):
+        if first in STOPWORDS or first in FILLER:
+            continue
+        for end in range(start + 1, min(start + max_ngram, len(tokens)) + 1):
+            last = tokens[end - 1]
+            if last not in STOPWORDS and last not in FILLER:
+                yield " ".join(tokens[start:end])
+
+
+def listing_text(listing: Dict[str, Any]) -> str:
+    """Title, category and bullets of a scraped product or competitor summary as one text."""
+    parts = [listing.get("title"), listing.get("category")]
+    for field in ("description", "highlights"):
+        value = listing.get(field)
+        parts.extend(value if isinstance(value, list) else [value])
+    return "\n".join(str(part) for part in parts if part)
+
+
+class KeywordIndex:
+    """
+    Term statistics for a handful of listings: a (listings x phrases) count matrix with
+    BM25-saturated, length-normalised term frequencies, computed with numpy.
+    """
+
+    def __init__(self, texts: List[str], max_ngram: int = MAX_NGRAM):
+        vocabulary: Dict[str, int] = {}
+        rows: List[int] = []
+        columns: List[int] = []
+        lengths = []
+        for row, text in enumerate(texts):
+            parts = segments(text)
+            lengths.append(sum(len(tokens) for tokens in parts))
+            for tokens in parts:
+                for phrase in phrases(tokens, max_ngram):
+                    rows.append(row)
+                    columns.append(vocabulary.setdefault(phrase, len(vocabulary)))
+        self.phrases = np.array(sorted(vocabulary, key=vocabulary.get), dtype=object)
+        self.ngram = np.array([phrase.count(" ") + 1 for phrase in self.phrases], dtype=np.int64)
+        size = len(texts) * len(vocabulary)
+        flat = np.asarray(rows, dtype=np.int64) * len(vocabulary) + np.asarray(columns, dtype=np.int64)
+        self.counts = np.bincount(flat, minlength=size).reshape(len(texts), len(vocabulary)).astype(np.float64)
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.phrases)
+
+    def document_frequency(self) -> np.ndarray:
+        return (self.counts > 0).sum(axis=0)
+
+    def bm25_tf(self, k1: float = BM25_K1, b: float = BM25_B) -> np.ndarray:
+        average = self.lengths.mean() if len(self.lengths) and self.lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * self.lengths / average)
+        return self.counts * (k1 + 1) / (self.counts + norm[:, np.newaxis])
+
+    def scores(self) -> np.ndarray:
+        """
+        Keyword weight per phrase: BM25 term frequency summed over the listings, times
+        1 + ln(listings using it), times a mild bonus per extra word. Across one product's
+        competitors a widely used phrase is the market's vocabulary, so document frequency
+        raises the weight instead of discounting it as IDF would over a general corpus;
+        generic words are kept out by the stopword and filler lists instead.
+        """
+        coverage = 1 + np.log(np.maximum(self.document_frequency(), 1))
+        return self.bm25_tf().sum(axis=0) * coverage * (1 + LENGTH_BONUS * (self.ngram - 1))
+
+
+def _ranked(index: KeywordIndex, scores: np.ndarray, in_product: np.ndarray, mask: np.ndarray,
+            limit: int) -> List[Dict[str, Any]]:
+    frequency = index.document_frequency()
+    order = [position for position in np.argsort(-scores, kind="stable") if mask[position]]
+    selected: List[int] = []
+    for position in order:
+        phrase = index.phrases[position]
+        # A phrase inside an already ranked phrase used by just as many listings adds nothing
+        if any(f" {phrase} " in f" {index.phrases[chosen]} " and frequency[chosen] >= frequency[position]
+               for chosen in selected):
+            continue
+        selected.append(position)
+        if len(selected) >= limit:
+            break
+    return [{"phrase": str(index.phrases[position]), "score": round(float(scores[position]), 3),
+             "listings": int(frequency[position]), "in_product": bool(in_product[position])}
+            for position in selected]
+
+
+def keyword_table(product: Dict[str, Any], competitors: Optional[List[Dict[str, Any]]] = None,
+                  limit: int = KEYWORD_LIMIT) -> Dict[str, Any]:
+    """
+    Rank the short- and long-tail phrases of a product and its competitors' listings.
+    The product is the first listing; `listings` counts how many listings use a phrase.
+    """
+    texts = [listing_text(product)] + [listing_text(competitor) for competitor in competitors or []]
+    index = KeywordIndex(texts)
+    if not len(index):
+        return {"listings": len(texts), "short_tail": [], "long_tail": []}
+    scores = index.scores()
+    in_product = index.counts[0] > 0
+    return {
+        "listings": len(texts),
+        "short_tail": _ranked(index, scores, in_product, index.ngram < LONG_TAIL, limit),
+        "long_tail": _ranked(index, scores, in_product, index.ngram >= LONG_TAIL, limit),
+    }
+
+
+def format_keyword_table(table: Dict[str, Any]) -> str:
+    """The keyword table as compact text for a prompt."""
+    lines = [f"Computed from {table['listings']} listing(s). Columns: phrase | score | listings using it | in this product"]
+    for section, title in (("short_tail", "Short-tail keywords"), ("long_tail", "Long-tail keywords")):
+        lines.append(f"{title}:")
+        lines.extend(f"- {row['phrase']} | {row['score']} | {row['listings']} | {'yes' if row['in_product'] else 'no'}"
+                     for row in table[section])
+    return "\n".join(lines)
@@ -0,0 +1,512 @@
+"""
+Approximate-nearest-neighbour index of listings already scraped or generated.
+
+    python -m src.ListingCrew.tools.listing_index --from-db
+
+backfills the index from the TitleDescription table; generations add their product and
+competitors as they run.
+"""
+import io
+import os
+import json
+import base64
+import heapq
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+from contextlib import nullcontext
+from filelock import FileLock
+from typing import Optional, Dict, Any, Iterable, List, Sequence, Set, Tuple
+try:
+    from .embeddings import EMBEDDER, normalize
+    from .keywords import listing_text
+    from .web_scraper import BASE_URL, product_key
+    from ..singletons import process_wide
+except ImportError:
+    from embeddings import EMBEDDER, normalize
+    from keywords import listing_text
+    from web_scraper import BASE_URL, product_key
+    from singletons import process_wide
+
+# Set LISTING_INDEX_PATH to an empty string to keep the index in memory
+INDEX_PATH = os.environ.get("LISTING_INDEX_PATH", os.path.join("output", "cache", "listing_index.npz"))
+INDEX_EMBEDDER = os.environ.get("LISTING_INDEX_EMBEDDER", EMBEDDER)
+# HNSW graph parameters: links per node (twice as many on the bottom layer) and candidate list sizes
+HNSW_M = int(os.environ.get("LISTING_INDEX_M", 16))
+EF_CONSTRUCTION = int(os.environ.get("LISTING_INDEX_EF_CONSTRUCTION", 100))
+EF_SEARCH = int(os.environ.get("LISTING_INDEX_EF_SEARCH", 64))
+# Replaced listings stay in the graph as tombstones; it is rebuilt once they exceed this share of its nodes
+COMPACT_RATIO = float(os.environ.get("LISTING_INDEX_COMPACT_RATIO", 0.25))
+# Inserts are appended to a journal next to the index file, which is rewritten once it holds this many
+CHECKPOINT_EVERY = int(os.environ.get("LISTING_INDEX_CHECKPOINT_EVERY", 500))
+# How many similar listings the researcher gets, and how similar (cosine) they must be
+SIMILAR_LIMIT = int(os.environ.get("LISTING_INDEX_K", 5))
+SIMILARITY_THRESHOLD = float(os.environ.get("LISTING_INDEX_THRESHOLD", 0.5))
+HIGHLIGHTS = 3
+
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small world graph over unit vectors (cosine distance), in numpy.
+    Each node gets a random top layer; a search descends greedily through the sparse upper
+    layers and runs a best-first search with `ef` candidates on the bottom one. Nodes are only
+    ever added: removed nodes stay in the graph for navigation and are filtered from results.
+    """
+
+    def __init__(self, dim: int, m: int = HNSW_M, ef_construction: int = EF_CONSTRUCTION, seed: int = 0):
+        if m < 2:
+            raise ValueError("m must be at least 2")
+        self.dim = dim
+        self.m = m
+        self.ef_construction = ef_construction
+        self.level_mult = 1 / np.log(m)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.levels: List[int] = []
+        self.links: List[List[List[int]]] = []
+        self.deleted: Set[int] = set()
+        self.entry: Optional[int] = None
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def _distances(self, nodes: Sequence[int], vector: np.ndarray) -> np.ndarray:
+        return 1.0 - self.vectors[list(nodes)] @ vector
+
+    def _search_layer(self, vector: np.ndarray, entries: List[int], ef: int, level: int) -> List[Tuple[float, int]]:
+        """The `ef` nodes of a layer closest to the vector, nearest first, as (distance, node)."""
+        visited = set(entries)
+        distances = self._distances(entries, vector)
+        candidates = [(float(distance), node) for distance, node in zip(distances, entries)]
+        heapq.heapify(candidates)
+        # Max-heap of the best `ef` found so far
+        found = [(-distance, node) for distance, node in candidates]
+        heapq.heapify(found)
+        while len(found) > ef:
+            heapq.heappop(found)
+        while candidates:
+            distance, node = heapq.heappop(candidates)
+            if distance > -found[0][0] and len(found) >= ef:
+                break
+            neighbours = [neighbour for neighbour in self.links[node][level] if neighbour not in visited]
+            if not neighbours:
+                continue
+            visited.update(neighbours)
+            for neighbour, neighbour_distance in zip(neighbours, self._distances(neighbours, vector)):
+                neighbour_distance = float(neighbour_distance)
+                if len(found) < ef or neighbour_distance < -found[0][0]:
+                    heapq.heappush(candidates, (neighbour_distance, neighbour))
+                    heapq.heappush(found, (-neighbour_distance, neighbour))
+                    if len(found) > ef:
+                        heapq.heappop(found)
+        return sorted((-distance, node) for distance, node in found)
+
+    def _select(self, candidates: List[Tuple[float, int]], limit: int) -> List[int]:
+        """
+        Neighbours for a node from candidates sorted by distance: a candidate closer to an
+        already selected neighbour than to the node is skipped while there are others, so
+        links reach out in different directions instead of into one cluster.
+        """
+        selected: List[int] = []
+        skipped: List[int] = []
+        for distance, candidate in candidates:
+            if len(selected) >= limit:
+                break
+            if selected and np.any(self._distances(selected, self.vectors[candidate]) < distance):
+                skipped.append(candidate)
+            else:
+                selected.append(candidate)
+        return selected + skipped[:limit - len(selected)]
+
+    def _descend(self, vector: np.ndarray, to_level: int) -> List[int]:
+        entry = [self.entry]
+        for level in range(self.levels[self.entry], to_level, -1):
+            entry = [self._search_layer(vector, entry, 1, level)[0][1]]
+        return entry
+
+    def add(self, vector: np.ndarray) -> int:
+        """Insert a unit vector and return its node id."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        node = len(self.levels)
+        if node == len(self.vectors):
+            grown = np.zeros((max(16, 2 * node), self.dim), dtype=np.float32)
+            grown[:node] = self.vectors[:node]
+            self.vectors = grown
+        self.vectors[node] = vector
+        level = int(-np.log(1.0 - self._rng.random()) * self.level_mult)
+        self.levels.append(level)
+        self.links.append([[] for _ in range(level + 1)])
+        if self.entry is None:
+            self.entry = node
+            return node
+
+        top = self.levels[self.entry]
+        entries = self._descend(vector, level)
+        for layer in range(min(level, top), -1, -1):
+            candidates = self._search_layer(vector, entries, self.ef_construction, layer)
+            limit = 2 * self.m if layer == 0 else self.m
+            self.links[node][layer] = self._select(candidates, self.m)
+            for neighbour in self.links[node][layer]:
+                links = self.links[neighbour][layer]
+                links.append(node)
+                if len(links) > limit:
+                    distances = self._distances(links, self.vectors[neighbour])
+                    ranked = sorted(zip(distances.tolist(), links))
+                    self.links[neighbour][layer] = self._select(ranked, limit)
+            entries = [candidate for _, candidate in candidates]
+        if level > top:
+            self.entry = node
+        return node
+
+    def search(self, vector: np.ndarray, k: int, ef: int = EF_SEARCH) -> List[Tuple[float, int]]:
+        """The k live nodes nearest to the vector, as (cosine similarity, node)."""
+        if self.entry is None or k < 1:
+            return []
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        found = self._search_layer(vector, self._descend(vector, 0), max(ef, k + len(self.deleted)), 0)
+        return [(1.0 - distance, node) for distance, node in found if node not in self.deleted][:k]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """The graph as flat arrays for np.savez; links are stored per (node, layer) in order."""
+        counts = [len(layer) for links in self.links for layer in links]
+        flat = [neighbour for links in self.links for layer in links for neighbour in layer]
+        return {
+            "vectors": self.vectors[:len(self)],
+            "levels": np.asarray(self.levels, dtype=np.int32),
+            "link_counts": np.asarray(counts, dtype=np.int32),
+            "links": np.asarray(flat, dtype=np.int32),
+            "deleted": np.asarray(sorted(self.deleted), dtype=np.int32),
+            "graph": np.asarray([self.m, self.ef_construction, -1 if self.entry is None else self.entry]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "HNSWIndex":
+        m, ef_construction, entry = (int(value) for value in arrays["graph"])
+        vectors = arrays["vectors"]
+        index = cls(vectors.shape[1], m=m, ef_construction=ef_construction, seed=len(vectors))
+        index.vectors = np.array(vectors, dtype=np.float32)
+        index.levels = arrays["levels"].tolist()
+        flat = arrays["links"].tolist()
+        position = 0
+        counts = iter(arrays["link_counts"].tolist())
+        for level in index.levels:
+            layers = []
+            for _ in range(level + 1):
+                count = next(counts)
+                layers.append(flat[position:position + count])
+                position += count
+            index.links.append(layers)
+        index.deleted = set(arrays["deleted"].tolist())
+        index.entry = None if entry < 0 else entry
+        return index
+
+
+def listing_summary(listing: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A scraped product, competitor summary or TitleDescription row in the shape of a
+    research competitor summary: url, title, category and a few highlights.
+    """
+    if "ASIN" in listing:
+        listing = {"url": f"{BASE_URL}/dp/{listing['ASIN']}", "title": listing.get("Title"),
+                   "category": listing.get("Category"), "description": listing.get("Description")}
+    highlights = listing.get("highlights") or listing.get("description") or []
+    if isinstance(highlights, str):
+        highlights = highlights.splitlines()
+    return {
+        "url": listing.get("url"),
+        "title": listing.get("title"),
+        "category": listing.get("category"),
+        "highlights": [line.strip() for line in highlights if line and line.strip()][:HIGHLIGHTS],
+    }
+
+
+class ListingIndex:
+    """
+    Embedded listings keyed by product (ASIN, or URL), searchable by similarity in milliseconds.
+    A product added again with unchanged text is not embedded again; changed text replaces its
+    old entry. On disk the index is a snapshot at `path` plus an append-only journal of the inserts
+    made since; each batch of inserts only appends to the journal, under a file lock and after
+    reading what other processes appended, so no process loses another's inserts. The snapshot is
+    rewritten (and the journal emptied) every `checkpoint_every` journal entries, and when the graph
+    is rebuilt without tombstones once they pass `compact_ratio` of its nodes.
+    """
+
+    def __init__(self, path: Optional[str] = INDEX_PATH, embedder: Optional[Any] = None,
+                 model: Optional[str] = None, m: int = HNSW_M, ef_construction: int = EF_CONSTRUCTION,
+                 ef_search: int = EF_SEARCH, compact_ratio: float = COMPACT_RATIO,
+                 checkpoint_every: int = CHECKPOINT_EVERY):
+        if embedder is None:
+            try:
+                from .search_store import default_embedder
+            except ImportError:
+                from search_store import default_embedder
+            embedder, default_model = default_embedder(INDEX_EMBEDDER)
+            model = model or default_model
+        self.path = path
+        self.embedder = embedder
+        self.model = model or "default"
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.compact_ratio = compact_ratio
+        self.checkpoint_every = checkpoint_every
+        self.journal_path = f"{path}.journal" if path else None
+        self.graph: Optional[HNSWIndex] = None
+        self.keys: List[str] = []
+        self.records: List[Dict[str, Any]] = []
+        self.hashes: List[str] = []
+        self._nodes: Dict[str, int] = {}
+        self._counters = {"inserted": 0, "unchanged": 0, "replaced": 0, "searches": 0, "reloads": 0,
+                          "compactions": 0, "checkpoints": 0}
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(f"{path}.lock") if path else None
+        # (mtime, size) of the snapshot as last read or written; anything else was saved by another process
+        self._stamp: Optional[Tuple[int, int]] = None
+        # How far this process has read the journal, in bytes and in entries
+        self._journal_offset = 0
+        self._journaled = 0
+        if path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """Pick up what other processes saved since this one last read or wrote the index."""
+        if self._file_stamp() != self._stamp:
+            # Another process rewrote the snapshot, and emptied the journal this one was following
+            self._load()
+            self._counters["reloads"] += 1
+        elif self._read_journal():
+            self._counters["reloads"] += 1
+
+    def _load(self) -> None:
+        """Replace the in-memory index with the snapshot and everything journaled after it."""
+        self.graph, self.keys, self.records, self.hashes, self._nodes = None, [], [], [], {}
+        self._journal_offset = self._journaled = 0
+        self._stamp = self._file_stamp()
+        if self._stamp is not None:
+            try:
+                with np.load(self.path, allow_pickle=False) as arrays:
+                    meta = json.loads(str(arrays["meta"]))
+                    graph = HNSWIndex.from_arrays(dict(arrays)) if meta["model"] == self.model else None
+            except (OSError, KeyError, ValueError) as e:
+                logging.warning(f"Could not read listing index {self.path}: {e}; starting a new index")
+                meta, graph = None, None
+            if meta is not None and graph is None:
+                logging.warning(f"Listing index {self.path} was embedded with {meta['model']}, "
+                                f"not {self.model}; starting a new index")
+            if graph is not None:
+                self.graph = graph
+                self.keys, self.records, self.hashes = meta["keys"], meta["records"], meta["hashes"]
+                self._nodes = {key: node for node, key in enumerate(self.keys) if node not in graph.deleted}
+        self._read_journal()
+        if self._nodes:
+            logging.info(f"Loaded listing index {self.path}: {len(self)} listings")
+
+    def _read_journal(self) -> int:
+        """Apply the journal entries appended since this process last read it; returns how many."""
+        try:
+            with open(self.journal_path, "rb") as file:
+                file.seek(self._journal_offset)
+                data = file.read()
+        except (OSError, TypeError):
+            return 0
+        # A line without its newline is still being written (or was cut short by a crash)
+        complete = data[:data.rfind(b"\n") + 1]
+        lines = complete.splitlines()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+                vector = np.frombuffer(base64.b64decode(entry["vector"]), dtype=np.float32)
+            except (KeyError, ValueError) as e:
+                logging.warning(f"Skipping unreadable listing index journal entry: {e}")
+                continue
+            if entry.get("model") == self.model:
+                self._insert(entry["key"], entry["record"], entry["hash"], vector)
+        self._journal_offset += len(complete)
+        self._journaled += len(lines)
+        return len(lines)
+
+    def _append_journal(self, entries: List[Dict[str, Any]]) -> None:
+        """Append entries to the journal; the caller holds the file lock and has read it to the end."""
+        data = b"".join(json.dumps(entry).encode("utf-8") + b"\n" for entry in entries)
+        with open(self.journal_path, "ab") as file:
+            # Drop the partial line a crashed writer may have left, so it cannot swallow these entries
+            file.truncate(self._journal_offset)
+            file.write(data)
+        self._journal_offset += len(data)
+        self._journaled += len(entries)
+
+    def save(self) -> None:
+        """Write the whole index as a new snapshot and empty the journal; other processes only ever see complete files."""
+        if not self.path or self.graph is None:
+            return
+        with self._lock, self._file_lock or nullcontext():
+            meta = {"model": self.model, "keys": self.keys, "records": self.records, "hashes": self.hashes}
+            buffer = io.BytesIO()
+            np.savez(buffer, meta=np.asarray(json.dumps(meta)), **self.graph.to_arrays())
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as file:
+                file.write(buffer.getvalue())
+            os.replace(temporary, self.path)
+            # A crash before this truncation only replays entries the snapshot already has, which are skipped
+            open(self.journal_path, "wb").close()
+            self._stamp = self._file_stamp()
+            self._journal_offset = self._journaled = 0
+            self._counters["checkpoints"] += 1
+
+    def compact(self) -> None:
+        """Rebuild the graph from its live nodes, dropping the tombstones of replaced listings."""
+        with self._lock:
+            if self.graph is None or not self.graph.deleted:
+                return
+            live = [node for node in range(len(self.graph)) if node not in self.graph.deleted]
+            graph = HNSWIndex(self.graph.dim, m=self.m, ef_construction=self.ef_construction)
+            for node in live:
+                graph.add(self.graph.vectors[node])
+            self.keys = [self.keys[node] for node in live]
+            self.records = [self.records[node] for node in live]
+            self.hashes = [self.hashes[node] for node in live]
+            self._nodes = {key: node for node, key in enumerate(self.keys)}
+            self.graph = graph
+            self._counters["compactions"] += 1
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return normalize(np.asarray(self.embedder(texts), dtype=np.float32))
+
+    def _insert(self, key: str, record: Dict[str, Any], digest: str, vector: np.ndarray) -> Optional[str]:
+        """Put one embedded listing in the graph; returns "inserted" or "replaced", or None if it is already there."""
+        if key in self._nodes and self.hashes[self._nodes[key]] == digest:
+            return None
+        if self.graph is None:
+            self.graph = HNSWIndex(len(vector), m=self.m, ef_construction=self.ef_construction)
+        replaced = key in self._nodes
+        if replaced:
+            self.graph.deleted.add(self._nodes[key])
+        self._nodes[key] = self.graph.add(vector)
+        self.keys.append(key)
+        self.records.append(record)
+        self.hashes.append(digest)
+        return "replaced" if replaced else "inserted"
+
+    def add(self, listings: Iterable[Dict[str, Any]]) -> int:
+        """Index listings (see listing_summary for the accepted shapes); returns how many were embedded."""
+        pending: Dict[str, Tuple[Dict[str, Any], str, str]] = {}
+        for listing in listings:
+            record = listing_summary(listing)
+            if not record["url"] or not record["title"]:
+                continue
+            text = listing_text(record)
+            pending[product_key(record["url"])] = (record, text, hashlib.sha256(text.encode("utf-8")).hexdigest())
+        with self._lock:
+            for key in [key for key, (_, _, digest) in pending.items()
+                        if key in self._nodes and self.hashes[self._nodes[key]] == digest]:
+                del pending[key]
+                self._counters["unchanged"] += 1
+        if not pending:
+            return 0
+
+        vectors = self._embed([text for _, text, _ in pending.values()])
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock, self._file_lock or nullcontext():
+            # Insert on top of what other processes saved meanwhile, so their listings are kept
+            if self.path:
+                self._refresh()
+            journal = []
+            for (key, (record, _, digest)), vector in zip(pending.items(), vectors):
+                outcome = self._insert(key, record, digest, vector)
+                if outcome is None:
+                    # Another process indexed the same text first
+                    self._counters["unchanged"] += 1
+                    continue
+                if outcome == "replaced":
+                    self._counters["replaced"] += 1
+                self._counters["inserted"] += 1
+                journal.append({"model": self.model, "key": key, "record": record, "hash": digest,
+                                "vector": base64.b64encode(vector.astype(np.float32).tobytes()).decode("ascii")})
+            compacted = len(self.graph.deleted) > self.compact_ratio * len(self.graph)
+            if compacted:
+                self.compact()
+            if self.path and journal:
+                # Node ids change when the graph is rebuilt, so a compacted index needs a new snapshot
+                if compacted or self._journaled + len(journal) >= self.checkpoint_every:
+                    self.save()
+                else:
+                    self._append_journal(journal)
+        return len(pending)
+
+    def similar(self, listing: Dict[str, Any], k: int = SIMILAR_LIMIT, threshold: float = SIMILARITY_THRESHOLD,
+                exclude: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Up to k indexed listings most similar to a listing, with their cosine similarity."""
+        excluded = set(exclude)
+        record = listing_summary(listing)
+        if record["url"]:
+            excluded.add(product_key(record["url"]))
+        with self._lock:
+            if self.path:
+                self._refresh()
+            if self.graph is None or not self._nodes:
+                return []
+        vector = self._embed([listing_text(record)])[0]
+        with self._lock:
+            self._counters["searches"] += 1
+            found = self.graph.search(vector, k + len(excluded), ef=self.ef_search)
+            matches = [dict(self.records[node], similarity=round(similarity, 3))
+                       for similarity, node in found
+                       if similarity >= threshold and self.keys[node] not in excluded]
+        return matches[:k]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._counters, listings=len(self), nodes=len(self.graph) if self.graph else 0)
+
+
+@process_wide
+def get_listing_index() -> ListingIndex:
+    """Return the process-wide listing index, loaded from disk on first use."""
+    return ListingIndex()
+
+
+def database_rows(batch_size: int = 500) -> Iterable[Dict[str, Any]]:
+    """Every TitleDescription row, read through the backend's DBConnection."""
+    from backend.db_connection import DBConnection
+    db = DBConnection()
+    try:
+        yield from db.iter_data(batch_size)
+    finally:
+        db.close_connection()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from-db", action="store_true", help="index every listing in the TitleDescription table")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    index = get_listing_index()
+    if args.from_db:
+        batch: List[Dict[str, Any]] = []
+        for row in database_rows(args.batch_size):
+            batch.append(row)
+            if len(batch) >= args.batch_size:
+                index.add(batch)
+                batch = []
+        index.add(batch)
+    print(json.dumps(index.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import os
+import hashlib
+import logging
+import threading
+import numpy as np
+from typing import Optional, Dict, Any, Callable, Iterable, List, Sequence, Set, Tuple
+from crewai_tools import WebsiteSearchTool
+from crewai_tools.rag.data_types import DataType
+from crewai_tools.rag.source_content import SourceContent
+from crewai_tools.security.safe_path import validate_url
+from crewai_tools.tools.rag.rag_tool import Adapter
+from pydantic import PrivateAttr
+try:
+    from .disk_cache import DiskCache
+    from .embeddings import EMBEDDER, EMBEDDERS, VECTOR_DTYPE, encode_vectors, decode_vectors, get_local_embedder
+    from ..singletons import process_wide
+except ImportError:
+    from disk_cache import DiskCache
+    from embeddings import EMBEDDER, EMBEDDERS, VECTOR_DTYPE, encode_vectors, decode_vectors, get_local_embedder
+    from singletons import process_wide
+
+# One search store per deployment; set SEARCH_STORE_PATH to an empty string to keep it in memory
+STORE_PATH = os.environ.get("SEARCH_STORE_PATH", os.path.join("output", "cache", "search.sqlite3"))
+STORE_TTL = float(os.environ.get("SEARCH_STORE_TTL", 7 * 24 * 60 * 60))
+STORE_MAX_BYTES = int(os.environ.get("SEARCH_STORE_MAX_BYTES", 256 * 1024 * 1024))
+# Expired entries are purged and the file compacted after this many writes
+COMPACT_EVERY = int(os.environ.get("SEARCH_STORE_COMPACT_EVERY", 500))
+# OpenAI model used when SEARCH_EMBEDDER is "openai", the same default the crewai_tools RAG tools embed with
+EMBEDDING_MODEL = os.environ.get("SEARCH_EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Receives a batch of texts and returns one vector per text
+Embedder = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def openai_embedder(model: str = EMBEDDING_MODEL) -> Embedder:
+    """The OpenAI embedding function WebsiteSearchTool uses by default, created on first use."""
+    function = None
+
+    def embed(texts: List[str]) -> Sequence[Sequence[float]]:
+        nonlocal function
+        if function is None:
+            from chromadb.utils.embedding_functions.openai_embedding_function import OpenAIEmbeddingFunction
+            function = OpenAIEmbeddingFunction(api_key=os.getenv("OPENAI_API_KEY"), model_name=model,
+                                               api_key_env_var="OPENAI_API_KEY")
+        return function(texts)
+    return embed
+
+
+class SearchStore:
+    """
+    Size-bounded store of embedded web pages, shared by every search tool in the deployment.
+    Pages are embedded once per (content hash, embedding model): a page fetched again with
+    unchanged content reuses its vectors. Entries expire after the TTL, the least recently used
+    are evicted beyond the size cap, and the file is compacted every `compact_every` writes.
+    """
+
+    def __init__(self, path: Optional[str] = STORE_PATH, ttl: Optional[float] = STORE_TTL,
+                 max_bytes: Optional[int] = STORE_MAX_BYTES, compact_every: int = COMPACT_EVERY,
+                 dtype: str = VECTOR_DTYPE):
+        self.disk = DiskCache(path, ttl=ttl, max_bytes=max_bytes) if path else None
+        self.compact_every = compact_every
+        self.dtype = dtype
+        self._memory: Dict[str, Tuple[bytes, Dict[str, Any]]] = {}
+        self._writes = 0
+        self._counters = {"pages_embedded": 0, "pages_reused": 0, "chunks_embedded": 0,
+                          "queries_embedded": 0, "queries_reused": 0, "compactions": 0}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        if self.disk is None:
+            with self._lock:
+                return self._memory.get(key)
+        entry = self.disk.get_entry(key)
+        return (entry.value, entry.meta) if entry and entry.fresh else None
+
+    def _set(self, key: str, value: bytes, meta: Dict[str, Any]) -> None:
+        if self.disk is None:
+            with self._lock:
+                self._memory[key] = (value, meta)
+            return
+        self.disk.set(key, value, meta=meta)
+        with self._lock:
+            self._writes += 1
+            compact = self.compact_every > 0 and self._writes % self.compact_every == 0
+        if compact:
+            self.compact()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += amount
+
+    def compact(self) -> None:
+        """Drop expired entries and give the freed space back to the filesystem."""
+        if self.disk is None:
+            return
+        removed = self.disk.purge_expired()
+        self.disk.vacuum()
+        self._count("compactions")
+        logging.info(f"Compacted search store: {removed} expired entries removed")
+
+    def add_page(self, source: str, chunks: List[str], page_hash: str, model: str, embed: Embedder) -> None:
+        """Index a page's chunks under its source URL, embedding them only if this content is new."""
+        page_key = f"page:{model}:{page_hash}"
+        if self._get(page_key) is not None:
+            self._count("pages_reused")
+        else:
+            vectors = np.asarray(embed(chunks), dtype=np.float32) if chunks else np.zeros((0, 0), np.float32)
+            value, meta = encode_vectors(vectors, self.dtype)
+            self._set(page_key, value, dict(meta, chunks=chunks))
+            self._count("pages_embedded")
+            self._count("chunks_embedded", len(chunks))
+        self._set(f"source:{model}:{source}", b"", {"page": page_key})
+
+    def page(self, source: str, model: str) -> Optional[Tuple[List[str], np.ndarray]]:
+        """The chunks and vectors currently indexed for a source URL."""
+        mapping = self._get(f"source:{model}:{source}")
+        page = self._get(mapping[1]["page"]) if mapping else None
+        if page is None:
+            return None
+        value, meta = page
+        return meta["chunks"], decode_vectors(value, meta)
+
+    def query_vector(self, text: str, model: str, embed: Embedder) -> np.ndarray:
+        """Embedding of a search query; repeated queries are not embedded again."""
+        key = f"query:{model}:{content_hash(text)}"
+        cached = self._get(key)
+        # Entries written before query vectors were encoded like page vectors have no shape; embed those again
+        if cached is not None and "shape" in cached[1]:
+            self._count("queries_reused")
+            return decode_vectors(*cached)[0]
+        value, meta = encode_vectors(np.asarray([embed([text])[0]], dtype=np.float32), self.dtype)
+        self._set(key, value, meta)
+        self._count("queries_embedded")
+        return decode_vectors(value, meta)[0]
+
+    def search(self, query: np.ndarray, sources: Iterable[str], model: str, limit: int,
+               threshold: float) -> List[Tuple[float, str]]:
+        """The `limit` chunks of the given sources most similar to the query, as (cosine similarity, text)."""
+        query = query / (np.linalg.norm(query) or 1.0)
+        scored: List[Tuple[float, str]] = []
+        for source in sources:
+            page = self.page(source, model)
+            if page is None or not page[0]:
+                continue
+            chunks, vectors = page
+            norms = np.linalg.norm(vectors, axis=1)
+            norms[norms == 0] = 1.0
+            similarities = vectors @ query / norms
+            scored.extend((float(score), chunks[index]) for index, score in enumerate(similarities)
+                          if score >= threshold)
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:limit]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+        if self.disk is not None:
+            stats.update(entries=len(self.disk), bytes=self.disk.size())
+        return stats
+
+
+class CachedSearchAdapter(Adapter):
+    """
+    crewai_tools RAG adapter backed by the shared SearchStore instead of a per-tool Chroma collection.
+    The store is shared; the set of pages this adapter indexed is not, so build one per crew.
+    """
+
+    store: Any
+    embedder: Any
+    model: str = EMBEDDING_MODEL
+    similarity_threshold: float = 0.6
+    limit: int = 5
+    _sources: Set[str] = PrivateAttr(default_factory=set)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    def add(self, *args: Any, **kwargs: Any) -> None:
+        """Fetch, chunk and index web pages."""
+        data_type = DataType.WEBSITE
+        loader, chunker = data_type.get_loader(), data_type.get_chunker()
+        for arg in args:
+            source = str(arg.get("source", arg.get("content", ""))) if isinstance(arg, dict) else str(arg)
+            result = loader.load(SourceContent(source))
+            self.store.add_page(source, chunker.chunk(result.content), content_hash(result.content),
+                                self.model, self.embedder)
+            with self._lock:
+                self._sources.add(source)
+
+    def query(self, question: str, similarity_threshold: Optional[float] = None, limit: Optional[int] = None,
+              sources: Optional[List[str]] = None) -> str:
+        """Search the given sources, or every page this tool has indexed."""
+        if sources is None:
+            with self._lock:
+                sources = sorted(self._sources)
+        vector = self.store.query_vector(question, self.model, self.embedder)
+        results = self.store.search(
+            vector, sources, self.model,
+            limit if limit is not None else self.limit,
+            similarity_threshold if similarity_threshold is not None else self.similarity_threshold,
+        )
+        if not results:
+            return "No relevant content found."
+        return "\n\n".join(text for _, text in results)
+
+
+class CachedWebsiteSearchTool(WebsiteSearchTool):
+    """WebsiteSearchTool over the shared search store; a search only looks at the website it names."""
+
+    def _run(self, search_query: str, website: Optional[str] = None,  # type: ignore[override]
+             similarity_threshold: Optional[float] = None, limit: Optional[int] = None) -> str:
+        sources = None
+        if website is not None:
+            website = validate_url(website)
+            self.add(website)
+            sources = [website]
+        threshold = similarity_threshold if similarity_threshold is not None else self.similarity_threshold
+        result = self.adapter.query(search_query, similarity_threshold=threshold,
+                                    limit=limit if limit is not None else self.limit, sources=sources)
+        return f"Relevant Content:\n{result}"
+
+
+def default_embedder(kind: str = EMBEDDER) -> Tuple[Embedder, str]:
+    """The configured embedder and the model name its vectors are cached under."""
+    if kind not in EMBEDDERS:
+        raise ValueError(f"Unknown embedder: {kind}")
+    if kind == "local":
+        embedder = get_local_embedder()
+        return embedder, embedder.name
+    return openai_embedder(EMBEDDING_MODEL), EMBEDDING_MODEL
+
+
+def search_tool_factory(store: Optional[SearchStore] = None, embedder: Optional[Embedder] = None,
+                        model: Optional[str] = None) -> Callable[[], WebsiteSearchTool]:
+    """
+    Resolve the store and embedder once and return a builder of WebsiteSearchTools over them.
+    Each tool only searches the pages it indexed itself, so crews must not share one.
+    """
+    if embedder is None:
+        embedder, default_model = default_embedder()
+        model = model or default_model
+    store = store or get_search_store()
+    model = model or EMBEDDING_MODEL
+
+    def build() -> WebsiteSearchTool:
+        return CachedWebsiteSearchTool(adapter=CachedSearchAdapter(store=store, embedder=embedder, model=model))
+    return build
+
+
+def website_search_tool(store: Optional[SearchStore] = None, embedder: Optional[Embedder] = None,
+                        model: Optional[str] = None) -> WebsiteSearchTool:
+    """A WebsiteSearchTool that embeds through the shared store and its caches (SEARCH_EMBEDDER by default)."""
+    return search_tool_factory(store, embedder, model)()
+
+
+@process_wide
+def get_search_store() -> SearchStore:
+    """Return the process-wide search store."""
+    return SearchStore()
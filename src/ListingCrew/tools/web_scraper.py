@@ -1,17 +1,188 @@
+import os
 import re
+import codecs
 import logging
+import contextvars
+import threading
 import requests
-from bs4 import BeautifulSoup
-from typing import Optional, Dict, Any
+from bs4 import BeautifulSoup, SoupStrainer
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from html.parser import HTMLParser
+from requests.adapters import HTTPAdapter
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
 from urllib.parse import urlparse, urlunparse
+try:
+    from .disk_cache import DiskCache
+    from .http_scheduler import HostScheduler
+    from ..deadlines import check_deadline
+    from ..singletons import process_wide
+except ImportError:
+    from disk_cache import DiskCache
+    from http_scheduler import HostScheduler
+    from deadlines import check_deadline
+    from singletons import process_wide
+
+# Connection pool sizing for the shared keep-alive session
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 32
+
+# Origin that product pages are fetched from; point it at a fixture server for offline runs and benchmarks
+BASE_URL = os.environ.get("SCRAPER_BASE_URL", "https://www.amazon.com")
+
+# Sections of an Amazon detail page that the extractors read
+TARGET_IDS = frozenset({"productTitle", "feature-bullets", "productDescription"})
+CATEGORY_CLASS = "a-link-normal a-color-tertiary"
+
+# Page cache keyed by ASIN; set SCRAPER_CACHE_PATH to an empty string to disable it
+CACHE_PATH = os.environ.get("SCRAPER_CACHE_PATH", os.path.join("output", "cache", "pages.sqlite3"))
+CACHE_TTL = float(os.environ.get("SCRAPER_CACHE_TTL", 24 * 60 * 60))
+CACHE_MAX_BYTES = int(os.environ.get("SCRAPER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Streaming download: stop once every target section has been read or the byte budget is spent
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_MAX_BYTES = int(os.environ.get("SCRAPER_MAX_BYTES", 3 * 1024 * 1024))
+
+# Outbound request scheduling shared by every scraper in the process
+RATE_PER_HOST = float(os.environ.get("SCRAPER_RATE_PER_HOST", 2.0))
+BURST_PER_HOST = int(os.environ.get("SCRAPER_BURST_PER_HOST", 10))
+MAX_RETRIES = int(os.environ.get("SCRAPER_MAX_RETRIES", 3))
+
+
+@process_wide
+def get_session() -> requests.Session:
+    """Return the process-wide keep-alive session shared by all scrapers."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@process_wide
+def get_scheduler() -> HostScheduler:
+    """Return the process-wide rate limiter and retry scheduler for outbound requests."""
+    return HostScheduler(get_session(), rate=RATE_PER_HOST, burst=BURST_PER_HOST, max_retries=MAX_RETRIES)
+
+
+@process_wide
+def get_page_cache() -> Optional[DiskCache]:
+    """Return the process-wide page cache, or None when caching is disabled."""
+    return DiskCache(CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES) if CACHE_PATH else None
+
+
+class _HostLimiter:
+    """Bound the number of in-flight requests per host."""
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self._slots: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, url: str):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._slots.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with semaphore:
+            yield
+
+
+class _TargetStrainer(SoupStrainer):
+    """Only build tree nodes for the product sections the extractors read."""
+
+    def allow_tag_creation(self, nsprefix, name, attrs) -> bool:
+        attrs = attrs or {}
+        if attrs.get("id") in TARGET_IDS:
+            return True
+        return name == "a" and attrs.get("class") == CATEGORY_CLASS
+
+
+class _SectionTracker(HTMLParser):
+    """Incrementally watch a page download and report when every target section has closed."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.closed = set()
+        self.has_bullet_text = False
+        self._open = []  # [section, tag name, nesting depth of that tag]
+        self._in_li = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        for section in self._open:
+            if section[1] == tag:
+                section[2] += 1
+        if tag == "li" and self._inside("feature-bullets"):
+            self._in_li += 1
+        section = attrs.get("id") if attrs.get("id") in TARGET_IDS else None
+        if section is None and tag == "a" and attrs.get("class") == CATEGORY_CLASS:
+            section = "category"
+        if section and section not in self.closed and not self._inside(section):
+            self._open.append([section, tag, 1])
+
+    def handle_endtag(self, tag):
+        if tag == "li" and self._in_li:
+            self._in_li -= 1
+        for section in list(self._open):
+            if section[1] == tag:
+                section[2] -= 1
+                if section[2] == 0:
+                    self._open.remove(section)
+                    self.closed.add(section[0])
+
+    def handle_data(self, data):
+        if self._in_li and data.strip():
+            self.has_bullet_text = True
+
+    def _inside(self, name: str) -> bool:
+        return any(section[0] == name for section in self._open)
+
+    @property
+    def complete(self) -> bool:
+        """True once title, category and a usable description have all been seen."""
+        description_done = (("feature-bullets" in self.closed and self.has_bullet_text)
+                            or "productDescription" in self.closed)
+        return {"productTitle", "category"} <= self.closed and description_done
+
+
+def _build_soup(builder: str, strained: bool):
+    def build(content: bytes) -> BeautifulSoup:
+        return BeautifulSoup(content, builder, parse_only=_TargetStrainer() if strained else None)
+    return build
+
+
+def _lxml_available() -> bool:
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# Parser backends: "html.parser" builds the full tree, the others only keep the target sections
+PARSERS = {
+    "html.parser": _build_soup("html.parser", strained=False),
+    "strainer": _build_soup("html.parser", strained=True),
+    "lxml": _build_soup("lxml", strained=True),
+}
+DEFAULT_PARSER = os.environ.get("SCRAPER_PARSER") or ("lxml" if _lxml_available() else "strainer")
+
 
 class Scrape:
-    def __init__(self, url: str):
+    def __init__(self, url: str, parser: Optional[str] = None, use_cache: bool = True,
+                 stream: bool = True, max_bytes: int = STREAM_MAX_BYTES):
         self.url = self._validate_url(url)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         }
         self.timeout = 10
+        self.parser = parser or DEFAULT_PARSER
+        if self.parser not in PARSERS:
+            raise ValueError(f"Unknown parser '{self.parser}'. Choose one of: {', '.join(PARSERS)}")
+        self.cache = get_page_cache() if use_cache else None
+        self.stream = stream
+        self.max_bytes = max_bytes
 
     def _validate_url(self, url: str) -> str:
         """Validate and normalize URL."""
@@ -40,7 +211,8 @@ class Scrape:
         asin = self.get_asin()
         if not asin:
             raise ValueError("ASIN not found in the provided URL.")
-        return urlunparse(('https', 'www.amazon.com', f'/dp/{asin}', '', '', ''))
+        base = urlparse(BASE_URL)
+        return urlunparse((base.scheme, base.netloc, f'{base.path.rstrip("/")}/dp/{asin}', '', '', ''))
 
     def _extract_description(self, soup: BeautifulSoup) -> list:
         """Extract product description with multiple fallbacks."""
@@ -49,42 +221,101 @@ class Scrape:
         # Try feature bullets first
         feature_bullets = soup.find("div", id="feature-bullets")
         if feature_bullets:
-            description = [li.get_text(strip=True) for li in feature_bullets.find_all("li")
-                         if li.get_text(strip=True)]
+            description = [text for text in (li.get_text(strip=True) for li in feature_bullets.find_all("li"))
+                           if text]
             
         # Fallback to product description
         if not description:
             desc_div = soup.find("div", id="productDescription")
             if desc_div:
-                description = [p.get_text(strip=True) for p in desc_div.find_all("p")
-                             if p.get_text(strip=True)]
+                description = [text for text in (p.get_text(strip=True) for p in desc_div.find_all("p"))
+                               if text]
                 
         return description
 
-    def scrape(self) -> Optional[Dict[str, Any]]:
+    def _read_body(self, response: requests.Response) -> bytes:
+        """Read a streamed response until the target sections are complete or the budget is spent."""
+        tracker = _SectionTracker()
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        body = bytearray()
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                body.extend(chunk)
+                tracker.feed(decoder.decode(chunk))
+                if tracker.complete:
+                    logging.debug(f"All product sections read after {len(body)} bytes; closing connection")
+                    break
+                if len(body) >= self.max_bytes:
+                    logging.warning(f"Stopped reading page after the {self.max_bytes} byte budget")
+                    break
+        finally:
+            response.close()
+        return bytes(body)
+
+    def parse(self, content: bytes) -> Dict[str, Any]:
+        """Extract product data from a detail page with the configured parser backend."""
+        soup = PARSERS[self.parser](content)
+        title_tag = soup.find(id="productTitle")
+        category_tag = soup.find("a", class_=CATEGORY_CLASS)
+
+        return {
+            "title": title_tag.get_text(strip=True) if title_tag else None,
+            "description": self._extract_description(soup),
+            "category": category_tag.get_text(strip=True) if category_tag else None,
+            "color": None,
+            "size": None,
+            "count": None
+        }
+
+    def scrape(self, limiter: Optional[_HostLimiter] = None) -> Optional[Dict[str, Any]]:
         """Scrape product data from Amazon."""
         try:
             new_url = self.create_new_url()
-            response = requests.get(
-                new_url,
-                headers=self.headers,
-                timeout=self.timeout
-            )
+            asin = self.get_asin()
+            entry = self.cache.get_entry(asin) if self.cache is not None else None
+            if entry and entry.fresh and entry.meta.get("product"):
+                logging.info(f"Page cache hit for ASIN {asin}")
+                return entry.meta["product"]
+
+            headers = dict(self.headers)
+            if entry:
+                if entry.meta.get("etag"):
+                    headers["If-None-Match"] = entry.meta["etag"]
+                if entry.meta.get("last_modified"):
+                    headers["If-Modified-Since"] = entry.meta["last_modified"]
+
+            with limiter.slot(new_url) if limiter else nullcontext():
+                response = get_scheduler().get(
+                    new_url,
+                    headers=headers,
+                    timeout=self.timeout,
+                    stream=self.stream
+                )
+
+            if entry and response.status_code == 304:
+                logging.info(f"Page cache revalidated for ASIN {asin}")
+                response.close()
+                meta = dict(entry.meta)
+                meta["product"] = meta.get("product") or self.parse(entry.value)
+                self.cache.touch(asin, meta)
+                return meta["product"]
+
+            if self.stream and not response.ok:
+                response.close()
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            return {
-                "title": (soup.find(id="productTitle").get_text(strip=True)
-                         if soup.find(id="productTitle") else None),
-                "description": self._extract_description(soup),
-                "category": (soup.find("a", class_="a-link-normal a-color-tertiary").get_text(strip=True)
-                            if soup.find("a", class_="a-link-normal a-color-tertiary") else None),
-                "color": None,
-                "size": None,
-                "count": None
-            }
-            
+
+            content = self._read_body(response) if self.stream else response.content
+            product_data = self.parse(content)
+            if self.cache is not None and product_data["title"]:
+                # Only pages that parsed as a product are cached, never captcha or error pages
+                self.cache.set(asin, content, meta={
+                    "url": new_url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "product": product_data,
+                })
+            return product_data
+
         except requests.RequestException as e:
             logging.error(f"Request failed: {e}")
             return None
@@ -101,6 +332,59 @@ class Scrape:
         logging.error("Failed to scrape product data")
         return None
 
+    @classmethod
+    def scrape_many(cls, urls: Iterable[str], concurrency: int = 8,
+                    per_host: int = 4) -> List[Optional[Dict[str, Any]]]:
+        """Scrape several URLs concurrently and return the results in input order."""
+        urls = list(urls)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(urls)
+        for index, _, product_data in cls._scrape_concurrently(urls, concurrency, per_host):
+            results[index] = product_data
+        return results
+
+    @classmethod
+    def scrape_as_completed(cls, urls: Iterable[str], concurrency: int = 8,
+                            per_host: int = 4) -> Iterator[Tuple[str, Optional[Dict[str, Any]]]]:
+        """Scrape several URLs concurrently, yielding (url, result) as each one finishes."""
+        for _, url, product_data in cls._scrape_concurrently(list(urls), concurrency, per_host):
+            yield url, product_data
+
+    @classmethod
+    def _scrape_concurrently(cls, urls: List[str], concurrency: int,
+                             per_host: int) -> Iterator[Tuple[int, str, Optional[Dict[str, Any]]]]:
+        """
+        Run scrape() over a worker pool sharing one session and one per-host limiter.
+        Workers run in a copy of the caller's context, so a cancelled or expired generation
+        stops the URLs that have not started yet.
+        """
+        if concurrency < 1 or per_host < 1:
+            raise ValueError("concurrency and per_host must be at least 1")
+        limiter = _HostLimiter(per_host)
+
+        def scrape_one(url: str) -> Optional[Dict[str, Any]]:
+            check_deadline()
+            try:
+                return cls(url).scrape(limiter=limiter)
+            except ValueError as e:
+                logging.error(f"Skipping {url}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(contextvars.copy_context().run, scrape_one, url): index
+                       for index, url in enumerate(urls)}
+            for future in as_completed(futures):
+                index = futures[future]
+                yield index, urls[index], future.result()
+
+
+def product_key(url: str) -> str:
+    """Canonical key for a product: its ASIN when the URL has one, otherwise the URL itself."""
+    try:
+        asin = Scrape(url, use_cache=False).get_asin()
+    except ValueError:
+        asin = None
+    return asin or url.strip()
+
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)